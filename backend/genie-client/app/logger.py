@@ -5,12 +5,16 @@
 通过环境变量进行灵活配置。
 """
 
+import atexit
+import json
 import logging
 import os
+import queue
+import random
 import sys
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 
 
 class LogConfig:
@@ -19,7 +23,9 @@ class LogConfig:
     def __init__(self):
         # 基础配置
         self.name = os.getenv("LOGGER_NAME")
-        self.level = os.getenv("LOG_LEVEL", "debug").upper()
+        self.level = os.getenv("LOG_LEVEL", "info").upper()
+        # 按模块设置级别，格式如 client=WARNING,server=DEBUG
+        self.module_levels = self._parse_module_levels(os.getenv("LOG_LEVELS", ""))
 
         # 文件配置
         self.log_dir = Path(os.getenv("LOG_DIR", "Logs"))
@@ -36,6 +42,11 @@ class LogConfig:
             "%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s"
         )
         self.date_format = os.getenv("LOG_DATE_FORMAT", "%Y-%m-%d %H:%M:%S")
+        self.json = os.getenv("LOG_JSON", "false").lower() == "true"
+
+        # 请求体/参数日志的截断与采样
+        self.body_max_size = int(os.getenv("LOG_BODY_MAX_SIZE", "2048"))
+        self.body_sample_rate = float(os.getenv("LOG_BODY_SAMPLE_RATE", "1"))
 
     def validate_level(self) -> int:
         """验证并返回日志级别"""
@@ -44,11 +55,52 @@ class LogConfig:
         except AttributeError:
             return logging.INFO
 
+    @staticmethod
+    def _parse_module_levels(value: str) -> Dict[str, int]:
+        levels = {}
+        for item in value.split(","):
+            if "=" in item:
+                module, level = item.split("=", 1)
+                levels[module.strip()] = getattr(logging, level.strip().upper(), logging.INFO)
+        return levels
+
+
+class JsonFormatter(logging.Formatter):
+    """结构化日志格式化器，每条记录输出一行 JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class ModuleLevelFilter(logging.Filter):
+    """按模块名（record.module）过滤低于该模块配置级别的日志"""
+
+    def __init__(self, module_levels: Dict[str, int], default_level: int):
+        super().__init__()
+        self.module_levels = module_levels
+        self.default_level = default_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.module_levels.get(record.module, self.default_level)
+
 
 def setup_logger(name: Optional[str] = None) -> logging.Logger:
     """
     设置并返回配置好的日志器
 
+    日志记录只在调用线程中放入内存队列，控制台与文件的写入由后台 QueueListener 线程完成，
+    不阻塞事件循环。
+
     Args:
         name: 日志器名称，如果为None则使用环境变量配置或默认值
 
@@ -74,32 +126,43 @@ def setup_logger(name: Optional[str] = None) -> logging.Logger:
     if log_level == logging.INFO and config.level != "INFO":
         print(f"警告: 无效的日志级别 '{config.level}', 使用默认级别 INFO", file=sys.stderr)
 
-    logger.setLevel(log_level)
+    # 日志器级别取全局与各模块配置中的最低值，具体模块由过滤器再控制
+    logger.setLevel(min([log_level, *config.module_levels.values()]))
 
     # 创建格式化器
-    formatter = logging.Formatter(
-        fmt=config.log_format,
-        datefmt=config.date_format
-    )
+    if config.json:
+        formatter = JsonFormatter(datefmt=config.date_format)
+    else:
+        formatter = logging.Formatter(
+            fmt=config.log_format,
+            datefmt=config.date_format
+        )
 
     # 添加处理器
-    _add_console_handler(logger, formatter)
-    _add_file_handlers(logger, formatter, config)
+    handlers = [_create_console_handler(formatter), *_create_file_handlers(formatter, config)]
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(ModuleLevelFilter(config.module_levels, log_level))
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
 
     logger.info(f"日志器 '{logger_name}' 初始化完成，级别: {config.level}")
     return logger
 
 
-def _add_console_handler(logger: logging.Logger, formatter: logging.Formatter) -> None:
-    """添加控制台处理器"""
+def _create_console_handler(formatter: logging.Formatter) -> logging.Handler:
+    """创建控制台处理器"""
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
     console_handler.setLevel(logging.DEBUG)
-    logger.addHandler(console_handler)
+    return console_handler
 
 
-def _add_file_handlers(logger: logging.Logger, formatter: logging.Formatter, config: LogConfig) -> None:
-    """添加文件处理器"""
+def _create_file_handlers(formatter: logging.Formatter, config: LogConfig) -> list:
+    """创建文件处理器"""
     try:
         # 确保日志目录存在
         config.log_dir.mkdir(parents=True, exist_ok=True)
@@ -114,7 +177,6 @@ def _add_file_handlers(logger: logging.Logger, formatter: logging.Formatter, con
         info_handler.setFormatter(formatter)
         info_handler.setLevel(logging.DEBUG)
         info_handler.addFilter(lambda record: record.levelno < logging.WARNING)
-        logger.addHandler(info_handler)
 
         # 错误日志文件处理器 (WARNING及以上级别)
         error_handler = RotatingFileHandler(
@@ -125,13 +187,34 @@ def _add_file_handlers(logger: logging.Logger, formatter: logging.Formatter, con
         )
         error_handler.setFormatter(formatter)
         error_handler.setLevel(logging.WARNING)
-        logger.addHandler(error_handler)
+        return [info_handler, error_handler]
 
     except OSError as e:
-        logger.error(f"无法创建日志文件处理器: {e}")
+        print(f"无法创建日志文件处理器: {e}", file=sys.stderr)
         raise
 
 
+def loggable(value: Any, config: Optional[LogConfig] = None) -> Optional[str]:
+    """
+    按采样率与最大长度处理要记录的请求体/参数
+
+    Returns:
+        截断后的字符串；未被采样时返回 None
+    """
+    config = config or _default_config
+    if config.body_sample_rate < 1 and random.random() >= config.body_sample_rate:
+        return None
+    text = value if isinstance(value, str) else str(value)
+    if len(text) > config.body_max_size:
+        return f"{text[:config.body_max_size]}...(total {len(text)} chars)"
+    return text
+
+
+def header_names(headers) -> str:
+    """只记录请求头名称，不记录 Cookie/Authorization 等头部的值"""
+    return ",".join(headers.keys())
+
+
 def get_logger(name: Optional[str] = None) -> logging.Logger:
     """
     获取日志器实例的便捷方法
@@ -146,6 +229,7 @@ def get_logger(name: Optional[str] = None) -> logging.Logger:
 
 
 # 创建默认日志器实例
+_default_config = LogConfig()
 default_logger = setup_logger()
 
 # 导出主要接口
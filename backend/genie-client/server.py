@@ -3,7 +3,7 @@ from fastapi import FastAPI, Request, Body
 
 from app.client import SseClient
 from app.header import HeaderEntity
-from app.logger import default_logger as logger
+from app.logger import default_logger as logger, header_names, loggable
 
 app = FastAPI(
     title="Genie MCP Client API",
@@ -39,7 +39,8 @@ async def ping_server(
     """
     - 根据请求 server_url 测试 server 的连通性
     """
-    logger.info(f"方法:/v1/serv/pong, {server_url}, request headers: {request.headers}")
+    logger.info(f"方法:/v1/serv/pong, {server_url}")
+    logger.debug(f"request headers: {header_names(request.headers)}")
     mcp_client = SseClient(server_url=server_url, entity=HeaderEntity(request.headers))
     try:
         await mcp_client.ping_server()
@@ -65,7 +66,8 @@ async def list_tools(
     """
     - 根据请求 server_url 查询 tools 列表
     """
-    logger.info(f"方法:/v1/tool/list, {server_url}, request headers: {request.headers}")
+    logger.info(f"方法:/v1/tool/list, {server_url}")
+    logger.debug(f"request headers: {header_names(request.headers)}")
     mcp_client = SseClient(server_url=server_url, entity=HeaderEntity(request.headers))
     try:
         tools = await mcp_client.list_tools()
@@ -93,8 +95,10 @@ async def call_tool(
     """
     - 调用指定工具
     """
-    logger.info(f"方法: /v1/tool/call, {name} with arguments: {arguments}")
-    logger.info(f"call: {server_url}, request headers: {request.headers}")
+    if (args_log := loggable(arguments)) is not None:
+        logger.info(f"方法: /v1/tool/call, {name} with arguments: {args_log}")
+    logger.info(f"call: {server_url}")
+    logger.debug(f"request headers: {header_names(request.headers)}")
     entity = HeaderEntity(request.headers)
     if arguments is not None and arguments.get("Cookie") is not None:
         entity.append_cookie(arguments.get("Cookie"))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/10
+# =====================
+"""CIAgent 流式输出的每 token CPU 开销基准
+
+- stream (legacy)：每个增量都重新合并全部增量并渲染 Markdown（改造前的做法）
+- stream (console off / on)：StreamRenderer 增量累积，结束后合并一次；on 时按时间间隔重绘
+- memory messages：步骤数增加时每步生成记忆消息的耗时，全量重建 vs 增量
+- CIAgent.run：用模拟模型端到端运行多步，统计每个生成 token 的 CPU 时间
+
+控制台输出写入 /dev/null，不计终端本身的开销。
+
+用法: python -m benchmark.bench_ci_stream [--tokens 500,2000,8000] [--steps 8]
+"""
+import os
+import tempfile
+import time
+from optparse import OptionParser
+
+os.environ.setdefault("CODE_EXECUTOR_POOL_SIZE", "0")
+
+from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+from smolagents import ChatMessage, ChatMessageStreamDelta, MessageRole, PythonInterpreterTool, \
+    agglomerate_stream_deltas
+from smolagents.agents import MultiStepAgent
+
+from genie_tool.tool.ci_agent import CIAgent, StreamRenderer
+from genie_tool.util.prompt_util import get_prompt
+
+_TOKEN = "data "
+
+
+def make_deltas(tokens: int, code: str = "x = 1"):
+    deltas = [ChatMessageStreamDelta(content=_TOKEN) for _ in range(tokens)]
+    deltas.append(ChatMessageStreamDelta(content=f"\n<code>\n{code}\n</code>"))
+    return deltas
+
+
+def stream_legacy(deltas, console):
+    collected = []
+    with Live("", console=console, vertical_overflow="visible") as live:
+        for delta in deltas:
+            collected.append(delta)
+            live.update(Markdown(agglomerate_stream_deltas(collected).render_as_markdown()))
+    return agglomerate_stream_deltas(collected)
+
+
+def stream_renderer(deltas, console, enabled: bool):
+    collected = []
+    with StreamRenderer(console, enabled=enabled) as renderer:
+        for delta in deltas:
+            collected.append(delta)
+            renderer.update(delta)
+    return agglomerate_stream_deltas(collected)
+
+
+def cpu_per_token(func, tokens: int) -> float:
+    start = time.process_time()
+    func()
+    return (time.process_time() - start) / tokens * 1e6
+
+
+class _FakeModel(object):
+    model_id = "bench"
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+
+    def generate_stream(self, messages, **kwargs):
+        yield from make_deltas(self.tokens, code="x = 1\nprint(x)")
+
+    def generate(self, messages, **kwargs):
+        return ChatMessage(role=MessageRole.ASSISTANT, content='{"is_final": false}')
+
+
+def bench_agent(tokens: int, steps: int) -> float:
+    agent = CIAgent(model=_FakeModel(tokens), prompt_templates=get_prompt("code_interpreter"),
+                    tools=[PythonInterpreterTool()], additional_authorized_imports=[],
+                    output_dir=tempfile.mkdtemp())
+    return cpu_per_token(lambda: list(agent.run(task="bench", stream=True, max_steps=steps)), tokens * steps)
+
+
+def bench_messages(agent: CIAgent, rounds: int = 20):
+    full = cpu_per_token(lambda: [MultiStepAgent.write_memory_to_messages(agent) for _ in range(rounds)], rounds)
+    incremental = cpu_per_token(lambda: [agent.write_memory_to_messages() for _ in range(rounds)], rounds)
+    return full, incremental
+
+
+def main(token_counts, steps: int):
+    console = Console(file=open(os.devnull, "w"), force_terminal=True)
+    for tokens in token_counts:
+        deltas = make_deltas(tokens)
+        for name, func in [
+            ("legacy", lambda: stream_legacy(deltas, console)),
+            ("console off", lambda: stream_renderer(deltas, console, enabled=False)),
+            ("console on", lambda: stream_renderer(deltas, console, enabled=True)),
+        ]:
+            if name == "legacy" and tokens > 4000:
+                print(f"stream ({name:11s}) {tokens:6d} tokens {'skipped':>10s}")
+                continue
+            print(f"stream ({name:11s}) {tokens:6d} tokens {cpu_per_token(func, tokens):10.1f} us/token")
+
+    agent = CIAgent(model=_FakeModel(200), prompt_templates=get_prompt("code_interpreter"),
+                    tools=[PythonInterpreterTool()], additional_authorized_imports=[], output_dir=tempfile.mkdtemp())
+    list(agent.run(task="bench", stream=True, max_steps=steps))
+    full, incremental = bench_messages(agent)
+    print(f"memory messages ({len(agent.memory.steps)} steps) full {full:10.1f} us  incremental {incremental:10.1f} us")
+
+    for tokens in token_counts:
+        print(f"CIAgent.run {steps} steps {tokens:6d} tokens/step {bench_agent(tokens, steps):10.1f} us/token")
+
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("--tokens", dest="tokens", type="string", default="500,2000,8000")
+    parser.add_option("--steps", dest="steps", type="int", default=8)
+    (options, args) = parser.parse_args()
+    main([int(t) for t in options.tokens.split(",")], options.steps)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/10
+# =====================
+"""代码执行首步延迟基准：执行进程未预热（cold）与预热（warm）时，租用进程并执行第一段代码的耗时
+
+两种情况都等执行进程启动完成后再计时，只比较第一段代码中导入授权库、绘图所需的时间。
+
+用法: python -m benchmark.bench_executor [--rounds 5]
+"""
+import os
+import statistics
+import tempfile
+import time
+from optparse import OptionParser
+
+from genie_tool.tool.code_interpreter import CI_AUTHORIZED_IMPORTS, create_ci_agent
+from genie_tool.tool.executor_pool import ExecutorPool, PooledPythonExecutor
+from genie_tool.util.prompt_util import get_prompt
+
+FIRST_STEP = """
+import pandas as pd
+import numpy as np
+import seaborn as sns
+df = pd.DataFrame({"x": np.arange(100), "y": np.sin(np.arange(100) / 10)})
+sns.lineplot(data=df, x="x", y="y").get_figure().savefig("chart.png")
+print(df.describe())
+"""
+
+
+def first_step_latency(prewarm: bool) -> float:
+    pool = ExecutorPool(size=1, authorized_imports=CI_AUTHORIZED_IMPORTS, timeout=120, prewarm=prewarm)
+    pool.start()
+    worker = pool._idle.get()
+    worker.wait_ready(timeout=120)
+    pool._idle.put(worker)
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            # 与接口相同的方式创建 CIAgent，代码在进程池中执行
+            agent = create_ci_agent(prompt_templates=get_prompt("code_interpreter"), output_dir=work_dir,
+                                    work_dir=work_dir, executor_pool=pool)
+            assert isinstance(agent.python_executor, PooledPythonExecutor)
+            start = time.perf_counter()
+            agent.python_executor.send_variables(variables=agent.state)
+            agent.python_executor.send_tools({**agent.tools})
+            agent.python_executor(FIRST_STEP)
+            cost = time.perf_counter() - start
+            agent.cleanup()
+            return cost
+    finally:
+        pool.shutdown()
+
+
+def main(rounds: int):
+    # 未启用进程池时仍在服务进程内执行
+    os.environ["CODE_EXECUTOR_POOL_SIZE"] = "0"
+    agent = create_ci_agent(prompt_templates=get_prompt("code_interpreter"), output_dir=tempfile.mkdtemp())
+    print(f"pool disabled: {type(agent.python_executor).__name__}")
+    for name, prewarm in [("cold", False), ("warm", True)]:
+        costs = [first_step_latency(prewarm) for _ in range(rounds)]
+        print(f"first step {name:5s} median {statistics.median(costs) * 1000:8.0f} ms  "
+              f"max {max(costs) * 1000:8.0f} ms  ({rounds} rounds)")
+
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("--rounds", dest="rounds", type="int", default=5)
+    (options, args) = parser.parse_args()
+    main(options.rounds)
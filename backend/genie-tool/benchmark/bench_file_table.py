@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/9
+# =====================
+"""FileInfo 存储基准：百万行下的批量写入、单条 add、按 request_id 列表与分页的吞吐
+
+对比旧实现（无 request_id 索引、add 为 查询+提交+查询 三次往返）与当前实现，两者共用 WAL 等 pragma 设置。
+数据库写在临时目录，不影响 SQLITE_DB_PATH。
+
+用法: python -m benchmark.bench_file_table [--rows 1000000] [--files-per-request 20] [--ops 2000]
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from optparse import OptionParser
+
+os.environ["SQLITE_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_file_table.db")
+
+from loguru import logger
+from sqlmodel import select
+
+from genie_tool.db.db_engine import init_db, engine, async_session_local
+from genie_tool.db.file_table import FileInfo
+from genie_tool.db.file_table_op import FileInfoOp
+
+
+def make_file_info(i: int, files_per_request: int) -> FileInfo:
+    request_id = f"req-{i // files_per_request}"
+    return FileInfo(file_id=f"file-{i}", filename=f"{i}.md", file_path=f"file_db_dir/{request_id}/{i}.md",
+                    description="", file_size=1024, content_hash=f"{i:064x}", status=1, request_id=request_id)
+
+
+async def legacy_add(file_info: FileInfo) -> FileInfo:
+    file_id = file_info.file_id
+    f = await FileInfoOp.get_by_file_id(file_info.file_id)
+    async with async_session_local() as session:
+        if f:
+            f.status = file_info.status
+            f.file_size = file_info.file_size
+            f.file_path = file_info.file_path
+            session.add(f)
+        else:
+            session.add(file_info)
+        await session.commit()
+    return await FileInfoOp.get_by_file_id(file_id)
+
+
+async def legacy_list(request_id: str):
+    async with async_session_local() as session:
+        result = await session.execute(select(FileInfo).where(FileInfo.request_id == request_id))
+        return result.scalars().all()
+
+
+async def timed(name: str, ops: int, func):
+    start = time.perf_counter()
+    for i in range(ops):
+        await func(i)
+    cost = time.perf_counter() - start
+    print(f"{name:40s} {ops / cost:10.0f} ops/s")
+
+
+def set_legacy_storage(legacy: bool):
+    with engine.begin() as conn:
+        if legacy:
+            conn.exec_driver_sql("DROP INDEX IF EXISTS ix_fileinfo_request_id")
+        else:
+            conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_fileinfo_request_id ON fileinfo (request_id)")
+
+
+async def main(rows: int, files_per_request: int, ops: int):
+    init_db()
+    start = time.perf_counter()
+    batch = 50000
+    for i in range(0, rows, batch):
+        await FileInfoOp.add_batch([make_file_info(j, files_per_request) for j in range(i, min(i + batch, rows))])
+    print(f"{'add_batch':40s} {rows / (time.perf_counter() - start):10.0f} rows/s ({rows} rows)")
+
+    requests = rows // files_per_request
+    await timed("add (upsert, 1 statement)", ops, lambda i: FileInfoOp.add(make_file_info(rows + i, files_per_request)))
+    await timed("add (legacy, 3 round trips)", ops,
+                lambda i: legacy_add(make_file_info(rows + ops + i, files_per_request)))
+    await timed("get_page_by_request_id (indexed)", ops,
+                lambda i: FileInfoOp.get_page_by_request_id(f"req-{random.randrange(requests)}", 1, 10))
+    await timed("get_by_request_id (indexed)", ops,
+                lambda i: FileInfoOp.get_by_request_id(f"req-{random.randrange(requests)}"))
+    set_legacy_storage(True)
+    await timed("get_by_request_id (no index)", max(ops // 100, 5),
+                lambda i: legacy_list(f"req-{random.randrange(requests)}"))
+    set_legacy_storage(False)
+
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("--rows", dest="rows", type="int", default=1000000)
+    parser.add_option("--files-per-request", dest="files_per_request", type="int", default=20)
+    parser.add_option("--ops", dest="ops", type="int", default=2000)
+    (options, args) = parser.parse_args()
+    logger.remove()
+    asyncio.run(main(options.rows, options.files_per_request, options.ops))
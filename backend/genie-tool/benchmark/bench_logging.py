@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/7
+# =====================
+"""日志开销基准：对比不记日志、同步文件 sink（DEBUG、完整请求体）与 setup_logging（后台线程写入、截断请求体）下的请求吞吐
+
+用法: python -m benchmark.bench_logging [--requests 3000] [--body-size 20000]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+import httpx
+from fastapi import APIRouter, FastAPI
+from loguru import logger
+
+from genie_tool.util.log_util import LOG_FORMAT, setup_logging, timer
+from genie_tool.util.middleware_util import HTTPProcessTimeMiddleware, RequestHandlerRoute
+
+
+@timer()
+async def _handle(body: dict) -> dict:
+    return {"size": len(body.get("content", ""))}
+
+
+def build_app() -> FastAPI:
+    router = APIRouter(route_class=RequestHandlerRoute)
+
+    @router.post("/echo")
+    async def echo(body: dict):
+        return await _handle(body)
+
+    app = FastAPI()
+    app.add_middleware(HTTPProcessTimeMiddleware)
+    app.include_router(router)
+    return app
+
+
+async def run(total: int, body_size: int, concurrency: int = 50) -> float:
+    transport = httpx.ASGITransport(app=build_app())
+    payload = {"requestId": "bench", "content": "创" * body_size}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        sem = asyncio.Semaphore(concurrency)
+
+        async def _one():
+            async with sem:
+                await client.post("/echo", json=payload)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[_one() for _ in range(total)])
+        elapsed = time.perf_counter() - start
+    await logger.complete()
+    return total / elapsed
+
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("--requests", dest="requests", type="int", default=3000)
+    parser.add_option("--body-size", dest="body_size", type="int", default=20000)
+    (options, args) = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, "server.log")
+        results = []
+
+        logger.remove()
+        results.append(("no logging", asyncio.run(run(options.requests, options.body_size))))
+
+        logger.remove()
+        os.environ["LOG_BODY_MAX_SIZE"] = str(sys.maxsize)
+        os.environ["LOG_LEVEL"] = "DEBUG"
+        logger.add(log_path, format=LOG_FORMAT, rotation="200 MB")
+        results.append(("sync sink, DEBUG, full body", asyncio.run(run(options.requests, options.body_size))))
+
+        os.environ.pop("LOG_BODY_MAX_SIZE")
+        os.environ["LOG_LEVEL"] = "INFO"
+        setup_logging(log_path, console=False)
+        results.append(("queue sink, INFO, capped body", asyncio.run(run(options.requests, options.body_size))))
+        logger.remove()
+
+    for name, rps in results:
+        print(f"{name:36s} {rps:10.0f} req/s")
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/7
+# =====================
+"""中间件吞吐基准：BaseHTTPMiddleware 版本对比纯 ASGI 版本（进程内 ASGI 调用，不含网络开销）
+
+用法: python -m benchmark.bench_middleware [--requests 5000] [--concurrency 50]
+"""
+import asyncio
+import time
+import uuid
+from optparse import OptionParser
+
+import httpx
+from fastapi import FastAPI
+from loguru import logger
+from sse_starlette import EventSourceResponse, ServerSentEvent
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+from genie_tool.model.context import RequestIdCtx
+from genie_tool.util.middleware_util import UnknownException, HTTPProcessTimeMiddleware
+
+
+class LegacyUnknownException(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as e:
+            return Response(content=f"Unexpected error: {e}", status_code=500)
+
+
+class LegacyHTTPProcessTimeMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        RequestIdCtx.request_id = str(uuid.uuid4())
+        start_time = time.time()
+        response = await call_next(request)
+        response.headers["X-Process-Time"] = str(int((time.time() - start_time) * 1000))
+        return response
+
+
+def build_app(legacy: bool) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(LegacyUnknownException if legacy else UnknownException)
+    app.add_middleware(LegacyHTTPProcessTimeMiddleware if legacy else HTTPProcessTimeMiddleware)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stream")
+    async def stream():
+        async def _gen():
+            for i in range(20):
+                yield ServerSentEvent(data=str(i))
+        return EventSourceResponse(_gen())
+
+    return app
+
+
+async def run(app: FastAPI, path: str, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        sem = asyncio.Semaphore(concurrency)
+
+        async def _one():
+            async with sem:
+                r = await client.get(path, headers={"X-Request-Id": "bench"})
+                assert r.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*[_one() for _ in range(total)])
+        return total / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("--requests", dest="requests", type="int", default=5000)
+    parser.add_option("--concurrency", dest="concurrency", type="int", default=50)
+    (options, args) = parser.parse_args()
+    logger.remove()
+
+    for path, total in [("/health", options.requests), ("/stream", options.requests // 5)]:
+        for name, legacy in [("BaseHTTPMiddleware", True), ("pure ASGI", False)]:
+            rps = asyncio.run(run(build_app(legacy), path, total, options.concurrency))
+            print(f"{path:8s} {name:20s} {rps:10.0f} req/s")
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/9
+# =====================
+"""预览接口吞吐基准：FileInfo 元数据缓存关闭与开启时 /preview 的 req/s（进程内 ASGI 调用，不含网络开销）
+
+数据库与文件存储写在临时目录，不影响 SQLITE_DB_PATH / FILE_SAVE_PATH。
+
+用法: python -m benchmark.bench_preview [--files 200] [--requests 5000] [--concurrency 50]
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from optparse import OptionParser
+
+_tmp_dir = tempfile.mkdtemp()
+os.environ["SQLITE_DB_PATH"] = os.path.join(_tmp_dir, "bench_preview.db")
+os.environ["FILE_SAVE_PATH"] = os.path.join(_tmp_dir, "file_db_dir")
+
+import httpx
+from fastapi import FastAPI
+from loguru import logger
+
+from genie_tool.api import api_router
+from genie_tool.db.db_engine import init_db
+from genie_tool.db.file_table_op import FileInfoOp, FileInfoCache
+from genie_tool.model.protocal import get_file_id
+
+
+async def prepare(files: int):
+    for i in range(files):
+        await FileInfoOp.add_by_content(f"report_{i}.md", f"# report {i}\n" * 100, get_file_id("bench", f"report_{i}.md"),
+                                        request_id="bench")
+
+
+async def run(app: FastAPI, files: int, total: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        sem = asyncio.Semaphore(concurrency)
+
+        async def _one():
+            async with sem:
+                r = await client.get(f"/v1/file_tool/preview/bench/report_{random.randrange(files)}.md")
+                assert r.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*[_one() for _ in range(total)])
+        return total / (time.perf_counter() - start)
+
+
+async def main(files: int, total: int, concurrency: int):
+    init_db()
+    await prepare(files)
+    app = FastAPI()
+    app.include_router(api_router)
+    cache_size = FileInfoCache.max_size
+    for name, size in [("no cache", 0), ("metadata cache", cache_size)]:
+        FileInfoCache.clear()
+        FileInfoCache.max_size = size
+        rps = await run(app, files, total, concurrency)
+        print(f"/preview {name:16s} {rps:10.0f} req/s")
+
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("--files", dest="files", type="int", default=200)
+    parser.add_option("--requests", dest="requests", type="int", default=5000)
+    parser.add_option("--concurrency", dest="concurrency", type="int", default=50)
+    (options, args) = parser.parse_args()
+    logger.remove()
+    asyncio.run(main(options.files, options.requests, options.concurrency))
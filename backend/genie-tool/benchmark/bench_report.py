@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/7
+# =====================
+"""报告生成基准：截断模式对比 map-reduce 模式的最终 prompt 大小、输入覆盖率与端到端耗时
+
+模型调用用模拟 LLM 代替：耗时 = 固定开销 + prompt 每千字符的预填充耗时 + 输出每千字符的解码耗时，
+map 阶段按 --map-ratio 压缩比输出。参数可按实际模型的延迟曲线调整。
+
+用法: python -m benchmark.bench_report [--files 60] [--file-size 8000] [--context 128000] [--concurrency 4]
+"""
+import asyncio
+import os
+import random
+import time
+from optparse import OptionParser
+
+from genie_tool.model.context import LLMModelInfo, LLMModelInfoFactory
+from genie_tool.model.report import ReportProgress
+from genie_tool.tool import report as report_module
+from genie_tool.util.file_util import truncate_files
+
+
+class FakeLLM(object):
+    def __init__(self, base_ms: float, prefill_ms: float, decode_ms: float, map_ratio: float, report_size: int):
+        self.base_ms = base_ms
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.map_ratio = map_ratio
+        self.report_size = report_size
+        self.final_prompt_size = 0
+        self.map_calls = 0
+
+    async def __call__(self, messages, model, stream=False, **kwargs):
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        size = sum(len(m["content"]) for m in messages)
+        if stream:
+            self.final_prompt_size = size
+            output = "报告" * (self.report_size // 2)
+        else:
+            self.map_calls += 1
+            output = "要点" * int(size * self.map_ratio / 2)
+        await asyncio.sleep((self.base_ms + self.prefill_ms * size / 1000 + self.decode_ms * len(output) / 1000) / 1000)
+        if stream:
+            for i in range(0, len(output), 200):
+                yield output[i: i + 200]
+        else:
+            yield output
+
+
+def build_files(n: int, size: int, seed: int = 7):
+    rnd = random.Random(seed)
+    words = ["创业", "融资", "市场", "政策", "analysis", "growth", "2025", "用户", "revenue", "孵化器"]
+    files = []
+    for i in range(n):
+        body = "\n".join(" ".join(rnd.choice(words) for _ in range(40)) for _ in range(size // 200))
+        files.append({"file_name": f"doc-{i}.md", "content": body[: size]})
+    return files
+
+
+async def run(mode: str, files, llm: FakeLLM, context: int):
+    os.environ["REPORT_MODE"] = mode
+
+    kept = []
+
+    def _truncate(fs, max_tokens):
+        result = truncate_files(fs, max_tokens)
+        kept.append(len(result))
+        return result
+
+    report_module.truncate_files = _truncate
+    report_module.ask_llm = llm
+    LLMModelInfoFactory.register(LLMModelInfo(model="bench-model", context_length=context, max_output=8000))
+    progress = 0
+    start = time.perf_counter()
+    async for chunk in report_module.markdown_report("2025 年创业融资市场分析", [dict(f) for f in files],
+                                                     model="bench-model"):
+        if isinstance(chunk, ReportProgress):
+            progress += 1
+    return time.perf_counter() - start, progress, kept[-1]
+
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("--files", dest="files", type="int", default=60)
+    parser.add_option("--file-size", dest="file_size", type="int", default=8000)
+    parser.add_option("--context", dest="context", type="int", default=128000)
+    parser.add_option("--concurrency", dest="concurrency", type="int", default=4)
+    parser.add_option("--chunk-size", dest="chunk_size", type="int", default=8000)
+    parser.add_option("--map-ratio", dest="map_ratio", type="float", default=0.1)
+    parser.add_option("--base-ms", dest="base_ms", type="float", default=300)
+    parser.add_option("--prefill-ms", dest="prefill_ms", type="float", default=40, help="每千字符 prompt 的预填充耗时")
+    parser.add_option("--decode-ms", dest="decode_ms", type="float", default=1000, help="每千字符输出的解码耗时")
+    (options, args) = parser.parse_args()
+
+    os.environ["REPORT_MAP_CONCURRENCY"] = str(options.concurrency)
+    os.environ["REPORT_MAP_CHUNK_SIZE"] = str(options.chunk_size)
+    files = build_files(options.files, options.file_size)
+    total = sum(len(f["content"]) for f in files)
+    print(f"input: {len(files)} files, {total / 1000:.0f}K chars, context {options.context}")
+    for mode in ("truncate", "map_reduce"):
+        llm = FakeLLM(options.base_ms, options.prefill_ms, options.decode_ms, options.map_ratio, report_size=4000)
+        cost, progress, kept = asyncio.run(run(mode, files, llm, options.context))
+        print(f"{mode:>10}: final prompt {llm.final_prompt_size / 1000:7.1f}K chars, files kept {kept:3d}/{len(files)}, "
+              f"map calls {llm.map_calls:3d}, progress events {progress:3d}, latency {cost:6.2f} s")
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/7
+# =====================
+"""脱敏引擎基准：旧版（四次 re.sub + 非字符串 content 的 json 往返）对比单次扫描版
+
+用法: python -m benchmark.bench_sensitive_detection [--docs 200] [--rounds 5]
+"""
+import json
+import random
+import re
+import string
+import time
+from optparse import OptionParser
+
+from genie_tool.util.sensitive_detection import SensitiveWordsReplace
+
+
+_LEGACY_PATTERNS = [
+    (r"[a-zA-Z0-9_-]+@[a-zA-Z0-9_-]+(\.[a-zA-Z0-9_-]+)+", "***"),
+    (r"(?<![A-Za-z_\d])(1[3-9]\d{9})(?![A-Za-z_\d])", "*" * 11),
+    (r"(?:[^\dA-Za-z_]|^)((?:[1-6][1-7]|50|71|81|82)\d{4}(?:19|20)\d{2}(?:0[1-9]|10|11|12)(?:[0-2][1-9]|10|20|30|31)\d{3}[0-9Xx])(?:[^\dA-Za-z_]|$)", "*" * 18),
+    (r"(?:[^\dA-Za-z_]|^)((?:[1-6][1-7]|50|71|81|82)\d{4}(?:19|20)\d{2}(?:0[1-9]|10|11|12)(?:[0-2][1-9]|10|20|30|31)\d{3}[0-9Xx])(?:[^\dA-Za-z_]|$)", "*" * 19),
+]
+
+
+def legacy_replace(content: str) -> str:
+    for pattern, word in _LEGACY_PATTERNS:
+        content = re.sub(pattern, word, content)
+    return content
+
+
+def legacy_replace_messages(messages):
+    for message in messages:
+        if isinstance(message.get("content"), str):
+            message["content"] = legacy_replace(message["content"])
+        else:
+            message["content"] = json.loads(legacy_replace(json.dumps(message["content"], ensure_ascii=False)))
+    return messages
+
+
+def build_messages(docs: int, seed: int = 7):
+    """模拟报告 prompt：系统提示 + 大量搜索结果文档，少量夹带 PII"""
+    rnd = random.Random(seed)
+    words = ["创业", "融资", "市场", "政策", "analysis", "growth", "2025", "用户", "revenue", "孵化器"]
+    paragraphs = []
+    for i in range(docs):
+        body = " ".join(rnd.choice(words) for _ in range(180))
+        if i % 10 == 0:
+            body += f" 联系人 {''.join(rnd.choices(string.ascii_lowercase, k=6))}@example.com 电话 138{rnd.randint(10000000, 99999999)}"
+        paragraphs.append(f"<div><p>文档标题:doc-{i}</p><p>文档内容:{body}</p></div>")
+    text = "\n".join(paragraphs)
+    return [
+        {"role": "system", "content": "你是一个报告生成助手。" * 50},
+        {"role": "user", "content": text},
+        {"role": "user", "content": [{"type": "text", "text": text[: len(text) // 4]},
+                                     {"type": "image_url", "image_url": {"url": "data:image/png;base64," + "A" * 40000}}]},
+    ]
+
+
+def _bench(fn, messages, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(json.loads(json.dumps(messages)))
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+if __name__ == "__main__":
+    parser = OptionParser()
+    parser.add_option("--docs", dest="docs", type="int", default=200)
+    parser.add_option("--rounds", dest="rounds", type="int", default=5)
+    (options, args) = parser.parse_args()
+
+    messages = build_messages(options.docs)
+    size = sum(len(json.dumps(m, ensure_ascii=False)) for m in messages)
+    copy_cost = _bench(lambda m: m, messages, options.rounds)
+    legacy = _bench(legacy_replace_messages, messages, options.rounds) - copy_cost
+    single = _bench(SensitiveWordsReplace.replace_messages, messages, options.rounds) - copy_cost
+    print(f"prompt size: {size / 1024:.0f} KB, rounds: {options.rounds}")
+    print(f"legacy (4 x re.sub + json):  {legacy:8.2f} ms/call")
+    print(f"single-pass compiled:        {single:8.2f} ms/call")
+    print(f"speedup: {legacy / max(single, 1e-6):.1f}x")
@@ -1,13 +1,19 @@
+import asyncio
 import mimetypes
 import os
+from email.utils import formatdate, parsedate_to_datetime
 from urllib.parse import quote, unquote
 
-from fastapi import APIRouter, File, Form, UploadFile
-from fastapi.responses import JSONResponse, Response, FileResponse
+from fastapi import APIRouter, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, FileResponse, StreamingResponse
 
 from genie_tool.model.protocal import FileRequest, FileListRequest, FileUploadRequest, get_file_id
 from genie_tool.util.middleware_util import RequestHandlerRoute
-from genie_tool.db.file_table_op import FileInfoOp, get_file_preview_url, get_file_download_url
+from genie_tool.util.preview_util import preview_lines
+from genie_tool.db.file_table import FileInfo
+from genie_tool.db.file_retention_op import FileRetention
+from genie_tool.db.file_table_op import FileDB, FileInfoOp, FileInfoCache, FileTooLargeError, get_file_preview_url, \
+    get_file_download_url
 
 
 router = APIRouter(route_class=RequestHandlerRoute)
@@ -43,21 +49,36 @@ async def upload_file(
 async def upload_file_data(file: UploadFile = File(...), request_id: str = Form(alias="requestId")):
     file.filename = unquote(file.filename)
     file_id = get_file_id(request_id, file.filename)
-    file_info = await FileInfoOp.add_by_file(file=file, file_id=file_id, request_id=request_id)
+    try:
+        file_info = await FileInfoOp.add_by_file(file=file, file_id=file_id, request_id=request_id)
+    except FileTooLargeError as e:
+        return Response(content=str(e), status_code=413)
     preview_url = get_file_preview_url(file_id=file_info.request_id, file_name=file_info.filename)
     download_url = get_file_download_url(file_id=file_info.request_id, file_name=file_info.filename)
     return JSONResponse(content={"downloadUrl": download_url, "domainUrl": preview_url, "fileSize": file_info.file_size})
 
 
+@router.get("/gc_stats")
+async def gc_stats():
+    """本进程执行的存储清理指标（多 worker 时由持有清理锁的进程执行）"""
+    return JSONResponse(content=FileRetention.stats)
+
+
 @router.post("/get_file_list")
 async def get_file_list(body: FileListRequest):
-    if not body.filters:
+    # 显式传入 page / pageSize 时分页，否则保持返回全部文件
+    paged = bool({"page", "page_size"} & body.model_fields_set) and not body.filters
+    page, page_size = max(body.page, 1), min(max(body.page_size, 1), 1000)
+    if paged:
+        file_infos, total, total_size = await FileInfoOp.get_page_by_request_id(body.request_id, page, page_size)
+    elif not body.filters:
         file_infos = await FileInfoOp.get_by_request_id(body.request_id)
     else:
         file_infos = await FileInfoOp.get_by_file_ids(file_ids=[f.file_id for f in body.filters])
+    if not paged:
+        total, total_size = len(file_infos), sum([f.file_size or 0 for f in file_infos])
     if not file_infos:
-         return JSONResponse(content={"results": [], "totalSize": 0})
-    total_size = sum([f.file_size for f in file_infos])
+         return JSONResponse(content={"results": [], "totalSize": total_size, "total": total})
     results = []
     for file_info in file_infos:
         preview_url = get_file_preview_url(file_id=file_info.request_id, file_name=file_info.filename)
@@ -67,25 +88,142 @@ async def get_file_list(body: FileListRequest):
             "downloadUrl": download_url, "domainUrl": preview_url,
             "requestId": file_info.request_id, "fileName": file_info.filename
         })
-    return JSONResponse(content={"results": results, "totalSize": total_size})
+    content = {"results": results, "totalSize": total_size, "total": total}
+    if paged:
+        content.update({"page": page, "pageSize": page_size})
+    return JSONResponse(content=content)
+
+
+async def _read_rest(f):
+    while chunk := await asyncio.to_thread(f.read, 64 * 1024):
+        yield chunk
+
+
+async def _tail_partial(file_info: FileInfo):
+    """生成中的文件：持续输出新追加的内容，直到文件提交（status 不再为 0）或长时间无新内容；文件读取在线程池中执行"""
+    poll_interval = float(os.getenv("FILE_PREVIEW_POLL_INTERVAL", 0.5))
+    idle_timeout = float(os.getenv("FILE_PREVIEW_IDLE_TIMEOUT", 300))
+    idle = 0
+    try:
+        f = await asyncio.to_thread(open, file_info.file_path, "rb")
+    except FileNotFoundError:
+        # 查询记录之后、打开之前文件已提交（.partial 被删除），改为输出提交后的文件
+        current = await FileInfoOp.get_by_file_id(file_id=file_info.file_id)
+        if not current or current.status != 1:
+            return
+        try:
+            f = await asyncio.to_thread(open, current.file_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            async for chunk in _read_rest(f):
+                yield chunk
+        return
+    # 提交后 .partial 被删除，已打开的句柄仍可读完剩余内容
+    with f:
+        while True:
+            if chunk := await asyncio.to_thread(f.read, 64 * 1024):
+                idle = 0
+                yield chunk
+                continue
+            current = await FileInfoOp.get_by_file_id(file_id=file_info.file_id)
+            if not current or current.status != 0:
+                async for chunk in _read_rest(f):
+                    yield chunk
+                return
+            if idle >= idle_timeout:
+                return
+            await asyncio.sleep(poll_interval)
+            idle += poll_interval
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    accepted = set()
+    for item in accept_encoding.split(","):
+        encoding, _, params = item.strip().partition(";")
+        q = params.strip()[2:] if params.strip().startswith("q=") else "1"
+        try:
+            if float(q) > 0:
+                accepted.add(encoding.strip().lower())
+        except ValueError:
+            continue
+    return accepted
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if if_none_match := request.headers.get("if-none-match"):
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if if_modified_since := request.headers.get("if-modified-since"):
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _file_response(request: Request, file_info: FileInfo, filename: str, media_type: str = None,
+                   headers: dict = None) -> Response:
+    """带校验器的文件响应：强 ETag（内容 sha256）与 Last-Modified，条件请求返回 304，
+    客户端接受时直接发送上传时生成的 br / gzip 版本；Range 请求由 FileResponse 处理"""
+    stat = os.stat(file_info.file_path)
+    path = file_info.file_path
+    headers = {**(headers or {}), "Cache-Control": "no-cache"}
+    if file_info.content_hash:
+        etag = f'"{file_info.content_hash}"'
+        if variants := FileDB.variant_paths(file_info.content_hash):
+            headers["Vary"] = "Accept-Encoding"
+            accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+            for encoding in ("br", "gzip"):
+                if encoding in variants and encoding in accepted:
+                    path = variants[encoding]
+                    etag = f'"{file_info.content_hash}-{encoding}"'
+                    headers["Content-Encoding"] = encoding
+                    break
+    else:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers["ETag"] = etag
+    headers["Last-Modified"] = formatdate(stat.st_mtime, usegmt=True)
+    if _not_modified(request, etag, stat.st_mtime):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, filename=filename, media_type=media_type, headers=headers,
+                        stat_result=stat if path == file_info.file_path else os.stat(path))
+
+
+async def _serve_file(request: Request, file_info: FileInfo, filename: str, media_type: str = None,
+                      headers: dict = None) -> Response:
+    """缓存中的记录可能已被其它 worker 删除或替换：文件不存在时使缓存失效，按数据库重新查询一次，仍不存在时返回 404"""
+    try:
+        return _file_response(request, file_info, filename, media_type=media_type, headers=headers)
+    except FileNotFoundError:
+        FileInfoCache.invalidate(file_info.file_id)
+    file_info = await FileInfoOp.get_cached_by_file_id(file_id=file_info.file_id)
+    if file_info and file_info.status != 0:
+        try:
+            return _file_response(request, file_info, filename, media_type=media_type, headers=headers)
+        except FileNotFoundError:
+            FileInfoCache.invalidate(file_info.file_id)
+    return Response(content="File not found", status_code=404)
 
 
 @router.get("/download/{file_id}/{file_name}")
-async def download_file(file_id: str, file_name: str):
+async def download_file(request: Request, file_id: str, file_name: str):
     # TODO 目前 file_id 实际上是 request_id，后续统一修改
     file_id = get_file_id(file_id, file_name)
-    file_info = await FileInfoOp.get_by_file_id(file_id=file_id)
-    if not file_info or not os.path.exists(file_info.file_path):
+    file_info = await FileInfoOp.get_cached_by_file_id(file_id=file_id)
+    if not file_info:
         return Response(content="File not found", status_code=404)
-    return FileResponse(file_info.file_path, filename=os.path.basename(file_name))
+    return await _serve_file(request, file_info, filename=os.path.basename(file_name),
+                             media_type=mimetypes.guess_type(file_name)[0])
 
 
 @router.get("/preview/{file_id}/{file_name}")
-async def preview_file(file_id: str, file_name: str):
+async def preview_file(request: Request, file_id: str, file_name: str):
     # TODO 目前 file_id 实际上是 request_id，后续统一修改
     file_id = get_file_id(file_id, file_name)
-    file_info = await FileInfoOp.get_by_file_id(file_id=file_id)
-    if not file_info or not os.path.exists(file_info.file_path):
+    file_info = await FileInfoOp.get_cached_by_file_id(file_id=file_id)
+    if not file_info:
         return Response(content="File not found", status_code=404)
 
     disposition = "inline"
@@ -98,16 +236,39 @@ async def preview_file(file_id: str, file_name: str):
         disposition = "attachment"
 
     encoded_file_name = quote(file_name)
+    headers = {
+        "Content-Disposition": f"{disposition}; filename=\"{encoded_file_name}\"; filename*=UTF-8''{encoded_file_name}",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
+        "Access-Control-Allow-Headers": "Content-Type, Authorization",
+    }
+
+    # 生成中的文件以 chunked 方式边生成边输出
+    if file_info.status == 0 and file_info.file_path.endswith(".partial"):
+        return StreamingResponse(_tail_partial(file_info), media_type=content_type,
+                                 headers={**headers, "Cache-Control": "no-store"})
+
+    return await _serve_file(request, file_info, filename=os.path.basename(file_name), media_type=content_type,
+                             headers=headers)
 
-    return FileResponse(
-        file_info.file_path,
-        filename=os.path.basename(file_name),
-        media_type=content_type,
-        headers={
-            "Content-Disposition": f"{disposition}; filename=\"{encoded_file_name}\"; filename*=UTF-8''{encoded_file_name}",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "Content-Type, Authorization",
-        }
-    )
 
+
+@router.get("/preview_lines/{file_id}/{file_name}")
+async def preview_file_lines(file_id: str, file_name: str, start: int = 0, limit: int = 200):
+    """大文本 / CSV 分页预览：按行号返回 [start, start + limit) 的内容，首次访问时建立行索引"""
+    # TODO 目前 file_id 实际上是 request_id，后续统一修改
+    file_id = get_file_id(file_id, file_name)
+    file_info = await FileInfoOp.get_cached_by_file_id(file_id=file_id)
+    if not file_info:
+        return Response(content="File not found", status_code=404)
+    if file_info.status == 0:
+        return Response(content="File is being generated", status_code=409)
+    limit = min(max(limit, 0), int(os.getenv("FILE_PREVIEW_MAX_LINES", 5000)))
+    try:
+        result = await asyncio.to_thread(preview_lines, file_info, max(start, 0), limit)
+    except FileNotFoundError:
+        # 缓存的记录对应的文件已被其它 worker 删除或替换
+        FileInfoCache.invalidate(file_id)
+        return Response(content="File not found", status_code=404)
+    return JSONResponse(content={"fileName": file_info.filename, **result},
+                        headers={"Access-Control-Allow-Origin": "*"})
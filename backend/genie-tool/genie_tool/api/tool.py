@@ -7,17 +7,21 @@
 # =====================
 import json
 import os
-import time
+from dataclasses import asdict
+from typing import Any, Dict, List
 
 from fastapi import APIRouter
 from sse_starlette import ServerSentEvent, EventSourceResponse
 
 from genie_tool.model.code import ActionOutput, CodeOuput
-from genie_tool.model.protocal import CIRequest, ReportRequest, DeepSearchRequest
-from genie_tool.util.file_util import upload_file
-from genie_tool.tool.report import report
+from genie_tool.model.report import ReportProgress
+from genie_tool.model.protocal import CIRequest, ReportRequest, MultiReportRequest, DeepSearchRequest, StreamMode
+from genie_tool.util.file_util import upload_file, download_all_files, StreamingUpload
+from genie_tool.tool.report import report, report_cache_key, get_cached_report, put_cached_report, share_flatten_results
 from genie_tool.tool.code_interpreter import code_interpreter_agent
+from genie_tool.tool.final_answer_check import FinalCheckStats
 from genie_tool.util.middleware_util import RequestHandlerRoute
+from genie_tool.util.stream_util import coalesce_stream, merge_streams, HEARTBEAT
 from genie_tool.tool.deepsearch import DeepSearch
 
 router = APIRouter(route_class=RequestHandlerRoute)
@@ -27,25 +31,21 @@ router = APIRouter(route_class=RequestHandlerRoute)
 async def post_code_interpreter(
     body: CIRequest,
 ):
-     # 处理文件路径
-    if body.file_names:
-        for idx, f_name in enumerate(body.file_names):
-            if not f_name.startswith("/") and not f_name.startswith("http"):
-                body.file_names[idx] = f"{os.getenv('FILE_SERVER_URL')}/preview/{body.request_id}/{f_name}"
+    _resolve_file_names(body)
 
     async def _stream():
-        acc_content = ""
-        acc_token = 0
-        acc_time = time.time()
-        async for chunk in code_interpreter_agent(
-            task=body.task,
-            file_names=body.file_names,
-            request_id=body.request_id,
-            stream=True,
+        async for chunk in coalesce_stream(
+            code_interpreter_agent(
+                task=body.task,
+                file_names=body.file_names,
+                request_id=body.request_id,
+                stream=True,
+            ),
+            stream_mode=body.stream_mode,
         ):
-
-
-            if isinstance(chunk, CodeOuput):
+            if chunk is HEARTBEAT:
+                yield ServerSentEvent(data="heartbeat")
+            elif isinstance(chunk, CodeOuput):
                 yield ServerSentEvent(
                     data=json.dumps(
                         {
@@ -71,62 +71,15 @@ async def post_code_interpreter(
                 )
                 yield ServerSentEvent(data="[DONE]")
             else:
-                acc_content += chunk
-                acc_token += 1
-                if body.stream_mode.mode == "general":
-                    yield ServerSentEvent(
-                        data=json.dumps(
-                            {"requestId": body.request_id, "data": chunk, "isFinal": False},
-                            ensure_ascii=False,
-                        )
-                    )
-                elif body.stream_mode.mode == "token":
-                    if acc_token >= body.stream_mode.token:
-                        yield ServerSentEvent(
-                            data=json.dumps(
-                                {
-                                    "requestId": body.request_id,
-                                    "data": acc_content,
-                                    "isFinal": False,
-                                },
-                                ensure_ascii=False,
-                            )
-                        )
-                        acc_token = 0
-                        acc_content = ""
-                elif body.stream_mode.mode == "time":
-                    if time.time() - acc_time > body.stream_mode.time:
-                        yield ServerSentEvent(
-                            data=json.dumps(
-                                {
-                                    "requestId": body.request_id,
-                                    "data": acc_content,
-                                    "isFinal": False,
-                                },
-                                ensure_ascii=False,
-                            )
-                        )
-                        acc_time = time.time()
-                        acc_content = ""
-                if body.stream_mode.mode in ["time", "token"] and acc_content:
-                    yield ServerSentEvent(
-                        data=json.dumps(
-                            {
-                                "requestId": body.request_id,
-                                "data": acc_content,
-                                "isFinal": False,
-                            },
-                            ensure_ascii=False,
-                        )
+                yield ServerSentEvent(
+                    data=json.dumps(
+                        {"requestId": body.request_id, "data": chunk, "isFinal": False},
+                        ensure_ascii=False,
                     )
-            
+                )
 
     if body.stream:
-        return EventSourceResponse(
-            _stream(),
-            ping_message_factory=lambda: ServerSentEvent(data="heartbeat"),
-            ping=15,
-        )
+        return EventSourceResponse(_stream())
     else:
         content = ""
         async for chunk in code_interpreter_agent(
@@ -151,105 +104,133 @@ async def post_code_interpreter(
         }
 
 
-@router.post("/report")
-async def post_report(
-    body: ReportRequest,
-):
+@router.get("/code_interpreter_stats")
+async def code_interpreter_stats():
+    """本进程代码解释器终止判断的决策来源计数，llm_calls_saved 为省去的 LLM 判断次数"""
+    return FinalCheckStats.snapshot()
+
+
+def _resolve_file_names(body: CIRequest):
     # 处理文件路径
     if body.file_names:
         for idx, f_name in enumerate(body.file_names):
             if not f_name.startswith("/") and not f_name.startswith("http"):
                 body.file_names[idx] = f"{os.getenv('FILE_SERVER_URL')}/preview/{body.request_id}/{f_name}"
-    
-    def _parser_html_content(content: str):
-        if content.startswith("```\nhtml"):
-            content = content[len("```\nhtml"): ]
-        if content.startswith("```html"):
-            content = content[len("```html"): ]
-        if content.endswith("```"):
-            content = content[: -3]
-        return content
 
-    async def _stream():
-        content = ""
-        acc_content = ""
-        acc_token = 0
-        acc_time = time.time()
-        async for chunk in report(
-            task=body.task,
-            file_names=body.file_names,
-            file_type=body.file_type,
+
+def _parser_html_content(content: str):
+    if content.startswith("```\nhtml"):
+        content = content[len("```\nhtml"): ]
+    if content.startswith("```html"):
+        content = content[len("```html"): ]
+    if content.endswith("```"):
+        content = content[: -3]
+    return content
+
+
+async def _report_events(body: ReportRequest, file_type: str, file_name: str, files: List[Dict[str, Any]]):
+    """单个格式的报告生成事件流，产出 HEARTBEAT 或事件 dict（不含 requestId）
+
+    缓存命中时直接输出缓存内容；否则边生成边落盘，结束后原子提交并写入缓存，最后一个事件 isFinal=True
+    """
+    writer = StreamingUpload(file_name=file_name, request_id=body.request_id,
+                             file_type="html" if file_type == "ppt" else file_type)
+    cache_key = await report_cache_key(body.task, file_type, files)
+    if body.use_cache and (cached := await get_cached_report(
+            cache_key, file_name=writer.file_name, file_type=writer.file_type, request_id=body.request_id)):
+        content, file_info = cached
+        yield {"data": content, "isFinal": False}
+        yield {"data": content, "fileInfo": file_info, "isFinal": True}
+        return
+    try:
+        # 本机文件服务时先返回预览地址，生成过程中即可预览
+        if preview := await writer.start():
+            yield {"data": "", "fileInfo": [preview], "isFinal": False}
+        async for chunk in coalesce_stream(
+            report(
+                task=body.task,
+                file_type=file_type,
+                files=files,
+            ),
+            stream_mode=body.stream_mode,
         ):
-            content += chunk
-            acc_content += chunk
-            acc_token += 1
-            if body.stream_mode.mode == "general":
-                yield ServerSentEvent(
-                    data=json.dumps(
-                        {"requestId": body.request_id, "data": chunk, "isFinal": False},
-                        ensure_ascii=False,
-                    )
-                )
-            elif body.stream_mode.mode == "token":
-                if acc_token >= body.stream_mode.token:
-                    yield ServerSentEvent(
-                        data=json.dumps(
-                            {
-                                "requestId": body.request_id,
-                                "data": acc_content,
-                                "isFinal": False,
-                            },
-                            ensure_ascii=False,
-                        )
-                    )
-                    acc_token = 0
-                    acc_content = ""
-            elif body.stream_mode.mode == "time":
-                if time.time() - acc_time > body.stream_mode.time:
-                    yield ServerSentEvent(
-                        data=json.dumps(
-                            {
-                                "requestId": body.request_id,
-                                "data": acc_content,
-                                "isFinal": False,
-                            },
-                            ensure_ascii=False,
-                        )
-                    )
-                    acc_time = time.time()
-                    acc_content = ""
-        if body.stream_mode.mode in ["time", "token"] and acc_content:
-            yield ServerSentEvent(
-                data=json.dumps({"requestId": body.request_id, "data": acc_content, "isFinal": False},
-                                ensure_ascii=False))
-        if body.file_type in ["ppt", "html"]:
+            if chunk is HEARTBEAT:
+                yield chunk
+            elif isinstance(chunk, ReportProgress):
+                yield {"data": "", "progress": asdict(chunk), "isFinal": False}
+            else:
+                await writer.write(chunk)
+                yield {"data": chunk, "isFinal": False}
+        content = await writer.read()
+        if file_type in ["ppt", "html"]:
             content = _parser_html_content(content)
-        file_info = [await upload_file(content=content, file_name=body.file_name, request_id=body.request_id,
-                                 file_type="html" if body.file_type == "ppt" else body.file_type)]
-        yield ServerSentEvent(data=json.dumps(
-            {"requestId": body.request_id, "data": content, "fileInfo": file_info,
-             "isFinal": True}, ensure_ascii=False))
+        file_info = [await writer.commit(content)]
+    except BaseException:
+        await writer.abort()
+        raise
+    await put_cached_report(cache_key, content, file_info, file_name=writer.file_name, request_id=body.request_id)
+    yield {"data": content, "fileInfo": file_info, "isFinal": True}
+
+
+@router.post("/report")
+async def post_report(
+    body: ReportRequest,
+):
+    _resolve_file_names(body)
+
+    async def _stream():
+        files = await download_all_files(body.file_names)
+        async for event in _report_events(body, body.file_type, body.file_name, files):
+            if event is HEARTBEAT:
+                yield ServerSentEvent(data="heartbeat")
+            else:
+                yield ServerSentEvent(data=json.dumps({"requestId": body.request_id, **event}, ensure_ascii=False))
         yield ServerSentEvent(data="[DONE]")
 
     if body.stream:
-        return EventSourceResponse(
-            _stream(),
-            ping_message_factory=lambda: ServerSentEvent(data="heartbeat"),
-            ping=15,
-        )
+        return EventSourceResponse(_stream())
     else:
-        content = ""
-        async for chunk in report(
-            task=body.task,
-            file_names=body.file_names,
-            file_type=body.file_type,
-        ):
-            content += chunk
-        if body.file_type in ["ppt", "html"]:
-            content = _parser_html_content(content)
-        file_info = [await upload_file(content=content, file_name=body.file_name, request_id=body.request_id,
-                                 file_type="html" if body.file_type == "ppt" else body.file_type)]
-        return {"code": 200, "data": content, "fileInfo": file_info, "requestId": body.request_id}
+        files = await download_all_files(body.file_names)
+        async for event in _report_events(body, body.file_type, body.file_name, files):
+            if event is not HEARTBEAT and event["isFinal"]:
+                return {"code": 200, "data": event["data"], "fileInfo": event["fileInfo"], "requestId": body.request_id}
+
+
+@router.post("/report_multi")
+async def post_report_multi(
+    body: MultiReportRequest,
+):
+    """一次请求生成多种格式的报告：输入文件只下载、解析一次，各格式并发生成，SSE 事件以 fileType 区分"""
+    _resolve_file_names(body)
+    file_types = list(dict.fromkeys(body.file_types))
+    # html 与 ppt 都输出 .html 文件，同时请求时 ppt 文件名加后缀区分
+    file_names = {ft: f"{body.file_name}_ppt" if ft == "ppt" and "html" in file_types else body.file_name
+                  for ft in file_types}
+
+    async def _events(files):
+        async for idx, event in merge_streams(
+                [_report_events(body, ft, file_names[ft], files) for ft in file_types]):
+            yield file_types[idx], event
+
+    async def _stream():
+        files = share_flatten_results(await download_all_files(body.file_names))
+        async for file_type, event in _events(files):
+            if event is HEARTBEAT:
+                yield ServerSentEvent(data="heartbeat")
+            else:
+                yield ServerSentEvent(data=json.dumps(
+                    {"requestId": body.request_id, "fileType": file_type, **event}, ensure_ascii=False))
+        yield ServerSentEvent(data="[DONE]")
+
+    if body.stream:
+        return EventSourceResponse(_stream())
+    else:
+        files = share_flatten_results(await download_all_files(body.file_names))
+        results = {}
+        async for file_type, event in _events(files):
+            if event is not HEARTBEAT and event["isFinal"]:
+                results[file_type] = {"fileType": file_type, "data": event["data"], "fileInfo": event["fileInfo"]}
+        return {"code": 200, "data": [results[ft] for ft in file_types], "requestId": body.request_id}
 
 
 @router.post("/deepsearch")
@@ -259,15 +240,19 @@ async def post_deepsearch(
     """深度搜索端点"""
     deepsearch = DeepSearch(engines=body.search_engines)
     async def _stream():
-        async for chunk in deepsearch.run(
-                query=body.query,
-                request_id=body.request_id,
-                max_loop=body.max_loop,
-                stream=True,
-                stream_mode=body.stream_mode,
+        # run 内部已按 stream_mode 合并答案，这里只透传事件并补充心跳
+        async for chunk in coalesce_stream(
+                deepsearch.run(
+                    query=body.query,
+                    request_id=body.request_id,
+                    max_loop=body.max_loop,
+                    stream=True,
+                    stream_mode=body.stream_mode,
+                ),
+                stream_mode=StreamMode(mode="general"),
         ):
-            yield ServerSentEvent(data=chunk)
+            yield ServerSentEvent(data="heartbeat" if chunk is HEARTBEAT else chunk)
         yield ServerSentEvent(data="[DONE]")
 
-    return EventSourceResponse(_stream(), ping_message_factory=lambda: ServerSentEvent(data="heartbeat"), ping=15)
+    return EventSourceResponse(_stream())
 
@@ -9,7 +9,7 @@ import os
 from typing import Callable, AsyncGenerator
 
 from loguru import logger
-from sqlalchemy import AsyncAdaptedQueuePool, create_engine
+from sqlalchemy import AsyncAdaptedQueuePool, create_engine, event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel
@@ -17,16 +17,37 @@ from sqlmodel import SQLModel
 
 SQLITE_DB_PATH = os.environ.get("SQLITE_DB_PATH", "autobots.db")
 
-engine = create_engine(f"sqlite:///{SQLITE_DB_PATH}", echo=True)
+SQLITE_ECHO = os.environ.get("SQLITE_ECHO", "false") == "true"
+
+# WAL 下读写互不阻塞；synchronous=NORMAL 在 WAL 下只在 checkpoint 时 fsync，进程崩溃不丢数据
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": os.environ.get("SQLITE_BUSY_TIMEOUT", "5000"),
+    "cache_size": "-65536",
+    "temp_store": "MEMORY",
+    "mmap_size": str(256 * 1024 * 1024),
+}
+
+engine = create_engine(f"sqlite:///{SQLITE_DB_PATH}", echo=SQLITE_ECHO)
 
 async_engine = create_async_engine(
     f"sqlite+aiosqlite:///{SQLITE_DB_PATH}",
     poolclass=AsyncAdaptedQueuePool,
     pool_size=10,
     pool_recycle=3600,
-    echo=False,
+    echo=SQLITE_ECHO,
 )
 
+
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for key, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {key}={value}")
+    cursor.close()
+
 async_session_local: Callable[..., AsyncSession] = sessionmaker(bind=async_engine, class_=AsyncSession)
 
 
@@ -36,9 +57,36 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+# 已有数据库缺少的列：(表名, 列名, 列定义)
+_ADDED_COLUMNS = [
+    ("fileinfo", "content_hash", "VARCHAR"),
+]
+
+
+def _migrate(conn):
+    for table, column, definition in _ADDED_COLUMNS:
+        columns = [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")]
+        if columns and column not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"DB migrate: add column {table}.{column}")
+    # create_all 不会给已有表补建索引
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+
 def init_db():
     from genie_tool.db.file_table import FileInfo
+    from genie_tool.db.report_table import ReportCache
+    from genie_tool.db.file_chunk_op import create_file_chunk_tables
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        _migrate(conn)
+    try:
+        with engine.begin() as conn:
+            create_file_chunk_tables(conn)
+    except Exception as e:
+        logger.warning(f"file_chunk fts5 index unavailable: {e}")
     logger.info(f"DB init done")
 
 
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/9
+# =====================
+import asyncio
+import json
+import os
+import re
+from typing import List, Dict, Any
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from genie_tool.db.db_engine import async_session_local
+from genie_tool.util.log_util import timer
+
+
+# trigram 分词支持中文子串检索，需要 SQLite >= 3.34
+CREATE_FILE_CHUNK_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS file_chunk USING fts5(
+    content, title UNINDEXED, link UNINDEXED, file_id UNINDEXED, request_id UNINDEXED, chunk_idx UNINDEXED,
+    tokenize='trigram'
+)
+"""
+# FTS5 的 UNINDEXED 列不能走索引，按 file_id 删除会扫描全部切片；
+# 一个文件的切片在同一事务中连续插入，rowid 连续，记录其 rowid 区间后按 rowid 删除
+CREATE_FILE_CHUNK_RANGE_SQL = """
+CREATE TABLE IF NOT EXISTS file_chunk_range (
+    file_id VARCHAR PRIMARY KEY, first_rowid INTEGER NOT NULL, last_rowid INTEGER NOT NULL
+)
+"""
+
+
+def create_file_chunk_tables(conn):
+    """建切片索引表；区间表新建时按已有切片补齐区间"""
+    conn.exec_driver_sql(CREATE_FILE_CHUNK_SQL)
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'file_chunk_range'").first()
+    conn.exec_driver_sql(CREATE_FILE_CHUNK_RANGE_SQL)
+    if not exists:
+        conn.exec_driver_sql(
+            "INSERT OR IGNORE INTO file_chunk_range (file_id, first_rowid, last_rowid) "
+            "SELECT file_id, min(rowid), max(rowid) FROM file_chunk WHERE file_id IS NOT NULL GROUP BY file_id")
+
+_TEXT_EXTENSIONS = ("md", "txt", "csv", "html", "htm", "json", "xml", "py", "log")
+
+
+def split_chunks(content: str, chunk_size: int) -> List[str]:
+    """按 chunk_size 切分文本，尽量在后半段的换行处断开"""
+    chunks = []
+    start = 0
+    while start < len(content):
+        end = min(start + chunk_size, len(content))
+        if end < len(content) and (newline := content.rfind("\n", start + chunk_size // 2, end)) > 0:
+            end = newline + 1
+        chunks.append(content[start:end])
+        start = end
+    return chunks
+
+
+def build_match_query(query: str, max_terms: int = 64) -> str:
+    """把任务描述转换为 FTS5 查询：英文数字词与中文三字片段（trigram）取 OR，按 bm25 排序"""
+    terms = []
+    for word in re.findall(r"[A-Za-z0-9_]{3,}|[一-鿿]+", query):
+        if len(word) <= 3 or word.isascii():
+            terms.append(word)
+        else:
+            terms.extend(word[i: i + 3] for i in range(len(word) - 2))
+    terms = list(dict.fromkeys(t.replace('"', '') for t in terms))[:max_terms]
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+class FileChunkOp(object):
+    """上传时把文本类文件切片写入 SQLite FTS5 全文索引，报告生成时按任务检索相关片段"""
+    _ready = None
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return os.getenv("FILE_CHUNK_INDEX", "true") == "true" and cls._ready is not False
+
+    @classmethod
+    async def _ensure_table(cls, session) -> bool:
+        if cls._ready is None:
+            try:
+                await session.run_sync(lambda s: create_file_chunk_tables(s.connection()))
+                await session.commit()
+                cls._ready = True
+            except Exception as e:
+                await session.rollback()
+                if cls._unsupported(e):
+                    logger.warning(f"file_chunk fts5 index unavailable: {e}")
+                    cls._ready = False
+                else:
+                    # 锁等待超时等临时错误，下次调用时重试
+                    logger.warning(f"file_chunk create table failed, will retry: {e}")
+                    return False
+        return cls._ready
+
+    @staticmethod
+    def _unsupported(error: Exception) -> bool:
+        """SQLite 未编译 FTS5 或不支持 trigram 分词"""
+        message = str(error).lower()
+        return isinstance(error, OperationalError) and ("no such module" in message or "tokenizer" in message)
+
+    @staticmethod
+    def _docs(filename: str, content: str) -> List[Dict[str, Any]]:
+        # 搜索结果文件为 json，按文档切分并保留标题与链接
+        if filename.endswith("_search_result.txt"):
+            try:
+                return [{"title": d.get("title"), "link": d.get("link"), "content": d.get("content") or ""}
+                        for docs in json.loads(content).values() for d in docs]
+            except Exception as e:
+                logger.warning(f"file_chunk parser search file [{filename}] error: {e}")
+        return [{"title": os.path.basename(filename), "link": None, "content": content}]
+
+    @classmethod
+    def _rows(cls, file_id: str, filename: str, content: str, request_id: str = None) -> List[Dict[str, Any]]:
+        chunk_size = int(os.getenv("FILE_CHUNK_SIZE", 1000))
+        rows = []
+        for doc in cls._docs(filename, content):
+            for chunk in split_chunks(doc["content"], chunk_size):
+                rows.append({"content": chunk, "title": doc["title"], "link": doc["link"], "file_id": file_id,
+                             "request_id": request_id, "chunk_idx": len(rows)})
+        return rows
+
+    @classmethod
+    def _read_rows(cls, file_id: str, filename: str, file_path: str, request_id: str = None) -> List[Dict[str, Any]]:
+        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+            return cls._rows(file_id, filename, f.read(), request_id=request_id)
+
+    @staticmethod
+    def _indexable(filename: str) -> bool:
+        return FileChunkOp.enabled() and filename.rsplit(".", 1)[-1].lower() in _TEXT_EXTENSIONS
+
+    @staticmethod
+    async def _delete_chunks(session, file_ids: List[str]):
+        """按 rowid 区间删除文件的切片"""
+        params = {f"f{i}": f for i, f in enumerate(file_ids)}
+        in_clause = ", ".join(":" + k for k in params)
+        ranges = (await session.execute(text(
+            f"SELECT first_rowid, last_rowid FROM file_chunk_range WHERE file_id IN ({in_clause})"), params)).all()
+        if ranges:
+            await session.execute(text("DELETE FROM file_chunk WHERE rowid BETWEEN :first AND :last"),
+                                  [{"first": first, "last": last} for first, last in ranges])
+            await session.execute(text(f"DELETE FROM file_chunk_range WHERE file_id IN ({in_clause})"), params)
+
+    @classmethod
+    async def _write(cls, file_id: str, rows: List[Dict[str, Any]]) -> int:
+        async with async_session_local() as session:
+            if not await cls._ensure_table(session):
+                return 0
+            await cls._delete_chunks(session, [file_id])
+            if rows:
+                await session.execute(text(
+                    "INSERT INTO file_chunk (content, title, link, file_id, request_id, chunk_idx) "
+                    "VALUES (:content, :title, :link, :file_id, :request_id, :chunk_idx)"), rows)
+                # 事务持有写锁，本次插入的 rowid 连续
+                last = (await session.execute(text("SELECT last_insert_rowid()"))).scalar_one()
+                await session.execute(text(
+                    "INSERT INTO file_chunk_range (file_id, first_rowid, last_rowid) VALUES (:file_id, :first, :last)"),
+                    {"file_id": file_id, "first": last - len(rows) + 1, "last": last})
+            await session.commit()
+        return len(rows)
+
+    @classmethod
+    @timer()
+    async def index(cls, file_id: str, filename: str, content: str, request_id: str = None) -> int:
+        """重建一个文件的切片索引，返回切片数；非文本类文件跳过；切分在线程池中执行"""
+        if not cls._indexable(filename):
+            return 0
+        rows = await asyncio.to_thread(cls._rows, file_id, filename, content, request_id)
+        return await cls._write(file_id, rows)
+
+    @classmethod
+    @timer()
+    async def index_path(cls, file_id: str, filename: str, file_path: str, request_id: str = None) -> int:
+        if not cls._indexable(filename) \
+                or os.path.getsize(file_path) > int(os.getenv("FILE_CHUNK_INDEX_MAX_SIZE", 20 * 1024 * 1024)):
+            return 0
+        rows = await asyncio.to_thread(cls._read_rows, file_id, filename, file_path, request_id)
+        return await cls._write(file_id, rows)
+
+    @classmethod
+    @timer()
+    async def delete(cls, file_ids: List[str]) -> None:
+        if cls._ready is False or not file_ids:
+            return
+        async with async_session_local() as session:
+            if not await cls._ensure_table(session):
+                return
+            await cls._delete_chunks(session, file_ids)
+            await session.commit()
+
+    @classmethod
+    @timer()
+    async def search(cls, file_ids: List[str], query: str, limit: int = 200) -> List[Dict[str, Any]]:
+        """在指定文件内按相关度检索切片，返回按 bm25 排序的切片列表"""
+        match = build_match_query(query)
+        if not cls.enabled() or not file_ids or not match:
+            return []
+        params = {f"f{i}": f for i, f in enumerate(file_ids)}
+        state = text(
+            f"SELECT file_id, chunk_idx, title, link, content FROM file_chunk "
+            f"WHERE file_chunk MATCH :match AND file_id IN ({', '.join(':' + k for k in params)}) "
+            f"ORDER BY bm25(file_chunk) LIMIT :limit")
+        async with async_session_local() as session:
+            if not await cls._ensure_table(session):
+                return []
+            result = await session.execute(state, {"match": match, "limit": limit, **params})
+            return [dict(row._mapping) for row in result]
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/9
+# =====================
+import asyncio
+import fcntl
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import and_, or_
+from sqlmodel import select, func
+
+from genie_tool.db.db_engine import engine, async_session_local, SQLITE_DB_PATH
+from genie_tool.db.file_chunk_op import FileChunkOp
+from genie_tool.db.file_table import FileInfo
+from genie_tool.db.file_table_op import FileDB, FileInfoOp
+from genie_tool.db.report_table_op import ReportCacheOp
+
+
+class _FileRetention(object):
+    """存储后台维护：按保留期与容量上限分批清理文件，低峰期整理数据库
+
+    - FILE_RETENTION_DAYS：已完成文件（status=1）的保留天数，0 不按时间清理
+    - FILE_RETENTION_INCOMPLETE_DAYS：生成中 / 中断文件（status=0/2）的保留天数
+    - FILE_RETENTION_MAX_SIZE：文件去重后的总字节数上限，超出时从最早的文件开始清理，0 不限制
+    - FILE_GC_INTERVAL / FILE_GC_BATCH_SIZE：清理间隔（秒）与每批条数
+    - FILE_GC_VACUUM_HOURS：整理数据库、回收孤立 blob 的时段（本地小时，如 3-5），每天最多一次
+    多 worker 时以文件锁保证同一时刻只有一个进程执行清理。
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, Any] = {"runs": 0, "deleted_files": 0, "reclaimed_bytes": 0, "last_run": None}
+        self._task: Optional[asyncio.Task] = None
+        self._last_vacuum_day = None
+
+    @staticmethod
+    def _config() -> Dict[str, Any]:
+        return {
+            "retention_days": float(os.getenv("FILE_RETENTION_DAYS", 30)),
+            "incomplete_days": float(os.getenv("FILE_RETENTION_INCOMPLETE_DAYS", 3)),
+            "max_size": int(os.getenv("FILE_RETENTION_MAX_SIZE", 0)),
+            "batch_size": int(os.getenv("FILE_GC_BATCH_SIZE", 500)),
+            "vacuum_hours": os.getenv("FILE_GC_VACUUM_HOURS", "3-5"),
+        }
+
+    @staticmethod
+    async def _expired_batch(retention_days: float, incomplete_days: float, batch_size: int) -> List[FileInfo]:
+        # create_time 由 SQLite CURRENT_TIMESTAMP 写入，为 UTC 时间
+        now = datetime.utcnow()
+        conditions = []
+        if retention_days > 0:
+            conditions.append(and_(FileInfo.status == 1, FileInfo.create_time < now - timedelta(days=retention_days)))
+        if incomplete_days > 0:
+            conditions.append(and_(FileInfo.status != 1, FileInfo.create_time < now - timedelta(days=incomplete_days)))
+        if not conditions:
+            return []
+        async with async_session_local() as session:
+            state = select(FileInfo).where(or_(*conditions)).order_by(FileInfo.create_time).limit(batch_size)
+            return (await session.execute(state)).scalars().all()
+
+    @staticmethod
+    async def _stored_size() -> int:
+        """去重后的存储字节数：同一内容只计一次"""
+        async with async_session_local() as session:
+            unique = select(func.max(FileInfo.file_size).label("size")) \
+                .group_by(func.coalesce(FileInfo.content_hash, FileInfo.file_path)).subquery()
+            return (await session.execute(select(func.coalesce(func.sum(unique.c.size), 0)))).scalar_one()
+
+    @staticmethod
+    async def _oldest_batch(batch_size: int) -> List[FileInfo]:
+        async with async_session_local() as session:
+            state = select(FileInfo).where(FileInfo.status != 0).order_by(FileInfo.create_time).limit(batch_size)
+            return (await session.execute(state)).scalars().all()
+
+    async def _delete(self, file_infos: List[FileInfo], result: Dict[str, Any]):
+        result["deleted_files"] += len(file_infos)
+        result["reclaimed_bytes"] += await FileInfoOp.delete_batch(file_infos)
+        await FileDB.remove_empty_scopes(list({f.request_id for f in file_infos}))
+        # 让出事件循环，避免长时间清理影响请求
+        await asyncio.sleep(0)
+
+    @staticmethod
+    def _in_vacuum_window(hours: str) -> bool:
+        try:
+            start, end = [int(h) for h in hours.split("-")]
+        except ValueError:
+            return False
+        hour = datetime.now().hour
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    @staticmethod
+    def _vacuum() -> int:
+        """整理 FTS 索引、VACUUM 并截断 WAL，返回数据库文件减少的字节数"""
+        def _size():
+            return sum(os.path.getsize(p) for p in (SQLITE_DB_PATH, f"{SQLITE_DB_PATH}-wal") if os.path.exists(p))
+
+        before = _size()
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if FileChunkOp.enabled():
+                try:
+                    conn.exec_driver_sql("INSERT INTO file_chunk(file_chunk) VALUES('optimize')")
+                except Exception as e:
+                    logger.warning(f"file_chunk optimize failed: {e}")
+            conn.exec_driver_sql("VACUUM")
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.exec_driver_sql("PRAGMA optimize")
+        return before - _size()
+
+    async def run_once(self, force_vacuum: bool = False) -> Dict[str, Any]:
+        """执行一轮清理，返回本轮指标"""
+        config = self._config()
+        start = time.perf_counter()
+        result = {"deleted_files": 0, "reclaimed_bytes": 0, "orphan_blobs": 0, "vacuum_bytes": 0}
+        while batch := await self._expired_batch(config["retention_days"], config["incomplete_days"],
+                                                 config["batch_size"]):
+            await self._delete(batch, result)
+        if config["max_size"] > 0:
+            while (excess := await self._stored_size() - config["max_size"]) > 0 \
+                    and (batch := await self._oldest_batch(config["batch_size"])):
+                # 只删除最早的、足以抵消超出部分的文件
+                selected, size = [], 0
+                for f in batch:
+                    if size >= excess:
+                        break
+                    selected.append(f)
+                    size += f.file_size or 0
+                await self._delete(selected, result)
+        if ttl := int(os.getenv("REPORT_CACHE_TTL", 0)):
+            await ReportCacheOp.delete_expired(ttl=ttl)
+
+        today = datetime.now().date()
+        if force_vacuum or (self._in_vacuum_window(config["vacuum_hours"]) and self._last_vacuum_day != today):
+            self._last_vacuum_day = today
+            # 不支持硬链接时按文件记录判断 blob 是否仍被引用
+            referenced = None if FileDB.hardlinks else await FileInfoOp.get_content_hashes()
+            result["orphan_blobs"], orphan_bytes = await FileDB.sweep_blobs(referenced=referenced)
+            result["reclaimed_bytes"] += orphan_bytes
+            result["vacuum_bytes"] = await asyncio.to_thread(self._vacuum)
+
+        result["cost_ms"] = int((time.perf_counter() - start) * 1000)
+        self.stats["runs"] += 1
+        self.stats["deleted_files"] += result["deleted_files"]
+        self.stats["reclaimed_bytes"] += result["reclaimed_bytes"]
+        self.stats["last_run"] = {"time": datetime.now().isoformat(timespec="seconds"), **result}
+        logger.info("file gc deleted_files={} reclaimed_bytes={} orphan_blobs={} vacuum_bytes={} cost={} ms",
+                    result["deleted_files"], result["reclaimed_bytes"], result["orphan_blobs"],
+                    result["vacuum_bytes"], result["cost_ms"])
+        return result
+
+    async def _loop(self, interval: float):
+        lock_path = os.path.join(FileDB.work_dir, ".gc.lock")
+        while True:
+            try:
+                with open(lock_path, "w") as lock:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        logger.debug("file gc skipped: running in another worker")
+                    else:
+                        await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"file gc failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self):
+        """启动后台清理任务，FILE_GC_INTERVAL<=0 时不启动"""
+        interval = float(os.getenv("FILE_GC_INTERVAL", 3600))
+        if interval > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop(interval))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+FileRetention = _FileRetention()
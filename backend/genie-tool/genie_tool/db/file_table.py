@@ -19,8 +19,9 @@ class FileInfo(SQLModel, table=True):
     file_path: str = Field()
     description: Optional[str]
     file_size: Optional[int]
-    status: int = Field(default=0)
-    request_id: Optional[str] = Field(default=None)
+    content_hash: Optional[str] = Field(default=None)     # 内容 sha256，对应存储中的 blob
+    status: int = Field(default=0)     # 0 生成中 1 已完成 2 生成中断（保留已生成部分）
+    request_id: Optional[str] = Field(default=None, index=True)
     create_time: Optional[datetime] = Field(
-        sa_type=DateTime, default=None, nullable=False,  sa_column_kwargs={"server_default": text("CURRENT_TIMESTAMP")}
+        sa_type=DateTime, default=None, nullable=False, index=True, sa_column_kwargs={"server_default": text("CURRENT_TIMESTAMP")}
     )
\ No newline at end of file
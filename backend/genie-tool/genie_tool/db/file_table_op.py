@@ -1,21 +1,98 @@
+import asyncio
+import gzip
+import hashlib
 import os
-from typing import List
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
 
 from fastapi import UploadFile
-from sqlmodel import select
+from loguru import logger
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select, delete, func, update
 
 from genie_tool.db.file_table import FileInfo
+from genie_tool.db.file_chunk_op import FileChunkOp
 from genie_tool.db.db_engine import async_session_local
 from genie_tool.util.log_util import timer
+from genie_tool.util.table_util import COLUMNAR_SUFFIX, build_columnar, file_extension
+
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+_WRITE_CHUNK_SIZE = 1024 * 1024
+
+# 上传时预压缩的文本类文件，压缩版本与 blob 同目录存放：{sha256}.br / {sha256}.gz
+_COMPRESSIBLE_EXTENSIONS = ("md", "txt", "csv", "html", "htm", "json", "xml", "js", "css", "svg", "py", "log")
+_ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# blob 的派生文件，随 blob 一起删除
+LINE_INDEX_SUFFIX = ".lines"
+_SIDECAR_SUFFIXES = (*_ENCODING_SUFFIXES.values(), LINE_INDEX_SUFFIX, COLUMNAR_SUFFIX)
+
+
+class FileTooLargeError(Exception):
+    pass
+
+
+# 同一 file_id 再次写入时更新的列
+_UPSERT_COLUMNS = ("status", "file_size", "file_path", "content_hash")
+
+
+def _upload_max_size() -> int:
+    return int(os.getenv("FILE_UPLOAD_MAX_SIZE", str(100 * 1024 * 1024)))
+
+
+def _tmp_path(file_path: str) -> str:
+    # 每次写入独立的临时文件，并发写同一文件时互不覆盖，后 rename 的版本生效
+    return f"{file_path}.{uuid.uuid4().hex}.tmp"
 
 
 class _FileDB(object):
+    """按内容寻址的文件存储
+
+    内容按 sha256 只存一份于 {FILE_SAVE_PATH}/.blobs/ab/abcd...，各请求下的文件名是指向 blob 的硬链接，
+    相同内容重复保存时不再写盘。硬链接数即引用计数：删除文件名后 blob 只剩自身一个链接时才删除 blob。
+    blob 设为只读，避免通过某个文件名原地修改影响其它引用。
+    文件系统不支持硬链接时文件名是 blob 的拷贝，链接数不再代表引用数：不按链接数释放 blob，
+    由定期清理按文件记录的 content_hash 回收无引用的 blob。
+    """
+
     def __init__(self):
         self._work_dir = os.getenv("FILE_SAVE_PATH", "file_db_dir")
         if not os.path.exists(self._work_dir):
             os.makedirs(self._work_dir)
+        self._hardlinks = self._probe_hardlinks()
+
+    @property
+    def hardlinks(self) -> bool:
+        """存储目录是否支持硬链接"""
+        return self._hardlinks
+
+    def _probe_hardlinks(self) -> bool:
+        probe = os.path.join(self._work_dir, f".link-probe-{uuid.uuid4().hex}")
+        try:
+            open(probe, "w").close()
+            os.link(probe, probe + ".link")
+            return True
+        except OSError as e:
+            logger.warning(f"{self._work_dir} does not support hard links, files are stored as copies: {e}")
+            return False
+        finally:
+            for path in (probe, probe + ".link"):
+                if os.path.exists(path):
+                    os.remove(path)
 
-    async def save(self, file_name, content, scope) -> str:
+    @property
+    def work_dir(self) -> str:
+        return self._work_dir
+
+    def _scope_path(self, file_name, scope) -> str:
         if "." in file_name:
             file_name = os.path.basename(file_name)
         else:
@@ -24,70 +101,514 @@ class _FileDB(object):
         save_path = os.path.join(self._work_dir, scope)
         if not os.path.exists(save_path):
             os.makedirs(save_path)
-        with open(f"{save_path}/{file_name}", "w") as f:
-            f.write(content)
         return f"{save_path}/{file_name}"
-    
-    async def save_by_data(self, file: UploadFile) -> str:
-        file_name = file.filename
-        file_data = file.file.read()
-        save_path = os.path.join(self._work_dir, file_name)
-        with open(save_path, "wb") as f:
-             f.write(file_data)
-        return save_path
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self._work_dir, ".blobs", digest[:2], digest)
+
+    def _place(self, src_path: str, blob_path: str):
+        """把已写好的临时文件放到 blob 位置，blob 已存在时抛出 FileExistsError"""
+        if self._hardlinks:
+            os.link(src_path, blob_path)
+        else:
+            with open(src_path, "rb") as rf, open(blob_path, "xb") as wf:
+                shutil.copyfileobj(rf, wf, _WRITE_CHUNK_SIZE)
+
+    @staticmethod
+    def _write_atomic(file_path: str, data: bytes):
+        tmp_path = _tmp_path(file_path)
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _link_blob(self, blob_path: str, file_path: str, displaced: Optional[str] = None):
+        """file_path 原子地指向 blob；已指向同一 blob 时直接返回，blob 不存在时抛出 FileNotFoundError
+
+        displaced 为 file_path 原内容的 sha256（取自文件记录的 content_hash），替换后该 blob 无其它引用时释放
+        """
+        if os.path.exists(file_path):
+            if os.path.samefile(blob_path, file_path):
+                return
+        else:
+            displaced = None
+        tmp_path = _tmp_path(file_path)
+        if self._hardlinks:
+            os.link(blob_path, tmp_path)
+        else:
+            shutil.copyfile(blob_path, tmp_path)
+        try:
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        if displaced and displaced != os.path.basename(blob_path):
+            self._release(displaced)
+
+    def _store(self, digest: str, file_path: str, write_blob: Callable[[str], None], displaced: Optional[str] = None):
+        """blob 不存在时用 write_blob 写入，再把 file_path 链接到 blob；blob 被并发释放时重试"""
+        blob_path = self.blob_path(digest)
+        for _ in range(3):
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                try:
+                    write_blob(blob_path)
+                except FileExistsError:
+                    pass
+                os.chmod(blob_path, 0o444)
+            try:
+                self._link_blob(blob_path, file_path, displaced)
+                break
+            except FileNotFoundError:
+                continue
+        else:
+            raise RuntimeError(f"failed to store blob {digest} for {file_path}")
+        try:
+            self._precompress(blob_path, file_path)
+        except Exception as e:
+            logger.warning(f"precompress {file_path} failed: {e}")
+        try:
+            # 表格文件整表解析一次生成列式副本，内容相同的文件只转换一次
+            build_columnar(blob_path, blob_path + COLUMNAR_SUFFIX, file_extension(file_path))
+        except Exception as e:
+            logger.warning(f"build columnar {file_path} failed: {e}")
+
+    @staticmethod
+    def _precompress(blob_path: str, file_path: str):
+        """为文本类文件生成 br / gzip 压缩版本，压缩收益不足 10% 时不保存；内容相同的文件只压缩一次"""
+        if os.getenv("FILE_PRECOMPRESS", "true") != "true" \
+                or file_path.rsplit(".", 1)[-1].lower() not in _COMPRESSIBLE_EXTENSIONS:
+            return
+        size = os.path.getsize(blob_path)
+        if not int(os.getenv("FILE_PRECOMPRESS_MIN_SIZE", 1024)) <= size <= \
+                int(os.getenv("FILE_PRECOMPRESS_MAX_SIZE", 50 * 1024 * 1024)):
+            return
+        pending = [e for e, suffix in _ENCODING_SUFFIXES.items()
+                   if (e != "br" or brotli) and not os.path.exists(blob_path + suffix)]
+        if not pending:
+            return
+        with open(blob_path, "rb") as f:
+            data = f.read()
+        for encoding in pending:
+            if encoding == "br":
+                compressed = brotli.compress(data, quality=9)
+            else:
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < size * 0.9:
+                _FileDB._write_atomic(blob_path + _ENCODING_SUFFIXES[encoding], compressed)
+
+    def variant_paths(self, digest: str) -> Dict[str, str]:
+        """内容已有的压缩版本 {编码: 路径}"""
+        blob_path = self.blob_path(digest)
+        return {e: blob_path + suffix for e, suffix in _ENCODING_SUFFIXES.items() if os.path.exists(blob_path + suffix)}
+
+    def columnar_path(self, digest: str) -> Optional[str]:
+        """内容的列式副本路径，不存在时返回 None"""
+        path = self.blob_path(digest) + COLUMNAR_SUFFIX if digest else None
+        return path if path and os.path.exists(path) else None
+
+    async def save(self, file_name, content, scope, displaced: str = None) -> Tuple[str, int, str]:
+        """保存文本内容，返回 (路径, 大小, sha256)；内容已存在时只建立链接，写盘在线程池中执行
+
+        displaced 为同名文件原内容的 sha256，覆盖后按需释放旧 blob（save_by_data / save_by_path 同）
+        """
+        file_path = self._scope_path(file_name, scope)
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._store, digest, file_path, lambda p: self._write_atomic(p, data), displaced)
+        return file_path, len(data), digest
+
+    def partial_path(self, file_name, scope) -> str:
+        """生成中的文件路径，增量内容追加到该文件，最终版本由 save 原子写入"""
+        return f"{self._scope_path(file_name, scope)}.partial"
+
+    @staticmethod
+    def touch(file_path: str):
+        """创建或清空文件"""
+        open(file_path, "w").close()
+
+    @staticmethod
+    def _write_chunk(f, digest, chunk: bytes):
+        digest.update(chunk)
+        f.write(chunk)
+
+    async def save_by_data(self, file: UploadFile, scope: str = None, displaced: str = None) -> Tuple[str, int, str]:
+        """上传文件分块写入临时文件，边写边计算大小与 sha256，完成后转为 blob；返回 (路径, 大小, sha256)
+
+        超过 FILE_UPLOAD_MAX_SIZE 时抛出 FileTooLargeError，临时文件被清理，已有同名文件不受影响
+        """
+        max_size = _upload_max_size()
+        if file.size is not None and file.size > max_size:
+            raise FileTooLargeError(f"{file.filename} exceeds {max_size} bytes")
+        if scope:
+            save_path = self._scope_path(file.filename, scope)
+        else:
+            save_path = os.path.join(self._work_dir, os.path.basename(file.filename))
+        tmp_path = _tmp_path(save_path)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as f:
+                while chunk := await file.read(_WRITE_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_size:
+                        raise FileTooLargeError(f"{file.filename} exceeds {max_size} bytes")
+                    await asyncio.to_thread(self._write_chunk, f, digest, chunk)
+            # blob 已存在时丢弃临时文件，只建立链接
+            await asyncio.to_thread(self._store, digest.hexdigest(), save_path, lambda p: self._place(tmp_path, p),
+                                    displaced)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return save_path, size, digest.hexdigest()
+
+    @staticmethod
+    def _copy_hashing(src_path: str, tmp_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(src_path, "rb") as rf, open(tmp_path, "wb") as wf:
+            while chunk := rf.read(_WRITE_CHUNK_SIZE):
+                digest.update(chunk)
+                wf.write(chunk)
+        return digest.hexdigest()
+
+    async def save_by_path(self, src_path: str, scope: str, displaced: str = None) -> Tuple[str, int, str]:
+        """本地文件入库：边拷贝边计算 sha256，内容已存在时丢弃拷贝只建立链接
+
+        不直接把源文件链接为 blob，源文件之后被原地改写时不会影响已入库的内容
+        """
+        save_path = os.path.join(self._work_dir, scope)
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        dst_path = os.path.join(save_path, os.path.basename(src_path))
+        tmp_path = _tmp_path(dst_path)
+        try:
+            digest = await asyncio.to_thread(self._copy_hashing, src_path, tmp_path)
+            await asyncio.to_thread(self._store, digest, dst_path, lambda p: self._place(tmp_path, p), displaced)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return dst_path, os.path.getsize(dst_path), digest
+
+    def _release(self, digest: str) -> int:
+        """blob 只剩自身一个链接时删除 blob 及其派生文件，返回释放的字节数；不支持硬链接时留给定期清理"""
+        if not self._hardlinks:
+            return 0
+        blob_path = self.blob_path(digest)
+        freed = 0
+        try:
+            stat = os.stat(blob_path)
+            if stat.st_nlink <= 1:
+                os.remove(blob_path)
+                freed += stat.st_size
+                for suffix in _SIDECAR_SUFFIXES:
+                    if os.path.exists(blob_path + suffix):
+                        freed += os.path.getsize(blob_path + suffix)
+                        os.remove(blob_path + suffix)
+        except FileNotFoundError:
+            pass
+        return freed
+
+    async def release(self, digest: str) -> int:
+        """blob 已无其它链接时删除"""
+        if digest:
+            return await asyncio.to_thread(self._release, digest)
+        return 0
+
+    def _remove(self, file_path: str, digest: str = None) -> int:
+        freed = 0
+        try:
+            stat = os.stat(file_path)
+            os.remove(file_path)
+            # 没有 blob 的旧文件，删除最后一个链接即释放空间
+            if not digest and stat.st_nlink <= 1:
+                freed += stat.st_size
+        except FileNotFoundError:
+            pass
+        if not digest and os.path.exists(file_path + LINE_INDEX_SUFFIX):
+            os.remove(file_path + LINE_INDEX_SUFFIX)
+        if digest:
+            freed += self._release(digest)
+        return freed
+
+    async def remove(self, file_path: str, digest: str = None) -> int:
+        """删除文件名，并释放其 blob，返回释放的字节数"""
+        return await asyncio.to_thread(self._remove, file_path, digest)
+
+    async def remove_many(self, items: List[Tuple[str, Optional[str]]]) -> int:
+        """批量删除 (文件路径, sha256)，在一次线程池调用中完成，返回释放的字节数"""
+        return await asyncio.to_thread(lambda: sum(self._remove(path, digest) for path, digest in items))
+
+    def _sweep_blobs(self, min_age: float, referenced: Optional[set] = None) -> Tuple[int, int]:
+        """删除没有任何文件名引用的 blob 及失去 blob 的派生文件，返回 (删除个数, 释放字节数)
+
+        只处理修改时间早于 min_age 秒的文件，避免与正在写入、尚未建立链接的 blob 竞争。
+        不支持硬链接时按 referenced（文件记录中的全部 content_hash）判断引用，未提供时不删除 blob
+        """
+        removed, freed = 0, 0
+        deadline = time.time() - min_age
+        blob_root = os.path.join(self._work_dir, ".blobs")
+        if not os.path.isdir(blob_root):
+            return removed, freed
+        for prefix in os.listdir(blob_root):
+            prefix_dir = os.path.join(blob_root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime > deadline or name.endswith(".tmp"):
+                    continue
+                base, ext = os.path.splitext(name)
+                if ext in _SIDECAR_SUFFIXES:
+                    orphan = not os.path.exists(os.path.join(prefix_dir, base))
+                elif self._hardlinks:
+                    orphan = stat.st_nlink <= 1
+                else:
+                    orphan = referenced is not None and name not in referenced
+                if orphan:
+                    os.remove(path)
+                    removed += 1
+                    freed += stat.st_size
+        return removed, freed
+
+    async def sweep_blobs(self, min_age: float = 3600, referenced: Optional[set] = None) -> Tuple[int, int]:
+        return await asyncio.to_thread(self._sweep_blobs, min_age, referenced)
+
+    def _remove_empty_scopes(self, scopes: List[str]):
+        for scope in scopes:
+            try:
+                os.rmdir(os.path.join(self._work_dir, scope))
+            except OSError:
+                pass
+
+    async def remove_empty_scopes(self, scopes: List[str]):
+        """删除已清空的请求目录"""
+        await asyncio.to_thread(self._remove_empty_scopes, [s for s in scopes if s])
 
 
 FileDB = _FileDB()
 
 
+class _FileInfoCache(object):
+    """进程内 FileInfo 元数据缓存，供预览、下载等高频只读查询使用
+
+    LRU 淘汰，本进程写入时失效；不存在的 file_id 以较短的 TTL 缓存。
+    多 worker 时其它进程的写入只能等过期后感知，因此已存在的条目同样有 TTL。
+    """
+    _MISS = object()
+
+    def __init__(self):
+        self.max_size = int(os.getenv("FILE_INFO_CACHE_SIZE", 4096))
+        self.ttl = float(os.getenv("FILE_INFO_CACHE_TTL", 60))
+        self.negative_ttl = float(os.getenv("FILE_INFO_CACHE_NEGATIVE_TTL", 2))
+        self._entries: OrderedDict[str, Tuple[float, Optional[FileInfo]]] = OrderedDict()
+
+    def get(self, file_id: str):
+        """命中返回 FileInfo 或 None（已知不存在），未命中返回 _MISS"""
+        entry = self._entries.get(file_id)
+        if entry is None:
+            return self._MISS
+        if entry[0] < time.monotonic():
+            del self._entries[file_id]
+            return self._MISS
+        self._entries.move_to_end(file_id)
+        return entry[1]
+
+    def put(self, file_id: str, file_info: Optional[FileInfo]):
+        if self.max_size <= 0:
+            return
+        ttl = self.ttl if file_info else self.negative_ttl
+        self._entries[file_id] = (time.monotonic() + ttl, file_info)
+        self._entries.move_to_end(file_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *file_ids: str):
+        for file_id in file_ids:
+            self._entries.pop(file_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+FileInfoCache = _FileInfoCache()
+
+
 class FileInfoOp(object):
 
     @classmethod
     @timer()
     async def add_by_content(cls, filename: str, content: str, file_id: str, description: str = None,
                              request_id: str = None) -> FileInfo:
-        file_path = await FileDB.save(filename, content, scope=request_id)
+        file_path, file_size, content_hash = await FileDB.save(
+            filename, content, scope=request_id, displaced=await cls._displaced_hash(file_id))
         file_info = FileInfo(
             file_id=file_id,
             filename=filename,
             file_path=file_path,
             description=description,
-            file_size=os.path.getsize(file_path),
+            file_size=file_size,
+            content_hash=content_hash,
             status=1,
             request_id=request_id
         )
-        return await cls.add(file_info)
+        file_info = await cls.add(file_info)
+        await FileChunkOp.index(file_id, filename, content, request_id=request_id)
+        return file_info
     
     @staticmethod
     @timer()
     async def add_by_file(file: UploadFile, file_id: str, request_id: str = None) -> FileInfo:
-        file_path = await FileDB.save_by_data(file)
-        
+        file_path, file_size, content_hash = await FileDB.save_by_data(
+            file, scope=request_id, displaced=await FileInfoOp._displaced_hash(file_id))
+
         file_info = FileInfo(
             file_id=file_id,
             filename=file.filename,
             file_path=file_path,
             description="",
-            file_size=os.path.getsize(file_path),
+            file_size=file_size,
+            content_hash=content_hash,
+            status=1,
+            request_id=request_id
+        )
+        file_info = await FileInfoOp.add(file_info)
+        await FileChunkOp.index_path(file_id, file.filename, file_path, request_id=request_id)
+        return file_info
+
+    @staticmethod
+    @timer()
+    async def add_by_path(file_path: str, file_id: str, request_id: str = None) -> FileInfo:
+        save_path, file_size, content_hash = await FileDB.save_by_path(
+            file_path, scope=request_id, displaced=await FileInfoOp._displaced_hash(file_id))
+        file_info = FileInfo(
+            file_id=file_id,
+            filename=os.path.basename(file_path),
+            file_path=save_path,
+            description="",
+            file_size=file_size,
+            content_hash=content_hash,
             status=1,
             request_id=request_id
         )
+        file_info = await FileInfoOp.add(file_info)
+        await FileChunkOp.index_path(file_id, file_info.filename, save_path, request_id=request_id)
+        return file_info
+
+    @staticmethod
+    @timer()
+    async def add_partial(filename: str, file_id: str, description: str = None, request_id: str = None) -> FileInfo:
+        """登记生成中的文件（status=0），预览接口据此边生成边输出"""
+        file_path = FileDB.partial_path(filename, scope=request_id)
+        await asyncio.to_thread(FileDB.touch, file_path)
+        file_info = FileInfo(
+            file_id=file_id,
+            filename=filename,
+            file_path=file_path,
+            description=description,
+            file_size=0,
+            status=0,
+            request_id=request_id
+        )
         return await FileInfoOp.add(file_info)
 
+    @staticmethod
+    @timer()
+    async def update_status(file_id: str, status: int) -> None:
+        async with async_session_local() as session:
+            await session.execute(update(FileInfo).where(FileInfo.file_id == file_id).values(status=status))
+            await session.commit()
+        FileInfoCache.invalidate(file_id)
+
+    @staticmethod
+    async def _displaced_hash(file_id: str) -> Optional[str]:
+        """同一 file_id 已有记录时返回其内容 sha256，覆盖写入后据此释放旧 blob"""
+        previous = await FileInfoOp.get_by_file_id(file_id)
+        return previous.content_hash if previous else None
+
+    @staticmethod
+    def _upsert():
+        """按 file_id 插入或更新，单条语句完成；被替换内容的 blob 由存储层在重新链接时释放"""
+        state = sqlite_insert(FileInfo)
+        return state.on_conflict_do_update(
+            index_elements=[FileInfo.file_id],
+            set_={c: getattr(state.excluded, c) for c in _UPSERT_COLUMNS},
+        )
+
+    @staticmethod
+    def _row(file_info: FileInfo) -> dict:
+        return file_info.model_dump(exclude={"id", "create_time"})
+
     @staticmethod
     @timer()
     async def add(file_info: FileInfo) -> FileInfo:
-        file_id = file_info.file_id
-        f = await FileInfoOp.get_by_file_id(file_info.file_id)
         async with async_session_local() as session:
-            if f:
-                f.status = 1
-                f.file_size = file_info.file_size
-                session.add(f)
-            else:
-                session.add(file_info)
+            state = FileInfoOp._upsert().returning(*FileInfo.__table__.columns)
+            row = (await session.execute(state, FileInfoOp._row(file_info))).mappings().one()
+            await session.commit()
+        FileInfoCache.invalidate(file_info.file_id)
+        return FileInfo(**row)
+
+    @staticmethod
+    @timer()
+    async def add_batch(file_infos: List[FileInfo]) -> int:
+        """批量插入或更新，executemany 一次执行、一次提交"""
+        if not file_infos:
+            return 0
+        async with async_session_local() as session:
+            await session.execute(FileInfoOp._upsert(), [FileInfoOp._row(f) for f in file_infos])
+            await session.commit()
+        FileInfoCache.invalidate(*[f.file_id for f in file_infos])
+        return len(file_infos)
+
+    @staticmethod
+    @timer()
+    async def delete(file_id: str) -> None:
+        """删除文件记录、文件名与切片索引，blob 无其它引用时一并删除"""
+        if f := await FileInfoOp.get_by_file_id(file_id):
+            await FileInfoOp.delete_batch([f])
+
+    @staticmethod
+    @timer()
+    async def delete_batch(file_infos: List[FileInfo]) -> int:
+        """批量删除文件记录、文件名与切片索引，返回释放的磁盘字节数"""
+        if not file_infos:
+            return 0
+        file_ids = [f.file_id for f in file_infos]
+        async with async_session_local() as session:
+            await session.execute(delete(FileInfo).where(FileInfo.file_id.in_(file_ids)))
             await session.commit()
-        return await FileInfoOp.get_by_file_id(file_id)
+        FileInfoCache.invalidate(*file_ids)
+        freed = await FileDB.remove_many([(f.file_path, f.content_hash) for f in file_infos])
+        await FileChunkOp.delete(file_ids)
+        return freed
+
+    @staticmethod
+    async def get_content_hashes() -> set:
+        """全部文件记录引用的内容 sha256"""
+        async with async_session_local() as session:
+            state = select(FileInfo.content_hash).where(FileInfo.content_hash.is_not(None)).distinct()
+            return set((await session.execute(state)).scalars().all())
+
+    @staticmethod
+    @timer()
+    async def get_page_by_request_id(request_id: str, page: int, page_size: int) -> Tuple[List[FileInfo], int, int]:
+        """按写入顺序分页，返回 (当前页, 文件总数, 文件总大小)"""
+        async with async_session_local() as session:
+            total, total_size = (await session.execute(
+                select(func.count(), func.coalesce(func.sum(FileInfo.file_size), 0))
+                .where(FileInfo.request_id == request_id))).one()
+            state = select(FileInfo).where(FileInfo.request_id == request_id).order_by(FileInfo.id) \
+                .offset((page - 1) * page_size).limit(page_size)
+            result = await session.execute(state)
+            return result.scalars().all(), total, total_size
 
     @staticmethod
     @timer()
@@ -97,6 +618,19 @@ class FileInfoOp(object):
             result = await session.execute(state)
             return result.scalars().one_or_none()
 
+    @staticmethod
+    async def get_cached_by_file_id(file_id: str) -> Optional[FileInfo]:
+        """经缓存查询磁盘上存在的文件；生成中的文件（status=0）不缓存，调用方需实时感知其状态变化"""
+        file_info = FileInfoCache.get(file_id)
+        if file_info is not FileInfoCache._MISS:
+            return file_info
+        file_info = await FileInfoOp.get_by_file_id(file_id)
+        if file_info and not os.path.exists(file_info.file_path):
+            file_info = None
+        if not file_info or file_info.status != 0:
+            FileInfoCache.put(file_id, file_info)
+        return file_info
+
     @staticmethod
     @timer()
     async def get_by_file_ids(file_ids: List[str]) -> List[FileInfo]:
@@ -109,7 +643,7 @@ class FileInfoOp(object):
     @timer()
     async def get_by_request_id(request_id: str) -> List[FileInfo]:
         async with async_session_local() as session:
-            state = select(FileInfo).where(FileInfo.request_id == request_id)
+            state = select(FileInfo).where(FileInfo.request_id == request_id).order_by(FileInfo.id)
             result = await session.execute(state)
             return result.scalars().all()
 
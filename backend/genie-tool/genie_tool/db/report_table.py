@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# =====================
+# 
+# 
+# Author: liumin.423
+# Date:   2025/7/9
+# =====================
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, Text
+from sqlmodel import SQLModel, Field
+
+
+class ReportCache(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    cache_key: str = Field(unique=True)
+    content: str = Field(sa_type=Text)
+    file_info: str = Field(sa_type=Text)     # json 序列化的 fileInfo 列表
+    file_name: Optional[str] = Field(default=None)
+    request_id: Optional[str] = Field(default=None)
+    create_time: datetime = Field(sa_type=DateTime, default_factory=datetime.now)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# =====================
+# 
+# 
+# Author: liumin.423
+# Date:   2025/7/9
+# =====================
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlmodel import select, delete
+
+from genie_tool.db.report_table import ReportCache
+from genie_tool.db.db_engine import async_session_local
+from genie_tool.util.log_util import timer
+
+
+class ReportCacheOp(object):
+
+    @staticmethod
+    @timer()
+    async def get(cache_key: str, ttl: int) -> Optional[ReportCache]:
+        async with async_session_local() as session:
+            state = select(ReportCache).where(
+                ReportCache.cache_key == cache_key,
+                ReportCache.create_time >= datetime.now() - timedelta(seconds=ttl))
+            result = await session.execute(state)
+            return result.scalars().one_or_none()
+
+    @staticmethod
+    @timer()
+    async def put(cache: ReportCache) -> None:
+        async with async_session_local() as session:
+            await session.execute(delete(ReportCache).where(ReportCache.cache_key == cache.cache_key))
+            session.add(cache)
+            await session.commit()
+
+    @staticmethod
+    @timer()
+    async def delete_expired(ttl: int) -> None:
+        async with async_session_local() as session:
+            await session.execute(delete(ReportCache).where(
+                ReportCache.create_time < datetime.now() - timedelta(seconds=ttl)))
+            await session.commit()
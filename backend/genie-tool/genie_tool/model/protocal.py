@@ -6,6 +6,7 @@
 # Date:   2025/7/7
 # =====================
 import hashlib
+from functools import lru_cache
 from typing import Optional, Literal, List
 
 from pydantic import BaseModel, Field, computed_field
@@ -36,6 +37,11 @@ class CIRequest(BaseModel):
 
 class ReportRequest(CIRequest):
     file_type: Literal["html", "markdown", "ppt"] = Field("html", alias="fileType", description="生成报告的文件类型")
+    use_cache: bool = Field(default=True, alias="useCache", description="是否使用报告缓存，false 时强制重新生成")
+
+
+class MultiReportRequest(ReportRequest):
+    file_types: List[Literal["html", "markdown", "ppt"]] = Field(min_length=1, alias="fileTypes", description="需要生成的报告文件类型列表")
 
 
 class FileRequest(BaseModel):
@@ -47,6 +53,7 @@ class FileRequest(BaseModel):
         return get_file_id(self.request_id, self.file_name)
 
 
+@lru_cache(maxsize=4096)
 def get_file_id(request_id: str, file_name: str) -> str:
     return hashlib.md5((request_id + file_name).encode("utf-8")).hexdigest()
 
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/10
+# =====================
+from dataclasses import dataclass, field
+from typing import List
+
+
+@dataclass
+class ReportProgress:
+    """报告生成的阶段进度，stage: map 为分片抽取阶段"""
+    stage: str
+    done: int
+    total: int
+
+
+@dataclass
+class ReportOutline:
+    """分章节并行生成的大纲，html/ppt 的页面骨架以 <!--SECTIONS--> 切分为 head 与 tail"""
+    title: str
+    sections: List[str] = field(default_factory=list)
+    head: str = ""
+    tail: str = ""
@@ -3,7 +3,8 @@ import os
 import re
 import time
 from collections.abc import Callable, Generator
-from typing import Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
 import uuid
 from smolagents import (
     CodeAgent,
@@ -28,6 +29,7 @@ from smolagents import (
     agglomerate_stream_deltas,
     ToolOutput,
 )
+from smolagents.local_python_executor import PythonExecutor
 from loguru import logger as lg
 from rich.text import Text
 from rich.console import Group
@@ -36,10 +38,49 @@ from rich.markdown import Markdown
 import json_repair
 
 from genie_tool.model.code import CodeOuput
-from genie_tool.tool.final_answer_check import FinalAnswerCheck
+from genie_tool.tool.final_answer_check import FinalAnswerCheck, FinalCheckStats, decide_by_signals
 from genie_tool.util.file_util import generate_data_id
 from genie_tool.util.log_util import timer
 
+# 终止判断：signal 先按确定性信号判断，无法判断时 LLM 判断与下一步生成并行；llm 每步阻塞调用 LLM 判断
+_FINAL_CHECK_MODE = os.getenv("CODE_INTERPRETER_FINAL_CHECK", "signal")
+_FINAL_CHECK_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CODE_INTERPRETER_CONCURRENCY", 4)), thread_name_prefix="ci-final-check")
+# 服务模式下没有人看控制台，默认不在控制台渲染模型输出与执行日志
+_CONSOLE_ENABLED = os.getenv("CODE_INTERPRETER_CONSOLE", "false") == "true"
+
+
+class StreamRenderer(object):
+    """在控制台实时显示模型输出：增量累积文本，至多每 interval 秒重绘一次；未开启时不做任何处理"""
+
+    def __init__(self, console, enabled: bool = _CONSOLE_ENABLED, interval: float = 0.2):
+        self.console = console
+        self.enabled = enabled
+        self.interval = interval
+        self._parts: list[str] = []
+        self._live: Optional[Live] = None
+        self._last_render = 0.0
+
+    def __enter__(self):
+        if self.enabled:
+            self._live = Live("", console=self.console, vertical_overflow="visible")
+            self._live.__enter__()
+        return self
+
+    def update(self, delta: ChatMessageStreamDelta):
+        if self._live is None or not delta.content:
+            return
+        self._parts.append(delta.content)
+        now = time.monotonic()
+        if now - self._last_render >= self.interval:
+            self._last_render = now
+            self._live.update(Markdown("".join(self._parts)))
+
+    def __exit__(self, *exc_info):
+        if self._live is not None:
+            self._live.update(Markdown("".join(self._parts)))
+            return self._live.__exit__(*exc_info)
+
 
 class CIAgent(CodeAgent):
     def __init__(
@@ -53,10 +94,19 @@ class CIAgent(CodeAgent):
         executor_kwargs: dict[str, Any] | None = None,
         grammar: dict[str, str] | None = None,
         output_dir: Optional[str] = None,
+        executor: Optional[PythonExecutor] = None,
         *args,
         **kwargs,
     ):
         self.output_dir = output_dir
+        # 外部传入的代码执行器（如执行进程池），未传入时按 executor_type 创建
+        self._executor = executor
+        # 上一步尚未返回的 LLM 终止判断
+        self._pending_check: Optional[Future] = None
+        # 已转换为消息的记忆步骤（含 system prompt）及其消息，后续步骤只转换新增的记忆
+        self._memory_keys: list = []
+        self._memory_messages: list[ChatMessage] = []
+        kwargs.setdefault("verbosity_level", LogLevel.INFO if _CONSOLE_ENABLED else LogLevel.OFF)
         super().__init__(
             tools=tools,
             model=model,
@@ -69,6 +119,52 @@ class CIAgent(CodeAgent):
             **kwargs,
         )
 
+    def create_python_executor(self) -> PythonExecutor:
+        if self._executor is not None:
+            return self._executor
+        return super().create_python_executor()
+
+    def write_memory_to_messages(self, summary_mode: bool = False) -> list[ChatMessage]:
+        """增量生成记忆消息：记忆步骤写入后不再修改，已转换的直接复用；记忆被重置时重新生成"""
+        if summary_mode:
+            return super().write_memory_to_messages(summary_mode=summary_mode)
+        keys = [self.memory.system_prompt, *self.memory.steps]
+        if len(self._memory_keys) > len(keys) or any(a is not b for a, b in zip(self._memory_keys, keys)):
+            self._memory_keys, self._memory_messages = [], []
+        for step in keys[len(self._memory_keys):]:
+            self._memory_messages.extend(step.to_messages(summary_mode=False))
+            self._memory_keys.append(step)
+        return list(self._memory_messages)
+
+    def _output_files(self) -> Dict[str, float]:
+        """output_dir 中的文件及修改时间"""
+        if not self.output_dir or not os.path.isdir(self.output_dir):
+            return {}
+        return {e.name: e.stat().st_mtime for e in os.scandir(self.output_dir) if e.is_file()}
+
+    def _resolve_pending_check(self, wait: bool) -> Optional[Tuple[bool, Any]]:
+        """取上一步 LLM 终止判断的结果 (是否完成, 上一步执行输出)；wait=False 且尚未返回时为 None"""
+        future = self._pending_check
+        if future is None or (not wait and not future.done()):
+            return None
+        if future.done():
+            FinalCheckStats.record("llm_overlapped")
+        self._pending_check = None
+        try:
+            final_flag, exe_log = future.result()
+        except Exception as e:
+            lg.warning(f"final answer check failed: {e}")
+            return False, None
+        if final_flag:
+            FinalCheckStats.record("llm_final")
+        return final_flag, exe_log
+
+    def _handle_max_steps_reached(self, *args, **kwargs):
+        # 最后一步的 LLM 判断为完成时直接以该步输出结束，不再额外生成最终答案
+        if (checked := self._resolve_pending_check(wait=True)) and checked[0]:
+            return checked[1]
+        return super()._handle_max_steps_reached(*args, **kwargs)
+
     @timer()
     def _step_stream(
         self, memory_step: ActionStep
@@ -79,29 +175,42 @@ class CIAgent(CodeAgent):
         Perform one step in the ReAct framework: the agent thinks, acts, and observes the result.
         Returns None if the step is not final.
         """
+        if memory_step.step_number == 1:
+            self._pending_check = None
+        # 模型输入、步骤记录与终止判断共用同一份消息列表，都不修改列表本身
         memory_messages = self.write_memory_to_messages()
 
-        self.input_messages = memory_messages.copy()
+        self.input_messages = memory_messages
 
         # Add new step in logs
-        memory_step.model_input_messages = memory_messages.copy()
+        memory_step.model_input_messages = memory_messages
         try:
-            input_messages = memory_messages.copy()
-
             model_request_id = str(uuid.uuid4())
 
             output_stream = self.model.generate_stream(
-                    input_messages,
+                    memory_messages,
                     extra_headers={"x-ms-client-request-id": model_request_id},
                 )
+            # 增量只收集一次，结束后整体合并，避免每个增量都重新合并全部内容
             chat_message_stream_deltas: list[ChatMessageStreamDelta] = []
-            with Live("", console=self.logger.console, vertical_overflow="visible") as live:
+            previous_final = None
+            with StreamRenderer(self.logger.console) as renderer:
                 for event in output_stream:
                     chat_message_stream_deltas.append(event)
-                    live.update(
-                        Markdown(agglomerate_stream_deltas(chat_message_stream_deltas).render_as_markdown())
-                    )
+                    renderer.update(event)
                     yield event
+                    if (checked := self._resolve_pending_check(wait=False)) and checked[0]:
+                        previous_final = checked
+                        break
+            if (checked := self._resolve_pending_check(wait=True)) and checked[0]:
+                previous_final = checked
+            if previous_final:
+                # 上一步已完成任务，丢弃本步生成的内容
+                if hasattr(output_stream, "close"):
+                    output_stream.close()
+                memory_step.action_output = previous_final[1]
+                yield ActionOutput(output=previous_final[1], is_final_answer=True)
+                return
             chat_message = agglomerate_stream_deltas(chat_message_stream_deltas)
             memory_step.model_output_message = chat_message
             output_text = chat_message.content
@@ -155,8 +264,14 @@ class CIAgent(CodeAgent):
             title="Executing parsed code:", content=code_action, level=LogLevel.INFO
         )
 
+        files_before = self._output_files()
         try:
-            _, execution_logs, _ = self.python_executor(code_action)
+            code_output = self.python_executor(code_action)
+            if isinstance(code_output, tuple):
+                output, execution_logs, is_final_answer = code_output
+            else:
+                output, execution_logs, is_final_answer = \
+                    code_output.output, code_output.logs, code_output.is_final_answer
 
             # This put call was missing await
             execution_outputs_console = []
@@ -198,17 +313,35 @@ class CIAgent(CodeAgent):
 
         memory_step.observations = observation
 
-        finalObj = FinalAnswerCheck(
-            input_messages=self.input_messages,
-            execution_logs=execution_logs,
-            model=self.model,
-            task=self.task,
-            prompt_temps=self.prompt_templates,
-            memory_step=memory_step,
-            grammar=self.grammar,
-            request_id=f"{model_request_id}-final",
-        )
-        finalFlag, exeLog = finalObj.check_is_final_answer()
+        new_files = [name for name, mtime in self._output_files().items() if files_before.get(name) != mtime]
+        if _FINAL_CHECK_MODE == "llm":
+            finalFlag, decision = None, "llm_check"
+        else:
+            finalFlag, decision = decide_by_signals(is_final_answer, execution_logs, new_files)
+        FinalCheckStats.record(decision)
+        if finalFlag is None:
+            finalObj = FinalAnswerCheck(
+                input_messages=self.input_messages,
+                execution_logs=execution_logs,
+                model=self.model,
+                task=self.task,
+                prompt_temps=self.prompt_templates,
+                memory_step=memory_step,
+                grammar=getattr(self, "grammar", None),
+                request_id=f"{model_request_id}-final",
+            )
+            if _FINAL_CHECK_MODE == "llm":
+                finalFlag, exeLog = finalObj.check_is_final_answer()
+                if finalFlag:
+                    FinalCheckStats.record("llm_final")
+            else:
+                # 先按未完成继续下一步，LLM 判断在下一步生成期间返回“已完成”时结束
+                self._pending_check = _FINAL_CHECK_EXECUTOR.submit(finalObj.check_is_final_answer)
+                finalFlag, exeLog = False, None
+        elif finalFlag:
+            exeLog = output if is_final_answer else execution_logs
+        else:
+            exeLog = None
         self.logger.log(Group(*execution_outputs_console), level=LogLevel.INFO)
         # self.logger.log(f"check finalanswer 已完成 {finalFlag}  {str(exeLog)}")
         memory_step.action_output = exeLog
@@ -10,20 +10,35 @@ import importlib
 import os
 import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
 from typing import List, Optional
 
-import pandas as pd
 import yaml
 from jinja2 import Template
 from smolagents import LiteLLMModel, FinalAnswerStep, PythonInterpreterTool, ChatMessageStreamDelta
 
 from genie_tool.tool.ci_agent import CIAgent
+from genie_tool.tool.executor_pool import ExecutorPool, PooledPythonExecutor, get_executor_pool
 from genie_tool.util.file_util import download_all_files_in_path, upload_file, upload_file_by_path
+from genie_tool.util.llm_util import output_redact_enabled
 from genie_tool.util.log_util import timer
+from genie_tool.util.sensitive_detection import SensitiveWordsReplace
 from genie_tool.util.prompt_util import get_prompt
+from genie_tool.util.stream_util import iterate_in_thread
+from genie_tool.util.table_util import COLUMNAR_SUFFIX, TABULAR_EXTENSIONS, file_extension, table_abstract
 import requests
 from genie_tool.model.code import ActionOutput, CodeOuput
 
+# CIAgent 的 LLM 调用、终止判断与代码执行都是同步的，放在专用线程中运行；
+# 超过 CODE_INTERPRETER_CONCURRENCY 的请求在事件循环上排队等待。客户端断开后运行在下一步才停止，
+# 名额在运行真正结束、线程空出后才归还，排队的请求不会在线程池内部无感知地等待
+_CI_CONCURRENCY = int(os.getenv("CODE_INTERPRETER_CONCURRENCY", 4))
+_CI_EXECUTOR = ThreadPoolExecutor(max_workers=_CI_CONCURRENCY, thread_name_prefix="ci-agent")
+_CI_SEMAPHORE = asyncio.Semaphore(_CI_CONCURRENCY)
+
+CI_AUTHORIZED_IMPORTS = ["pandas", "openpyxl", "numpy", "matplotlib", "seaborn"]
+
 @timer()
 async def code_interpreter_agent(
     task: str,
@@ -34,43 +49,22 @@ async def code_interpreter_agent(
     stream: bool = True,
 ):
     work_dir = ""
+    agent = None
+    # 客户端断开时不等待运行结束，清理与归还名额交给运行线程在运行结束后完成
+    abandoned = False
     try:
         work_dir = tempfile.mkdtemp()
         output_dir = os.path.join(work_dir, "output")
         os.makedirs(output_dir, exist_ok=True)
         import_files = await download_all_files_in_path(file_names=file_names, work_dir=work_dir)
 
-        # 1. 文件处理
-        files = []
-        if import_files:
-            for import_file in import_files:
-
-                file_name = import_file["file_name"]
-
-                file_path = import_file["file_path"]
-                if not file_name or not file_path:
-                    continue
-
-                # 表格文件
-                if file_name.split(".")[-1] in ["xlsx", "xls", "csv"]:
-                    pd.set_option("display.max_columns", None)
-                    df = (
-                        pd.read_csv(file_path)
-                        if file_name.endswith(".csv")
-                        else pd.read_excel(file_path)
-                    )
-                    files.append({"path": file_path, "abstract": f"{df.head(10)}"})
-                # 文本文件
-                elif file_name.split(".")[-1] in ["txt", "md", "html"]:
-                    with open(file_path, "r") as rf:
-                        files.append(
-                            {
-                                "path": file_path,
-                                "abstract": "".join(rf.readlines())[
-                                    :max_file_abstract_size
-                                ],
-                            }
-                        )
+        # 1. 文件处理：各文件并发生成摘要，表格文件只读取前几行
+        abstracts = await asyncio.gather(*[
+            asyncio.to_thread(_file_abstract, import_file["file_name"], import_file["file_path"],
+                              max_file_abstract_size)
+            for import_file in import_files or []
+        ])
+        files = [f for f in abstracts if f]
 
         # 2. 构建 Prompt
         ci_prompt_template = get_prompt("code_interpreter")
@@ -81,6 +75,7 @@ async def code_interpreter_agent(
             max_tokens=max_tokens,
             return_full_result=True,
             output_dir=output_dir,
+            work_dir=work_dir,
         )
 
         template_task = Template(ci_prompt_template["task_template"]).render(
@@ -88,52 +83,107 @@ async def code_interpreter_agent(
         )
 
         if stream:
-            for step in agent.run(task=str(template_task), stream=True, max_steps=10):
-                if isinstance(step, CodeOuput):
-                    file_info = await upload_file(
-                        content=step.code,
-                        file_name=step.file_name,
-                        file_type="py",
-                        request_id=request_id,
-                    )
-                    step.file_list = [file_info]
-                    yield step
-                
-                elif isinstance(step, FinalAnswerStep):
-                    file_list = []
-                    file_path = get_new_file_by_path(output_dir=output_dir)
-                    if file_path:
-                        file_info = await upload_file_by_path(
-                            file_path=file_path, request_id=request_id
-                        )
-                        if file_info:
-                            file_list.append(file_info)
-                    code_name = f"{task[:20]}_代码输出.md"
-                    file_list.append(
-                        await upload_file(
-                            content=step.output,
-                            file_name=code_name,
-                            file_type="md",
-                            request_id=request_id,
-                        )
-                    )
-
-                    output = ActionOutput(content=step.output, file_list=file_list)
-                    yield output
-                elif isinstance(step, ChatMessageStreamDelta):
-                    #yield step.content
-                    pass
-                await asyncio.sleep(0)
-                
+            loop = asyncio.get_running_loop()
+
+            def _on_cancel():
+                nonlocal abandoned
+                abandoned = True
+                agent.interrupt()
+
+            def _on_abandoned():
+                try:
+                    _cleanup(agent, work_dir)
+                finally:
+                    loop.call_soon_threadsafe(_CI_SEMAPHORE.release)
+
+            await _CI_SEMAPHORE.acquire()
+            try:
+                async with aclosing(iterate_in_thread(
+                    lambda: agent.run(task=str(template_task), stream=True, max_steps=10),
+                    executor=_CI_EXECUTOR,
+                    on_cancel=_on_cancel,
+                    on_abandoned=_on_abandoned,
+                )) as steps:
+                    async for step in steps:
+                        async for output in _handle_step(step, task, output_dir, request_id):
+                            yield output
+            finally:
+                if not abandoned:
+                    _CI_SEMAPHORE.release()
         else:
-            output = agent.run(task=task)
+            async with _CI_SEMAPHORE:
+                output = await asyncio.get_running_loop().run_in_executor(_CI_EXECUTOR, lambda: agent.run(task=task))
             yield output
     except Exception as e:
         raise e
 
     finally:
-        if work_dir:
-            shutil.rmtree(work_dir, ignore_errors=True)
+        if not abandoned:
+            await asyncio.to_thread(_cleanup, agent, work_dir)
+
+
+def _cleanup(agent: Optional[CIAgent], work_dir: str):
+    if agent is not None:
+        # 归还执行进程
+        agent.cleanup()
+    if work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _file_abstract(file_name: str, file_path: str, max_file_abstract_size: int) -> Optional[dict]:
+    if not file_name or not file_path:
+        return None
+    ext = file_extension(file_name)
+    # 表格文件
+    if ext in TABULAR_EXTENSIONS:
+        columnar_path = file_path + COLUMNAR_SUFFIX
+        return {
+            "path": file_path,
+            "abstract": table_abstract(file_path, ext),
+            "columnar_path": columnar_path if os.path.exists(columnar_path) else "",
+        }
+    # 文本文件
+    elif ext in ["txt", "md", "html"]:
+        with open(file_path, "r") as rf:
+            return {"path": file_path, "abstract": rf.read(max_file_abstract_size)}
+    return None
+
+
+async def _handle_step(step, task: str, output_dir: str, request_id: str):
+    """把 CIAgent 的步骤转换为接口输出，上传代码与结果文件"""
+    if isinstance(step, CodeOuput):
+        file_info = await upload_file(
+            content=step.code,
+            file_name=step.file_name,
+            file_type="py",
+            request_id=request_id,
+        )
+        step.file_list = [file_info]
+        yield step
+
+    elif isinstance(step, FinalAnswerStep):
+        if output_redact_enabled() and isinstance(step.output, str):
+            step.output = SensitiveWordsReplace.replace(step.output)
+        file_list = []
+        file_path = get_new_file_by_path(output_dir=output_dir)
+        if file_path:
+            file_info = await upload_file_by_path(
+                file_path=file_path, request_id=request_id
+            )
+            if file_info:
+                file_list.append(file_info)
+        code_name = f"{task[:20]}_代码输出.md"
+        file_list.append(
+            await upload_file(
+                content=step.output,
+                file_name=code_name,
+                file_type="md",
+                request_id=request_id,
+            )
+        )
+
+        output = ActionOutput(content=step.output, file_list=file_list)
+        yield output
 
 
 def get_new_file_by_path(output_dir):
@@ -157,25 +207,25 @@ def create_ci_agent(
     max_tokens: int = 16000,
     return_full_result: bool = True,
     output_dir: str = "",
+    work_dir: str = "",
+    executor_pool: Optional[ExecutorPool] = None,
 ) -> CIAgent:
     model = LiteLLMModel(
         max_tokens=max_tokens,
         model_id=os.getenv("CODE_INTEPRETER_MODEL","gpt-4.1")
     )
+    # 配置了执行进程池时，生成的代码在预热的执行进程中运行，工作目录为本次请求的临时目录
+    pool = executor_pool or get_executor_pool(CI_AUTHORIZED_IMPORTS)
+    executor = PooledPythonExecutor(pool, work_dir=work_dir) if pool else None
 
     return CIAgent(
         model=model,
         prompt_templates=prompt_templates,
         tools=[PythonInterpreterTool()],
         return_full_result=return_full_result,
-        additional_authorized_imports=[
-            "pandas",
-            "openpyxl",
-            "numpy",
-            "matplotlib",
-            "seaborn",
-        ],
+        additional_authorized_imports=CI_AUTHORIZED_IMPORTS,
         output_dir=output_dir,
+        executor=executor,
     )
 
 
@@ -22,6 +22,7 @@ from genie_tool.tool.search_component.reasoning import search_reasoning
 from genie_tool.tool.search_component.search_engine import MixSearch
 from genie_tool.model.protocal import StreamMode
 from genie_tool.util.file_util import truncate_files
+from genie_tool.util.stream_util import coalesce_stream
 from genie_tool.model.context import LLMModelInfoFactory
 
 
@@ -124,41 +125,26 @@ class DeepSearch:
 
         # 生成最终答案
         answer = ""
-        acc_content = ""
-        acc_token = 0
-        async for chunk in answer_question(
-                query=query, search_content=self.search_docs_str(os.getenv("SEARCH_ANSWER_MODEL"))
-        ):
-            if stream:
-                if acc_token >= stream_mode.token:
-                    yield json.dumps({
-                        "requestId": request_id,
-                        "query": query,
-                        "searchResult": {
-                            "query": [],
-                            "docs": [],
-                        },
-                        "answer": acc_content,
-                        "isFinal": False,
-                        "messageType": "report"
-                    }, ensure_ascii=False)
-                    acc_content = ""
-                    acc_token = 0
-                acc_content += chunk
-                acc_token += 1
-            answer += chunk
-        if stream and acc_content:
-            yield json.dumps({
-                "requestId": request_id,
-                "query": query,
-                "searchResult": {
-                    "query": [],
-                    "docs": [],
-                },
-                "answer": acc_content,
-                "isFinal": False,
-                "messageType": "report"
-            }, ensure_ascii=False)
+        answer_stream = answer_question(
+            query=query, search_content=self.search_docs_str(os.getenv("SEARCH_ANSWER_MODEL")))
+        if stream:
+            # 答案默认按 token 合并输出
+            if stream_mode.mode == "general":
+                stream_mode = StreamMode(mode="token", token=stream_mode.token)
+            async for chunk in coalesce_stream(answer_stream, stream_mode=stream_mode, heartbeat=None):
+                yield json.dumps({
+                    "requestId": request_id,
+                    "query": query,
+                    "searchResult": {
+                        "query": [],
+                        "docs": [],
+                    },
+                    "answer": chunk,
+                    "isFinal": False,
+                    "messageType": "report"
+                }, ensure_ascii=False)
+        else:
+            answer = "".join([chunk async for chunk in answer_stream])
         yield json.dumps({
                 "requestId": request_id,
                 "query": query,
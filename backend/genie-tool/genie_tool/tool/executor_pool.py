@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/7
+# =====================
+"""预热的 Python 代码执行进程池
+
+代码解释器生成的代码原本在服务进程内执行，每个新进程第一次执行都要重新导入 pandas / matplotlib 等库。
+进程池预先启动若干执行进程，导入授权库并建好 matplotlib 字体缓存；一次 CIAgent 运行期间独占一个进程
+（变量在各步骤间保留），运行结束后归还，执行 CODE_EXECUTOR_MAX_RUNS 次后回收重建。
+执行进程有内存（RLIMIT_AS）与单次运行 CPU 时间（RLIMIT_CPU）上限，超时或超限时直接终止进程。
+"""
+import dataclasses
+import gc
+import importlib
+import multiprocessing
+import os
+import pickle
+import queue
+import resource
+import sys
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from smolagents import LocalPythonExecutor
+from smolagents.local_python_executor import PythonExecutor
+
+
+class ExecutorCrashedError(Exception):
+    """执行进程超时、超出资源上限或异常退出"""
+    pass
+
+
+def _prewarm(authorized_imports: List[str]):
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    for module in authorized_imports:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            continue
+    try:
+        # 首次使用时构建字体缓存并初始化 Agg 渲染
+        import matplotlib.pyplot as plt
+        from matplotlib import font_manager
+        font_manager.fontManager.get_font_names()
+        fig = plt.figure()
+        fig.canvas.draw()
+        plt.close(fig)
+    except ImportError:
+        pass
+
+
+def _picklable(value: Any) -> Any:
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return repr(value)
+
+
+def _picklable_result(result: Any) -> Any:
+    """执行结果只把不可序列化的 output 转为 repr，保留日志与 is_final_answer（元组或 CodeOutput）"""
+    if isinstance(result, tuple):
+        return (_picklable(result[0]), *result[1:])
+    if dataclasses.is_dataclass(result) and hasattr(result, "output"):
+        return dataclasses.replace(result, output=_picklable(result.output))
+    return _picklable(result)
+
+
+def _set_cpu_limit(seconds: int):
+    """本次运行的 CPU 上限：在已用 CPU 时间基础上再允许 seconds 秒，超出时进程收到 SIGXCPU 退出"""
+    if seconds <= 0:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime) + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _worker_main(conn, authorized_imports: List[str], memory_limit: int, prewarm: bool):
+    """执行进程主循环：按消息 (命令, 参数) 处理，回复 ("ok", 结果) 或 ("error", (异常, 输出))"""
+    if prewarm:
+        _prewarm(authorized_imports)
+    if memory_limit > 0:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    idle_dir = tempfile.gettempdir()
+    executor: Optional[LocalPythonExecutor] = None
+    conn.send(("ok", "ready"))
+    while True:
+        try:
+            command, args = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        try:
+            if command == "start":
+                work_dir, cpu_limit, executor_kwargs = args
+                os.chdir(work_dir or idle_dir)
+                executor = LocalPythonExecutor(authorized_imports, **executor_kwargs)
+                _set_cpu_limit(cpu_limit)
+                result = None
+            elif command == "send_tools":
+                result = executor.send_tools(args)
+            elif command == "send_variables":
+                result = executor.send_variables(args)
+            elif command == "run":
+                result = _picklable_result(executor(args))
+            elif command == "end":
+                executor = None
+                os.chdir(idle_dir)
+                if "matplotlib.pyplot" in sys.modules:
+                    sys.modules["matplotlib.pyplot"].close("all")
+                gc.collect()
+                result = None
+            else:
+                raise ValueError(f"unknown command {command}")
+            conn.send(("ok", result))
+        except BaseException as e:
+            logs = str(executor.state.get("_print_outputs", "")) if executor else ""
+            try:
+                pickle.dumps(e)
+                error = e
+            except Exception:
+                error = RuntimeError(str(e))
+            conn.send(("error", (error, logs)))
+
+
+class _Worker(object):
+    def __init__(self, ctx, authorized_imports: List[str], memory_limit: int, prewarm: bool):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_conn, authorized_imports, memory_limit, prewarm),
+            name="ci-executor", daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.runs = 0
+        self.ready = False
+
+    def wait_ready(self, timeout: Optional[float] = None):
+        if not self.ready:
+            self.call(None, timeout=timeout)
+            self.ready = True
+
+    def call(self, message, timeout: Optional[float] = None):
+        """发送消息并等待回复；超时、进程退出时终止进程并抛出 ExecutorCrashedError"""
+        try:
+            if message is not None:
+                self.conn.send(message)
+            if not self.conn.poll(timeout):
+                self.kill()
+                raise ExecutorCrashedError(f"Code execution exceeded the maximum execution time of {timeout} seconds")
+            status, result = self.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError, OSError):
+            self.kill()
+            raise ExecutorCrashedError(
+                f"Code execution process exited unexpectedly (exit code {self.process.exitcode}), "
+                f"it may have exceeded the CPU or memory limit")
+        if status == "error":
+            error, logs = result
+            try:
+                error._print_outputs = logs
+            except AttributeError:
+                pass
+            raise error
+        return result
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class ExecutorPool(object):
+    """执行进程池：进程用 spawn 方式启动，不继承服务进程的线程与连接"""
+
+    def __init__(
+            self,
+            size: int,
+            authorized_imports: List[str],
+            max_runs: int = 20,
+            memory_limit: int = 0,
+            cpu_limit: int = 0,
+            timeout: Optional[float] = None,
+            prewarm: bool = True,
+    ):
+        self.size = size
+        self.authorized_imports = authorized_imports
+        self.max_runs = max_runs
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.timeout = timeout
+        self.prewarm = prewarm
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.authorized_imports, self.memory_limit, self.prewarm)
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+        logger.info(f"executor pool started size={self.size} prewarm={self.prewarm}")
+
+    def lease(self, work_dir: str, executor_kwargs: Dict[str, Any]) -> _Worker:
+        """取出一个空闲进程并开始一次运行；池中无空闲进程时等待"""
+        self.start()
+        for attempt in range(3):
+            worker = self._idle.get()
+            try:
+                worker.wait_ready(timeout=self.timeout)
+                worker.call(("start", (work_dir, self.cpu_limit, executor_kwargs)), timeout=self.timeout)
+                return worker
+            except ExecutorCrashedError as e:
+                logger.warning(f"executor pool discard worker: {e}")
+                self._idle.put(self._spawn())
+                if attempt == 2:
+                    raise
+            except Exception:
+                # start 命令本身出错（如参数无法序列化），进程仍可用，归还后抛出
+                self.release(worker)
+                raise
+
+    def release(self, worker: _Worker):
+        """归还进程；已退出或达到最大运行次数的进程在后台重建"""
+        worker.runs += 1
+        if worker.alive and worker.runs < self.max_runs:
+            try:
+                worker.call(("end", None), timeout=self.timeout)
+                self._idle.put(worker)
+                return
+            except Exception as e:
+                logger.warning(f"executor pool reset worker failed: {e}")
+        worker.kill()
+        self._idle.put(self._spawn())
+
+    def shutdown(self):
+        with self._lock:
+            while not self._idle.empty():
+                self._idle.get_nowait().kill()
+            self._started = False
+
+
+class PooledPythonExecutor(PythonExecutor):
+    """smolagents 执行器接口：首次使用时从进程池租用进程，cleanup 时归还"""
+
+    def __init__(self, pool: ExecutorPool, work_dir: str = None, executor_kwargs: Dict[str, Any] = None):
+        self.pool = pool
+        self.work_dir = work_dir
+        self.executor_kwargs = executor_kwargs or {}
+        self.state: Dict[str, Any] = {}
+        self._worker: Optional[_Worker] = None
+        self._tools: Optional[Dict[str, Any]] = None
+        self._variables: Optional[Dict[str, Any]] = None
+
+    def _call(self, command: str, args: Any):
+        if self._worker is None:
+            self._worker = self.pool.lease(self.work_dir, self.executor_kwargs)
+            # 进程崩溃后重新租用时，补发工具与初始变量（代码中定义的变量丢失）
+            if command != "send_tools" and self._tools is not None:
+                self._worker.call(("send_tools", self._tools), timeout=self.pool.timeout)
+            if command != "send_variables" and self._variables is not None:
+                self._worker.call(("send_variables", self._variables), timeout=self.pool.timeout)
+        try:
+            return self._worker.call((command, args), timeout=self.pool.timeout)
+        except ExecutorCrashedError:
+            self.pool.release(self._worker)
+            self._worker = None
+            raise
+
+    def __call__(self, code_action: str):
+        self.state["_print_outputs"] = ""
+        try:
+            result = self._call("run", code_action)
+        except Exception as e:
+            self.state["_print_outputs"] = getattr(e, "_print_outputs", "")
+            raise
+        self.state["_print_outputs"] = result[1] if isinstance(result, tuple) else getattr(result, "logs", "")
+        return result
+
+    def send_variables(self, variables: Dict[str, Any]):
+        self._variables = {k: _picklable(v) for k, v in variables.items()}
+        self._call("send_variables", self._variables)
+
+    def send_tools(self, tools: Dict[str, Any]):
+        self._tools = tools
+        self._call("send_tools", tools)
+
+    def cleanup(self):
+        if self._worker is not None:
+            self.pool.release(self._worker)
+            self._worker = None
+
+
+_POOL: Optional[ExecutorPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_executor_pool(authorized_imports: List[str]) -> Optional[ExecutorPool]:
+    """按环境变量创建进程级共享的执行进程池，CODE_EXECUTOR_POOL_SIZE=0 时返回 None（在服务进程内执行）"""
+    global _POOL
+    size = int(os.getenv("CODE_EXECUTOR_POOL_SIZE", os.getenv("CODE_INTERPRETER_CONCURRENCY", 4)))
+    if size <= 0:
+        return None
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ExecutorPool(
+                size=size,
+                authorized_imports=authorized_imports,
+                max_runs=int(os.getenv("CODE_EXECUTOR_MAX_RUNS", 20)),
+                memory_limit=int(os.getenv("CODE_EXECUTOR_MEMORY_LIMIT", 4 * 1024 * 1024 * 1024)),
+                cpu_limit=int(os.getenv("CODE_EXECUTOR_CPU_LIMIT", 300)),
+                timeout=float(os.getenv("CODE_EXECUTOR_TIMEOUT", 120)),
+            )
+    return _POOL
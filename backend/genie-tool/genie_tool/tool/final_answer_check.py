@@ -1,13 +1,64 @@
+import re
+import threading
 from openai import AsyncOpenAI
 
 from smolagents import ChatMessage
 from smolagents import ActionStep
-from typing import Callable, List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Tuple
 from smolagents import MessageRole
 import json_repair
 from loguru import logger as lg
 
 
+# 代码打印出的异常：Traceback 或 "XxxError: ..." 开头的行
+_ERROR_PATTERN = re.compile(r"^(Traceback \(most recent call last\)|\w*(Error|Exception): )", re.MULTILINE)
+
+
+class _FinalCheckStats(object):
+    """终止判断的决策来源计数
+
+    signal_* 为按确定性信号判断、省去 LLM 调用的步骤；llm_check 为调用 LLM 判断的步骤，
+    其中 llm_final 判断为完成，llm_overlapped 在下一步生成期间已返回结果
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def record(self, decision: str):
+        with self._lock:
+            self._counts[decision] = self._counts.get(decision, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._counts)
+        counts["llm_calls_saved"] = sum(v for k, v in counts.items() if k.startswith("signal_"))
+        counts["steps"] = counts["llm_calls_saved"] + counts.get("llm_check", 0)
+        return counts
+
+
+FinalCheckStats = _FinalCheckStats()
+
+
+def decide_by_signals(is_final_answer: bool, execution_logs: str, new_files: List[str]) -> Tuple[Optional[bool], str]:
+    """根据确定性信号判断代码步骤后任务是否完成，返回 (是否完成, 依据)；无法判断时返回 (None, "llm_check")
+
+    - 代码调用了 final_answer：完成
+    - 输出中有异常：未完成，由下一步修正
+    - 没有任何输出，也没有生成文件：未完成
+    - output_dir 中生成了新文件且输出无异常：完成
+    """
+    if is_final_answer:
+        return True, "signal_final_answer"
+    if _ERROR_PATTERN.search(execution_logs or ""):
+        return False, "signal_error_logs"
+    if not (execution_logs or "").strip() and not new_files:
+        return False, "signal_empty_output"
+    if new_files and (execution_logs or "").strip():
+        return True, "signal_output_files"
+    return None, "llm_check"
+
+
 class FinalAnswerCheck(object):
     def __init__(
         self,
@@ -30,8 +81,10 @@ class FinalAnswerCheck(object):
         self.task = task
         self.execution_logs = execution_logs
         self.request_id = request_id
+        # 在调用线程中生成判断用的消息，判断可在其它线程中与下一步并行执行
+        self.inputs = self._build_inputs()
 
-    def check_is_final_answer(self):
+    def _build_inputs(self) -> List[ChatMessage]:
         # 去掉 system
         memory_lines = self.input_messages[2:]
         memory_lines.extend(self.memory_step.to_messages())
@@ -55,8 +108,11 @@ class FinalAnswerCheck(object):
         for input_ in memory_lines:
             inputs.append(input_)
         inputs.append(user_line)
+        return inputs
+
+    def check_is_final_answer(self):
         chat_message: ChatMessage = self.model.generate(
-            inputs, extra_headers={"x-ms-client-request-id": self.request_id},
+            self.inputs, extra_headers={"x-ms-client-request-id": self.request_id},
         )
         obj = json_repair.loads(chat_message.content)
         if obj == None or obj == "":
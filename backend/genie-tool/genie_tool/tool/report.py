@@ -5,19 +5,30 @@
 # Author: liumin.423
 # Date:   2025/7/7
 # =====================
+import asyncio
+import hashlib
+import json
 import os
+import re
 from datetime import datetime
-from typing import Optional, List, Literal, AsyncGenerator
+from typing import Optional, List, Literal, AsyncGenerator, Dict, Any, Tuple
 
 from dotenv import load_dotenv
 from jinja2 import Template
 from loguru import logger
 
-from genie_tool.util.file_util import download_all_files, truncate_files, flatten_search_file
+from genie_tool.db.file_chunk_op import FileChunkOp, split_chunks
+from genie_tool.db.file_table_op import FileInfoOp
+from genie_tool.db.report_table import ReportCache
+from genie_tool.db.report_table_op import ReportCacheOp
+from genie_tool.util.file_util import download_all_files, truncate_files, flatten_search_file, upload_file, \
+    file_id_from_url, is_local_file_server
 from genie_tool.util.prompt_util import get_prompt
 from genie_tool.util.llm_util import ask_llm
 from genie_tool.util.log_util import timer
 from genie_tool.model.context import LLMModelInfoFactory
+from genie_tool.model.report import ReportProgress, ReportOutline
+from genie_tool.util.stream_util import ordered_merge
 
 load_dotenv()
 
@@ -28,26 +39,325 @@ async def report(
         file_names: Optional[List[str]] = tuple(),
         model: str = "gpt-4.1",
         file_type: Literal["markdown", "html", "ppt"] = "markdown",
+        files: Optional[List[Dict[str, Any]]] = None,
 ) -> AsyncGenerator:
+    """files 为已下载的输入文件（download_all_files 的结果），为空时按 file_names 下载"""
     report_factory = {
         "ppt": ppt_report,
         "markdown": markdown_report,
         "html": html_report,
     }
     model = os.getenv("REPORT_MODEL", "gpt-4.1")
-    async for chunk in report_factory[file_type](task, file_names, model):
+    if files is None:
+        files = await download_all_files(file_names)
+    if os.getenv("REPORT_MODE", "truncate") == "retrieval":
+        files = await retrieve_files(task, files, int(LLMModelInfoFactory.get_context_length(model) * 0.8))
+    async for chunk in report_factory[file_type](task, files, model):
         yield chunk
 
 
+async def retrieve_files(task: str, files: List[Dict[str, Any]], max_tokens: int) -> List[Dict[str, Any]]:
+    """REPORT_MODE=retrieval：输入总长度超过 max_tokens 时，已建立切片索引的文件只保留与任务最相关的切片
+
+    未建索引的文件（本地路径、远程文件等）原样保留并优先占用预算；检索不到任何切片时原样返回，由截断逻辑兜底。
+    返回新的文件列表，不修改传入的 files。
+    """
+    if sum(len(f["content"]) for f in files) <= max_tokens:
+        return files
+    file_ids = {file_id_from_url(f["file_name"]): i for i, f in enumerate(files) if "error" not in f}
+    file_ids.pop(None, None)
+    budget = max_tokens - sum(len(f["content"]) for i, f in enumerate(files) if i not in file_ids.values())
+    chunks = await FileChunkOp.search(list(file_ids), task, limit=int(os.getenv("REPORT_RETRIEVAL_TOP_K", 200)))
+    if not chunks:
+        return files
+
+    selected = {}
+    for chunk in chunks:
+        if budget - len(chunk["content"]) < 0:
+            continue
+        budget -= len(chunk["content"])
+        selected.setdefault(file_ids[chunk["file_id"]], []).append(chunk)
+    logger.info(f"retrieve_files {len(chunks)} chunks matched, {sum(len(v) for v in selected.values())} selected")
+
+    retrieved = []
+    for i, f in enumerate(files):
+        if i not in file_ids.values():
+            retrieved.append(f)
+        elif i in selected:
+            f_chunks = sorted(selected[i], key=lambda c: int(c["chunk_idx"]))
+            if f["file_name"].endswith("_search_result.txt"):
+                # 保持搜索结果的 json 结构，下游按文档解析
+                content = json.dumps({"retrieval": [{"title": c["title"], "link": c["link"], "content": c["content"]}
+                                                    for c in f_chunks]}, ensure_ascii=False)
+            else:
+                content = "\n...\n".join(c["content"] for c in f_chunks)
+            retrieved.append({k: v for k, v in f.items() if k != "flat_files"} | {"content": content})
+    return retrieved
+
+
+def share_flatten_results(files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同一批输入生成多种格式时，预先解析一次搜索结果文件，各格式复用解析结果（只读共享）"""
+    for f in files:
+        if f["file_name"].endswith("_search_result.txt"):
+            f["flat_files"] = flatten_search_file(f)
+    return files
+
+
+def _flatten_search_file(f: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return f["flat_files"] if "flat_files" in f else flatten_search_file(f)
+
+
+def _linked_file_urls(content: str) -> List[str]:
+    """内容中引用的本服务文件地址（HTML 的 href / src、markdown 链接等）"""
+    prefix = re.escape(os.getenv("FILE_SERVER_URL", "").rstrip("/"))
+    if not prefix:
+        return []
+    return sorted(set(re.findall(prefix + r"/(?:preview|download)/[^\s\"'<>()]+", content)))
+
+
+async def _linked_file_hashes(files: List[Dict[str, Any]]) -> Optional[List[List[Optional[str]]]]:
+    """各输入文件中引用的文件当前的内容哈希；引用了文件但无法确认其内容（远程文件服务）时返回 None"""
+    hashes = []
+    for f in files:
+        urls = _linked_file_urls(f["content"])
+        if urls and not is_local_file_server():
+            return None
+        stored = [await FileInfoOp.get_by_file_id(file_id_from_url(url)) for url in urls]
+        hashes.append([f"{url}#{s.content_hash if s else None}" for url, s in zip(urls, stored)])
+    return hashes
+
+
+async def report_cache_key(task: str, file_type: str, files: List[Dict[str, Any]]) -> Optional[str]:
+    """报告缓存键：归一化任务、文件类型、模型、生成配置、prompt、各输入文件内容及其引用文件内容的哈希
+
+    有文件下载失败，或引用了无法确认内容的文件时不缓存
+    """
+    if any("error" in f for f in files):
+        return None
+    if (linked := await _linked_file_hashes(files)) is None:
+        return None
+    key = {
+        "task": " ".join((task or "").split()),
+        "file_type": file_type,
+        "model": os.getenv("REPORT_MODEL", "gpt-4.1"),
+        "settings": [os.getenv(k, "") for k in ("REPORT_MODE", "REPORT_MAP_MODEL", "REPORT_GENERATION")],
+        "prompt": hashlib.sha256(json.dumps(get_prompt("report"), sort_keys=True).encode("utf-8")).hexdigest(),
+        "files": [hashlib.sha256(f["content"].encode("utf-8")).hexdigest() for f in files],
+        "linked": linked,
+    }
+    return hashlib.sha256(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def _stored_file_exists(file_info: List[Dict[str, Any]]) -> bool:
+    """缓存记录的文件是否仍在本机存储中（可能已被清理）；远程文件服务无法确认，视为存在"""
+    if not is_local_file_server():
+        return True
+    for f in file_info:
+        if not (file_id := file_id_from_url(f.get("downloadUrl", ""))):
+            continue
+        stored = await FileInfoOp.get_by_file_id(file_id)
+        if not stored or stored.status != 1 or not os.path.exists(stored.file_path):
+            return False
+    return True
+
+
+async def get_cached_report(
+        cache_key: Optional[str],
+        file_name: str,
+        file_type: str,
+        request_id: str,
+) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """命中时返回 (报告内容, fileInfo)。同一请求同名文件（如页面刷新）且文件仍在存储中时直接复用，否则以新文件名重新存储"""
+    ttl = int(os.getenv("REPORT_CACHE_TTL", 0))
+    if not cache_key or ttl <= 0:
+        return None
+    cached = await ReportCacheOp.get(cache_key, ttl=ttl)
+    if not cached:
+        return None
+    logger.info(f"report cache hit: {cache_key}")
+    file_info = json.loads(cached.file_info)
+    if cached.request_id != request_id or cached.file_name != file_name or not await _stored_file_exists(file_info):
+        file_info = [await upload_file(content=cached.content, file_name=file_name, file_type=file_type,
+                                       request_id=request_id)]
+    return cached.content, file_info
+
+
+async def put_cached_report(
+        cache_key: Optional[str],
+        content: str,
+        file_info: List[Dict[str, Any]],
+        file_name: str,
+        request_id: str,
+):
+    ttl = int(os.getenv("REPORT_CACHE_TTL", 0))
+    if not cache_key or ttl <= 0:
+        return
+    await ReportCacheOp.delete_expired(ttl=ttl)
+    await ReportCacheOp.put(ReportCache(
+        cache_key=cache_key, content=content, file_info=json.dumps(file_info, ensure_ascii=False),
+        file_name=file_name, request_id=request_id))
+
+
+async def condense_files(
+        task: str,
+        files: List[Dict[str, Any]],
+        max_tokens: int,
+        condensed: List[Dict[str, Any]],
+) -> AsyncGenerator[ReportProgress, None]:
+    """map-reduce 模式的 map 阶段：把文件切片后用 REPORT_MAP_MODEL 并发抽取与任务相关的信息，结果写入 condensed
+
+    REPORT_MODE: truncate 不做抽取（原有截断逻辑）；map_reduce 总是抽取；auto 仅在总长度超过 max_tokens 时抽取；
+    retrieval 在 report 中按切片索引检索，这里不再抽取。
+    抽取过程中产出 ReportProgress，抽取后仍超长的部分由调用方 truncate_files 兜底。
+    """
+    mode = os.getenv("REPORT_MODE", "truncate")
+    if mode not in ("map_reduce", "auto") or (mode == "auto" and sum(len(f["content"]) for f in files) <= max_tokens):
+        condensed.extend(files)
+        return
+
+    model = os.getenv("REPORT_MAP_MODEL") or os.getenv("REPORT_MODEL", "gpt-4.1")
+    chunk_size = int(os.getenv("REPORT_MAP_CHUNK_SIZE", 8000))
+    semaphore = asyncio.Semaphore(int(os.getenv("REPORT_MAP_CONCURRENCY", 4)))
+    prompt = Template(get_prompt("report")["map_prompt"])
+
+    async def _map(content: str, name: str, index: int, total: int) -> str:
+        async with semaphore:
+            try:
+                result = ""
+                async for result in ask_llm(
+                        messages=prompt.render(task=task, name=name, index=index, total=total, content=content),
+                        model=model, stream=False, temperature=0, only_content=True):
+                    pass
+                return (result or "").strip()
+            except Exception as e:
+                logger.warning(f"condense_files map [{name}] {index}/{total} error: {e}")
+            # 抽取失败时保留原文前部，避免整段丢失
+            return content[: chunk_size // 4]
+
+    pieces = [[f["content"]] for f in files]
+    jobs = {}
+    for i, f in enumerate(files):
+        # 不足 1/8 分片长度的小文件原样保留
+        if len(f["content"]) <= chunk_size // 8:
+            continue
+        pieces[i] = split_chunks(f["content"], chunk_size)
+        name = f.get("title") or f.get("description") or os.path.basename(f.get("file_name") or f.get("link") or "")
+        for j, content in enumerate(pieces[i]):
+            jobs[asyncio.create_task(_map(content, name, j + 1, len(pieces[i])))] = (i, j)
+
+    yield ReportProgress(stage="map", done=0, total=len(jobs))
+    try:
+        for done, task_done in enumerate(asyncio.as_completed(list(jobs)), start=1):
+            await task_done
+            yield ReportProgress(stage="map", done=done, total=len(jobs))
+    finally:
+        for job in jobs:
+            job.cancel()
+    for job, (i, j) in jobs.items():
+        pieces[i][j] = job.result()
+
+    for f, file_pieces in zip(files, pieces):
+        content = "\n".join(p for p in file_pieces if p and p != "无")
+        if content:
+            condensed.append({**f, "content": content})
+    logger.info(f"condense_files {len(jobs)} chunks, {sum(len(f['content']) for f in files)} -> "
+                f"{sum(len(f['content']) for f in condensed)} chars")
+
+
+_SECTIONS_PLACEHOLDER = "<!--SECTIONS-->"
+
+
+def parse_outline(text: str, file_type: str) -> Optional[ReportOutline]:
+    """解析大纲输出，格式不符合要求时返回 None，由调用方回退到整篇生成"""
+    skeleton = ""
+    if match := re.search(r"<skeleton>(.*?)</skeleton>", text, re.S):
+        skeleton = re.sub(r"^```\w*\n|\n```$", "", match.group(1).strip())
+        text = text[:match.start()] + text[match.end():]
+    title = re.search(r"^#\s+(.+)$", text, re.M)
+    sections = [s.strip() for s in re.split(r"^##\s+", text, flags=re.M)[1:] if s.strip()]
+    if not sections:
+        return None
+    outline = ReportOutline(title=title.group(1).strip() if title else "", sections=sections)
+    if file_type in ["html", "ppt"]:
+        if skeleton.count(_SECTIONS_PLACEHOLDER) != 1:
+            return None
+        outline.head, outline.tail = skeleton.split(_SECTIONS_PLACEHOLDER)
+    return outline
+
+
+async def plan_outline(
+        task: str,
+        file_type: str,
+        files: List[Dict[str, Any]],
+        model: str,
+) -> Optional[ReportOutline]:
+    """REPORT_GENERATION=sectioned 时先生成大纲，其他情况或大纲不可用时返回 None"""
+    if os.getenv("REPORT_GENERATION", "sequential") != "sectioned":
+        return None
+    prompt = Template(get_prompt("report")["outline_prompt"]).render(
+        task=task, file_type=file_type, files=files, date=datetime.now().strftime("%Y-%m-%d"),
+        max_sections=int(os.getenv("REPORT_MAX_SECTIONS", 8)))
+    try:
+        text = ""
+        async for text in ask_llm(messages=prompt, model=model, stream=False, temperature=0, only_content=True):
+            pass
+        outline = parse_outline(text or "", file_type)
+    except Exception as e:
+        logger.warning(f"plan_outline error: {e}")
+        return None
+    if not outline:
+        logger.warning(f"plan_outline unusable outline, fallback to sequential generation: {text[:200]}")
+    return outline
+
+
+async def sectioned_report(
+        task: str,
+        file_type: str,
+        files: List[Dict[str, Any]],
+        outline: ReportOutline,
+        model: str,
+        temperature: float = None,
+        top_p: float = None,
+) -> AsyncGenerator[str, None]:
+    """按大纲并发生成各章节，按文档顺序输出：第一个章节实时流式输出，后续章节在前一章结束后立即输出已生成内容"""
+    prompt = Template(get_prompt("report")["section_prompt"])
+    outline_text = "\n".join(f"## {s}" for s in outline.sections)
+    date = datetime.now().strftime("%Y-%m-%d")
+
+    async def _section(index: int, section: str) -> AsyncGenerator[str, None]:
+        if index > 1 and file_type == "markdown":
+            yield "\n\n"
+        async for chunk in ask_llm(
+                messages=prompt.render(
+                    task=task, file_type=file_type, files=files, outline=outline_text, date=date,
+                    index=index, total=len(outline.sections), section=section,
+                    section_title=section.split("\n", 1)[0], skeleton=outline.head + _SECTIONS_PLACEHOLDER + outline.tail),
+                model=model, stream=True, temperature=temperature, top_p=top_p, only_content=True):
+            yield chunk
+        if file_type != "markdown":
+            yield "\n"
+
+    if file_type == "markdown":
+        if outline.title:
+            yield f"# {outline.title}\n\n"
+    else:
+        yield outline.head
+    async for chunk in ordered_merge(
+            [_section(i, section) for i, section in enumerate(outline.sections, start=1)],
+            concurrency=int(os.getenv("REPORT_SECTION_CONCURRENCY", 8))):
+        yield chunk
+    if file_type != "markdown":
+        yield outline.tail
+
+
 @timer(key="enter")
 async def ppt_report(
         task: str,
-        file_names: Optional[List[str]] = tuple(),
+        files: List[Dict[str, Any]],
         model: str = "gpt-4.1",
         temperature: float = None,
         top_p: float = 0.6,
 ) -> AsyncGenerator:
-    files = await download_all_files(file_names)
     flat_files = []
 
     # 1. 首先解析 md html 文件，没有这部分文件则使用全部
@@ -56,11 +366,19 @@ async def ppt_report(
     for f in filtered_files:
         # 对于搜索文件有结构，需要重新解析
         if f["file_name"].endswith("_search_result.txt"):
-            flat_files.extend(flatten_search_file(f))
+            flat_files.extend(_flatten_search_file(f))
         else:
             flat_files.append(f)
 
-    truncate_flat_files = truncate_files(flat_files, max_tokens=int(LLMModelInfoFactory.get_context_length(model) * 0.8))
+    max_tokens = int(LLMModelInfoFactory.get_context_length(model) * 0.8)
+    condensed_files = []
+    async for progress in condense_files(task, flat_files, max_tokens, condensed_files):
+        yield progress
+    truncate_flat_files = truncate_files(condensed_files, max_tokens=max_tokens)
+    if outline := await plan_outline(task, "ppt", truncate_flat_files, model):
+        async for chunk in sectioned_report(task, "ppt", truncate_flat_files, outline, model, temperature, top_p):
+            yield chunk
+        return
     prompt = Template(get_prompt("report")["ppt_prompt"]) \
         .render(task=task, files=truncate_flat_files, date=datetime.now().strftime("%Y-%m-%d"))
 
@@ -72,21 +390,28 @@ async def ppt_report(
 @timer(key="enter")
 async def markdown_report(
         task,
-        file_names: Optional[List[str]] = tuple(),
+        files: List[Dict[str, Any]],
         model: str = "gpt-4.1",
         temperature: float = 0,
         top_p: float = 0.9,
 ) -> AsyncGenerator:
-    files = await download_all_files(file_names)
     flat_files = []
     for f in files:
         # 对于搜索文件有结构，需要重新解析
         if f["file_name"].endswith("_search_result.txt"):
-            flat_files.extend(flatten_search_file(f))
+            flat_files.extend(_flatten_search_file(f))
         else:
             flat_files.append(f)
 
-    truncate_flat_files = truncate_files(flat_files, max_tokens=int(LLMModelInfoFactory.get_context_length(model) * 0.8))
+    max_tokens = int(LLMModelInfoFactory.get_context_length(model) * 0.8)
+    condensed_files = []
+    async for progress in condense_files(task, flat_files, max_tokens, condensed_files):
+        yield progress
+    truncate_flat_files = truncate_files(condensed_files, max_tokens=max_tokens)
+    if outline := await plan_outline(task, "markdown", truncate_flat_files, model):
+        async for chunk in sectioned_report(task, "markdown", truncate_flat_files, outline, model, temperature, top_p):
+            yield chunk
+        return
     prompt = Template(get_prompt("report")["markdown_prompt"]) \
         .render(task=task, files=truncate_flat_files, current_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
@@ -98,12 +423,11 @@ async def markdown_report(
 @timer(key="enter")
 async def html_report(
         task,
-        file_names: Optional[List[str]] = tuple(),
+        files: List[Dict[str, Any]],
         model: str = "gpt-4.1",
         temperature: float = 0,
         top_p: float = 0.9,
 ) -> AsyncGenerator:
-    files = await download_all_files(file_names)
     key_files = []
     flat_files = []
     # 对于搜索文件有结构，需要重新解析
@@ -122,7 +446,7 @@ async def html_report(
                             "description": tf.get("title") or tf["content"][:20],
                             "type": "txt",
                             "link": tf.get("link"),
-                        } for tf in flatten_search_file(f)
+                        } for tf in _flatten_search_file(f)
                     ])
                 except Exception as e:
                     logger.warning(f"html_report parser file [{fpath}] error: {e}")
@@ -135,8 +459,19 @@ async def html_report(
                     "link": fpath
                 })
     discount = int(LLMModelInfoFactory.get_context_length(model) * 0.8)
-    key_files = truncate_files(key_files, max_tokens=discount)
-    flat_files = truncate_files(flat_files, max_tokens=discount - sum([len(f["content"]) for f in key_files]))
+    condensed_key_files, condensed_flat_files = [], []
+    async for progress in condense_files(task, key_files, discount, condensed_key_files):
+        yield progress
+    key_files = truncate_files(condensed_key_files, max_tokens=discount)
+    flat_discount = discount - sum([len(f["content"]) for f in key_files])
+    async for progress in condense_files(task, flat_files, flat_discount, condensed_flat_files):
+        yield progress
+    flat_files = truncate_files(condensed_flat_files, max_tokens=flat_discount)
+    section_files = [{"title": f["description"], "link": f["link"], "content": f["content"]} for f in key_files + flat_files]
+    if outline := await plan_outline(task, "html", section_files, model):
+        async for chunk in sectioned_report(task, "html", section_files, outline, model, temperature, top_p):
+            yield chunk
+        return
 
     report_prompts = get_prompt("report")
     prompt = Template(report_prompts["html_task"]) \
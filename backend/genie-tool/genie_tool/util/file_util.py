@@ -5,58 +5,150 @@
 # Author: liumin.423
 # Date:   2025/7/7
 # =====================
+import asyncio
 import secrets
 import string
 import json
 import os
+import shutil
+import time
 from copy import deepcopy
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import unquote, urlparse
 
 import aiohttp
 from loguru import logger
 
 from genie_tool.util.log_util import timer
 from genie_tool.model.document import Doc
+from genie_tool.model.protocal import get_file_id
+from genie_tool.db.file_table import FileInfo
+from genie_tool.db.file_table_op import FileDB, FileInfoOp, FileTooLargeError, get_file_preview_url, \
+    get_file_download_url
+from genie_tool.util.table_util import COLUMNAR_SUFFIX
+
+
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _download_max_size() -> int:
+    return int(os.getenv("FILE_DOWNLOAD_MAX_SIZE", str(100 * 1024 * 1024)))
+
+
+def _download_timeout() -> aiohttp.ClientTimeout:
+    return aiohttp.ClientTimeout(total=int(os.getenv("FILE_DOWNLOAD_TIMEOUT", 10)))
+
+
+async def _download(session: aiohttp.ClientSession, url: str, sink, max_size: int, truncate: bool = False) -> bool:
+    """把 url 内容按块写入 sink，返回是否因超过 max_size 被截断；truncate=False 时超限直接报错"""
+    size = 0
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
+            if size + len(chunk) > max_size:
+                if not truncate:
+                    raise FileTooLargeError(f"{url} exceeds {max_size} bytes")
+                sink(chunk[: max_size - size])
+                return True
+            sink(chunk)
+            size += len(chunk)
+    return False
+
+
+_LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "0.0.0.0", "::1")
+
+
+def is_local_file_server() -> bool:
+    """FILE_SERVER_URL 是否就是本机 genie-tool：FILE_SERVER_LOCAL=true/false 强制指定，
+    默认 auto 时以回环地址且端口等于 GENIE_TOOL_PORT 判定。多 worker 下各进程共享同一 sqlite 与存储目录"""
+    mode = os.getenv("FILE_SERVER_LOCAL", "auto").lower()
+    if mode in ("true", "false"):
+        return mode == "true"
+    url = urlparse(os.getenv("FILE_SERVER_URL", ""))
+    return url.hostname in _LOOPBACK_HOSTS and str(url.port) == os.getenv("GENIE_TOOL_PORT", "1601")
+
+
+def file_id_from_url(file_name: str) -> Optional[str]:
+    """{FILE_SERVER_URL}/preview|download/{request_id}/{file_name} 对应的 file_id，非本服务地址返回 None"""
+    prefix = os.getenv("FILE_SERVER_URL", "").rstrip("/")
+    for route in ("/preview/", "/download/"):
+        if file_name.startswith(prefix + route):
+            request_id, _, name = file_name[len(prefix + route):].partition("/")
+            return get_file_id(unquote(request_id), unquote(name))
+    return None
+
+
+async def _get_local_file_info(file_name: str) -> Optional[FileInfo]:
+    """把文件服务地址直接解析为本地 FileInfo"""
+    if not is_local_file_server() or not (file_id := file_id_from_url(file_name)):
+        return None
+    return await FileInfoOp.get_cached_by_file_id(file_id)
+
+
+def _read_text(file_path: str, max_size: int) -> str:
+    with open(file_path, "r") as rf:
+        return rf.read(max_size)
+
+
+def _read_prefix(file_path: str, max_size: int) -> Tuple[str, bool]:
+    """读取前 max_size 字节并解码，返回 (内容, 是否被截断)"""
+    with open(file_path, "rb") as rf:
+        content = rf.read(max_size + 1)
+    if len(content) > max_size:
+        return content[:max_size].decode("utf-8", errors="ignore"), True
+    return content.decode("utf-8"), False
 
 
 @timer()
-async def get_file_content(file_name: str) -> str:
+async def get_file_content(file_name: str, session: aiohttp.ClientSession = None, max_size: int = None) -> str:
+    """读取文件内容，超过 max_size 的部分被截断"""
+    max_size = max_size or _download_max_size()
     # local file
     if file_name.startswith("/"):
-        with open(file_name, "r") as rf:
-            return rf.read()
+        return await asyncio.to_thread(_read_text, file_name, max_size)
+    # 本机文件服务，直接读存储目录（在线程池中读取，不阻塞事件循环）
+    elif file_info := await _get_local_file_info(file_name):
+        content, truncated = await asyncio.to_thread(_read_prefix, file_info.file_path, max_size)
+        if truncated:
+            logger.warning(f"File {file_name} truncated to {max_size} bytes")
+        return content
     # file server
     else:
-        b_content = b""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(file_name, timeout=10) as response:
-                while True:
-                    chunk = await response.content.read(1024)
-                    if not chunk:
-                        break
-                    b_content += chunk
-        return b_content.decode("utf-8")
+        chunks = []
+        if session is None:
+            async with aiohttp.ClientSession(timeout=_download_timeout()) as session:
+                truncated = await _download(session, file_name, chunks.append, max_size, truncate=True)
+        else:
+            truncated = await _download(session, file_name, chunks.append, max_size, truncate=True)
+        if truncated:
+            logger.warning(f"File {file_name} truncated to {max_size} bytes")
+            return b"".join(chunks).decode("utf-8", errors="ignore")
+        return b"".join(chunks).decode("utf-8")
+
+
+async def _gather_limited(file_names: List[str], func) -> list:
+    """在共享 session 上以 FILE_DOWNLOAD_CONCURRENCY 并发执行下载，结果保持输入顺序，单个失败返回异常对象"""
+    semaphore = asyncio.Semaphore(int(os.getenv("FILE_DOWNLOAD_CONCURRENCY", 8)))
+    async with aiohttp.ClientSession(timeout=_download_timeout()) as session:
+        async def _one(file_name):
+            async with semaphore:
+                return await func(file_name, session)
+        return await asyncio.gather(*[_one(f) for f in file_names], return_exceptions=True)
 
 
 @timer()
 async def download_all_files(file_names: list[str]) -> List[Dict[str, Any]]:
+    """并发下载文件内容，失败的文件 content 为占位文本，并在 error 字段中给出原因"""
+    results = await _gather_limited(file_names, lambda f, session: get_file_content(f, session=session))
     file_contents = []
-    for file_name in file_names:
-        try:
-            file_contents.append(
-                {
-                    "file_name": file_name,
-                    "content": await get_file_content(file_name),
-                }
-            )
-        except Exception as e:
-            logger.warning(f"Failed to download file {file_name}. Exception: {e}")
-            file_contents.append(
-                {
-                    "file_name": file_name,
-                    "content": "Failed to get content.",
-                }
-            )
+    for file_name, result in zip(file_names, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Failed to download file {file_name}. Exception: {result}")
+            file_contents.append({"file_name": file_name, "content": "Failed to get content.", "error": str(result)})
+        else:
+            file_contents.append({"file_name": file_name, "content": result})
+    if failed := [f["file_name"] for f in file_contents if "error" in f]:
+        logger.warning(f"download_all_files: {len(failed)}/{len(file_names)} files failed: {failed}")
     return file_contents
 
 
@@ -83,6 +175,20 @@ def truncate_files(
     return truncated_files
 
 
+async def _post_file_server(route: str, **kwargs) -> Dict[str, Any]:
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{os.getenv('FILE_SERVER_URL')}/{route}", timeout=10, **kwargs) as response:
+            return json.loads(await response.text())
+
+
+def _normalize_file_name(file_name: str, file_type: str) -> str:
+    if file_type == "markdown":
+        file_type = "md"
+    if not file_name.endswith(file_type):
+        file_name = f"{file_name}.{file_type}"
+    return file_name
+
+
 @timer()
 async def upload_file(
     content: str,
@@ -90,21 +196,23 @@ async def upload_file(
     file_type: str,
     request_id: str,
 ):
-    if file_type == "markdown":
-        file_type = "md"
-    if not file_name.endswith(file_type):
-        file_name = f"{file_name}.{file_type}"
+    file_name = _normalize_file_name(file_name, file_type)
     body = {
         "requestId": request_id,
         "fileName": file_name,
         "content": content,
         "description": content[:200],
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            f"{os.getenv('FILE_SERVER_URL')}/upload_file", json=body, timeout=10
-        ) as response:
-            result = json.loads(await response.text())
+    if is_local_file_server():
+        file_info = await FileInfoOp.add_by_content(
+            filename=file_name, content=content, file_id=get_file_id(request_id, file_name),
+            description=body["description"], request_id=request_id)
+        result = {
+            "downloadUrl": get_file_download_url(file_id=file_info.request_id, file_name=file_info.filename),
+            "domainUrl": get_file_preview_url(file_id=file_info.request_id, file_name=file_info.filename),
+        }
+    else:
+        result = await _post_file_server("upload_file", json=body)
     return {
         "fileName": file_name,
         "ossUrl": result["downloadUrl"],
@@ -124,19 +232,19 @@ async def upload_file_by_path(
     file_name = os.path.basename(file_path)
     file_size = os.path.getsize(file_path)
 
-    data = aiohttp.FormData()
-    data.add_field("requestId", request_id)
-    data.add_field(
-        "file",
-        open(file_path, "rb"),
-        filename=file_name,
-        content_type="application/octet-stream",
-    )
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            f"{os.getenv('FILE_SERVER_URL')}/upload_file_data", data=data, timeout=10
-        ) as response:
-            result = json.loads(await response.text())
+    if is_local_file_server():
+        file_info = await FileInfoOp.add_by_path(
+            file_path=file_path, file_id=get_file_id(request_id, file_name), request_id=request_id)
+        result = {
+            "downloadUrl": get_file_download_url(file_id=file_info.request_id, file_name=file_info.filename),
+            "domainUrl": get_file_preview_url(file_id=file_info.request_id, file_name=file_info.filename),
+        }
+    else:
+        with open(file_path, "rb") as f:
+            data = aiohttp.FormData()
+            data.add_field("requestId", request_id)
+            data.add_field("file", f, filename=file_name, content_type="application/octet-stream")
+            result = await _post_file_server("upload_file_data", data=data)
     return {
         "fileName": file_name,
         "domainUrl": result["domainUrl"],
@@ -145,6 +253,91 @@ async def upload_file_by_path(
     }
 
 
+class StreamingUpload(object):
+    """边生成边写入文件存储
+
+    本机文件服务时先登记 status=0 的文件记录，增量内容缓冲后追加到 .partial 文件，预览地址从一开始即可访问；
+    缓冲超过 FILE_PARTIAL_FLUSH_SIZE 字符或距上次落盘超过 FILE_PARTIAL_FLUSH_INTERVAL 秒时在线程池中落盘，
+    生成过程中内存里只保留未落盘的部分，read 时从 .partial 文件读回全文。
+    commit 时原子写入最终版本并置为 status=1，中断时置为 status=2 并保留已生成部分。
+    远程文件服务时在内存中拼接，commit 时一次上传。
+    """
+
+    def __init__(self, file_name: str, file_type: str, request_id: str):
+        self.file_name = _normalize_file_name(file_name, file_type)
+        self.file_type = file_type
+        self.request_id = request_id
+        self.file_id = get_file_id(request_id, self.file_name)
+        self._chunks = []
+        self._path = None
+        self._pending = []
+        self._pending_size = 0
+        self._flushed_at = 0.0
+        self._flush_size = int(os.getenv("FILE_PARTIAL_FLUSH_SIZE", 16 * 1024))
+        self._flush_interval = float(os.getenv("FILE_PARTIAL_FLUSH_INTERVAL", 0.2))
+
+    async def start(self) -> Optional[Dict[str, Any]]:
+        """返回生成中文件的预览信息，远程文件服务时返回 None"""
+        if not is_local_file_server():
+            return None
+        file_info = await FileInfoOp.add_partial(
+            filename=self.file_name, file_id=self.file_id, request_id=self.request_id)
+        self._path = file_info.file_path
+        self._flushed_at = time.monotonic()
+        return {
+            "fileName": self.file_name,
+            "domainUrl": get_file_preview_url(file_id=self.request_id, file_name=self.file_name),
+            "downloadUrl": get_file_download_url(file_id=self.request_id, file_name=self.file_name),
+        }
+
+    async def write(self, chunk: str):
+        if not self._path:
+            self._chunks.append(chunk)
+            return
+        self._pending.append(chunk)
+        self._pending_size += len(chunk)
+        if self._pending_size >= self._flush_size or time.monotonic() - self._flushed_at >= self._flush_interval:
+            await self._flush()
+
+    @staticmethod
+    def _append(path: str, data: str):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    @staticmethod
+    def _read_file(path: str) -> str:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    async def _flush(self):
+        if self._pending:
+            data = "".join(self._pending)
+            self._pending, self._pending_size = [], 0
+            await asyncio.to_thread(self._append, self._path, data)
+        self._flushed_at = time.monotonic()
+
+    async def read(self) -> str:
+        if self._path:
+            await self._flush()
+            return await asyncio.to_thread(self._read_file, self._path)
+        return "".join(self._chunks)
+
+    async def commit(self, content: str) -> Dict[str, Any]:
+        file_info = await upload_file(
+            content=content, file_name=self.file_name, file_type=self.file_type, request_id=self.request_id)
+        if self._path:
+            self._pending, self._pending_size = [], 0
+            await asyncio.to_thread(os.remove, self._path)
+            self._path = None
+        return file_info
+
+    async def abort(self):
+        if self._path:
+            await self._flush()
+            self._path = None
+            await FileInfoOp.update_status(self.file_id, status=2)
+
+
 def generate_data_id(prefix: str = ""):
     """生成数据业务主键，规则：前缀 - 15位随机字符串（包含数字和字母）"""
     return f"{prefix}_{generate_secure_random_string(15)}"
@@ -167,50 +360,56 @@ def flatten_search_file(s_file: Dict[str, Any]) -> List[Dict[str, Any]]:
     return flat_files
 
 
+def _link_or_copy(src_path: str, dst_path: str):
+    if os.path.exists(dst_path):
+        os.remove(dst_path)
+    try:
+        os.link(src_path, dst_path)
+    except OSError:
+        shutil.copyfile(src_path, dst_path)
+
+
 @timer()
-async def get_file_path(file_name: str, word_dir: str) -> str:
+async def get_file_path(file_name: str, word_dir: str, session: aiohttp.ClientSession = None) -> str:
+    """下载文件到 word_dir，边下载边写盘；超过 FILE_DOWNLOAD_MAX_SIZE 时报错"""
     if file_name.startswith("/"):
         return file_name
-    else:
-        b_content = b""
-        file_path = os.path.join(word_dir, os.path.basename(file_name))
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(file_name, timeout=10) as response:
-                    response.raise_for_status() # 检查HTTP状态码，如果不是2xx则抛出异常
-                    while True:
-                        chunk = await response.content.read(1024)
-                        if not chunk:
-                            break
-                        b_content += chunk
-            except aiohttp.ClientError as e:
-                print(f"下载文件失败: {e}")
-                return None # 或者抛出异常
-            except TimeoutError:
-                print(f"下载文件超时: {file_name}")
-                return ""
-        with open(file_path, "wb") as f: 
-            f.write(b_content)
+    file_path = os.path.join(word_dir, os.path.basename(file_name))
+    # 本机文件服务，直接从存储拷贝到工作目录；存储中的内容被多个请求共享，不能硬链接给生成代码改写
+    if file_info := await _get_local_file_info(file_name):
+        if os.path.getsize(file_info.file_path) > _download_max_size():
+            raise FileTooLargeError(f"{file_name} exceeds {_download_max_size()} bytes")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        await asyncio.to_thread(shutil.copyfile, file_info.file_path, file_path)
+        # 表格文件的列式副本只读，放到 {文件}.arrow 供生成代码直接加载
+        if columnar_path := FileDB.columnar_path(file_info.content_hash):
+            await asyncio.to_thread(_link_or_copy, columnar_path, file_path + COLUMNAR_SUFFIX)
         return file_path
+    try:
+        with open(file_path, "wb") as f:
+            if session is None:
+                async with aiohttp.ClientSession(timeout=_download_timeout()) as session:
+                    await _download(session, file_name, f.write, _download_max_size())
+            else:
+                await _download(session, file_name, f.write, _download_max_size())
+    except BaseException:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return file_path
 
 
 @timer()
 async def download_all_files_in_path(file_names: list[str], work_dir: str) -> List[Dict[str, Any]]:
+    """并发下载文件到 work_dir，失败的文件 file_path 为空，并在 error 字段中给出原因"""
+    results = await _gather_limited(
+        file_names, lambda f, session: get_file_path(file_name=f, word_dir=work_dir, session=session))
     file_paths = []
-    for file_name in file_names:
-        try:
-            file_paths.append(
-                {
-                    "file_name": os.path.basename(file_name),
-                    "file_path": await get_file_path(file_name=file_name, word_dir=work_dir),
-                }
-            )
-        except Exception as e:
-            logger.warning(f"Failed to download file {file_name}. Exception: {e}")
-            file_paths.append(
-                {
-                    "file_name": os.path.basename(file_name),
-                    "file_path": "",
-                }
-            )
+    for file_name, result in zip(file_names, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Failed to download file {file_name}. Exception: {result}")
+            file_paths.append({"file_name": os.path.basename(file_name), "file_path": "", "error": str(result)})
+        else:
+            file_paths.append({"file_name": os.path.basename(file_name), "file_path": result})
     return file_paths
@@ -5,14 +5,13 @@
 # Author: liumin.423
 # Date:   2025/7/8
 # =====================
-import json
 import os
 from typing import List, Any, Optional
 
 from litellm import acompletion
 
 from genie_tool.util.log_util import timer, AsyncTimer
-from genie_tool.util.sensitive_detection import SensitiveWordsReplace
+from genie_tool.util.sensitive_detection import SensitiveWordsReplace, StreamSensitiveWordsReplace
 
 
 @timer(key="enter")
@@ -32,12 +31,7 @@ async def ask_llm(
     if isinstance(messages, str):
         messages = [{"role": "user", "content": messages}]
     if os.getenv("SENSITIVE_WORD_REPLACE", "false") == "true":
-        for message in messages:
-            if isinstance(message.get("content"), str):
-                message["content"] = SensitiveWordsReplace.replace(message["content"])
-            else:
-                message["content"] = json.loads(
-                    SensitiveWordsReplace.replace(json.dumps(message["content"], ensure_ascii=False)))
+        messages = SensitiveWordsReplace.replace_messages(messages)
     response = await acompletion(
         messages=messages,
         model=model,
@@ -47,16 +41,32 @@ async def ask_llm(
         extra_headers=extra_headers,
         **kwargs
     )
+    redact_output = only_content and output_redact_enabled()
     async with AsyncTimer(key=f"exec ask_llm"):
         if stream:
+            redactor = StreamSensitiveWordsReplace() if redact_output else None
             async for chunk in response:
                 if only_content:
                     if chunk.choices and chunk.choices[0] and chunk.choices[0].delta and chunk.choices[0].delta.content:
-                        yield chunk.choices[0].delta.content
+                        content = chunk.choices[0].delta.content
+                        if redactor:
+                            content = redactor.feed(content)
+                        if content:
+                            yield content
                 else:
                     yield chunk
+            if redactor and (tail := redactor.flush()):
+                yield tail
+        elif only_content:
+            content = response.choices[0].message.content
+            yield SensitiveWordsReplace.replace(content) if redact_output and content else content
         else:
-            yield response.choices[0].message.content if only_content else response
+            yield response
+
+
+def output_redact_enabled() -> bool:
+    """模型输出脱敏开关，默认跟随输入脱敏开关 SENSITIVE_WORD_REPLACE"""
+    return os.getenv("SENSITIVE_WORD_REPLACE_OUTPUT", os.getenv("SENSITIVE_WORD_REPLACE", "false")) == "true"
 
 
 if __name__ == "__main__":
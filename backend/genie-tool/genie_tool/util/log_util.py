@@ -7,12 +7,116 @@
 # =====================
 import asyncio
 import functools
+import os
+import random
+import queue
+import sys
+import threading
 import time
 import traceback
+from pathlib import Path
+from typing import Optional
+
 from loguru import logger
 
 from genie_tool.model.context import RequestIdCtx
 
+LOG_FORMAT = "{time:YYYY-MM-DD HH:mm:ss.SSS} {level} {module}.{function} {message}"
+
+
+def _parse_module_levels(value: str) -> dict:
+    """解析 LOG_LEVELS，格式如 genie_tool.db=WARNING,genie_tool.tool.ci_agent=DEBUG"""
+    levels = {}
+    for item in value.split(","):
+        if "=" in item:
+            module, level = item.split("=", 1)
+            levels[module.strip()] = level.strip().upper()
+    return levels
+
+
+class QueueFileSink(object):
+    """后台线程写文件的 loguru sink
+
+    调用方只把格式化好的日志放入内存队列（无 pickle、无磁盘 IO），后台线程批量写入并按字节数轮转。
+    比 loguru 的 enqueue=True（多进程队列 + pickle）在调用处的开销更低。
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 200 * 1024 * 1024, backup_count: int = 5):
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._queue = queue.SimpleQueue()
+        self._file = open(self._path, "ab")
+        self._size = self._file.tell()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message: str):
+        self._queue.put(message)
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        while True:
+            messages = [self._queue.get()]
+            while not self._queue.empty():
+                messages.append(self._queue.get_nowait())
+            stop = messages[-1] is None
+            data = "".join(m for m in messages if m is not None).encode("utf-8")
+            if data:
+                self._file.write(data)
+                self._file.flush()
+                self._size += len(data)
+                if self._size >= self._max_bytes:
+                    self._rotate()
+            if stop:
+                return
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self._backup_count - 1, 0, -1):
+            src = self._path.with_name(f"{self._path.name}.{i}")
+            if src.exists():
+                src.replace(self._path.with_name(f"{self._path.name}.{i + 1}"))
+        self._path.replace(self._path.with_name(f"{self._path.name}.1"))
+        self._file = open(self._path, "ab")
+        self._size = 0
+
+
+def setup_logging(log_path: Optional[str | Path] = None, console: bool = True):
+    """日志初始化
+
+    文件写入由 QueueFileSink 的后台线程完成，不阻塞事件循环；
+    LOG_JSON=true 时文件按 JSON 行输出；LOG_LEVELS 可按模块单独设置级别。
+    """
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    module_levels = {"": level, **_parse_module_levels(os.getenv("LOG_LEVELS", ""))}
+    # sink 级别取所有配置中的最低级别，低于该级别的日志在调用处直接丢弃，不做格式化
+    min_level = min(module_levels.values(), key=lambda name: logger.level(name).no)
+
+    logger.remove()
+    if console:
+        logger.add(sys.stderr, format=LOG_FORMAT, level=min_level, filter=module_levels)
+    if log_path:
+        sink = QueueFileSink(log_path, max_bytes=int(os.getenv("LOG_MAX_BYTES", str(200 * 1024 * 1024))))
+        logger.add(sink, format=LOG_FORMAT, level=min_level, filter=module_levels,
+                   serialize=os.getenv("LOG_JSON", "false") == "true")
+
+
+def loggable_body(body: bytes) -> Optional[str]:
+    """按 LOG_BODY_SAMPLE_RATE 采样并按 LOG_BODY_MAX_SIZE 截断请求体，未采中时返回 None"""
+    sample_rate = float(os.getenv("LOG_BODY_SAMPLE_RATE", "1"))
+    if sample_rate < 1 and random.random() >= sample_rate:
+        return None
+    max_size = int(os.getenv("LOG_BODY_MAX_SIZE", "2048"))
+    if len(body) > max_size:
+        return f"{body[:max_size].decode('utf-8', errors='ignore')}...(total {len(body)} bytes)"
+    return body.decode("utf-8", errors="ignore")
+
 
 class Timer(object):
     def __init__(self, key: str):
@@ -20,14 +124,14 @@ class Timer(object):
 
     def __enter__(self):
         self.start_time = time.time()
-        logger.info(f"{RequestIdCtx.request_id} {self.key} start...")
+        logger.debug("{} {} start...", RequestIdCtx.request_id, self.key)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type is not None:
             logger.error(f"{RequestIdCtx.request_id} {self.key} error={exc_tb}")
         else:
-            logger.info(f"{RequestIdCtx.request_id} {self.key} cost=[{int((time.time() - self.start_time) * 1000)} ms]")
+            logger.info("{} {} cost=[{} ms]", RequestIdCtx.request_id, self.key, int((time.time() - self.start_time) * 1000))
 
 
 class AsyncTimer(object):
@@ -36,14 +140,14 @@ class AsyncTimer(object):
 
     async def __aenter__(self):
         self.start_time = time.time()
-        logger.info(f"{RequestIdCtx.request_id} {self.key} start...")
+        logger.debug("{} {} start...", RequestIdCtx.request_id, self.key)
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if exc_type is not None:
             logger.error(f"{RequestIdCtx.request_id} {self.key} error={traceback.format_exc()}")
         else:
-            logger.info(f"{RequestIdCtx.request_id} {self.key} cost=[{int((time.time() - self.start_time) * 1000)} ms]")
+            logger.info("{} {} cost=[{} ms]", RequestIdCtx.request_id, self.key, int((time.time() - self.start_time) * 1000))
 
 
 def timer(key: str = ""):
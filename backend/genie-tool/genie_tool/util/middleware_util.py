@@ -5,6 +5,7 @@
 # Author: liumin.423
 # Date:   2025/7/7
 # =====================
+import os
 import time
 import traceback
 import uuid
@@ -12,22 +13,41 @@ from typing import Callable
 
 from fastapi.routing import APIRoute
 from loguru import logger
-from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.datastructures import MutableHeaders
 from starlette.requests import Request
 from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from genie_tool.model.context import RequestIdCtx
-from genie_tool.util.log_util import AsyncTimer
+from genie_tool.util.log_util import loggable_body
 
 
-class UnknownException(BaseHTTPMiddleware):
+class UnknownException(object):
+    """兜底异常处理（纯 ASGI 实现，不包装响应体，流式响应不受影响）"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def _send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
 
-    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
         try:
-            return await call_next(request)
+            await self.app(scope, receive, _send)
         except Exception as e:
-            logger.error(f"{RequestIdCtx.request_id} {request.method} {request.url.path} error={traceback.format_exc()}")
-            return Response(content=f"Unexpected error: {e}", status_code=500)
+            logger.error(f"{RequestIdCtx.request_id} {scope['method']} {scope['path']} error={traceback.format_exc()}")
+            if response_started:
+                raise
+            await Response(content=f"Unexpected error: {e}", status_code=500)(scope, receive, send)
 
 
 class RequestHandlerRoute(APIRoute):
@@ -39,8 +59,9 @@ class RequestHandlerRoute(APIRoute):
             try:
                 content_type = request.headers.get('content-type', '')
                 if request.method == "POST" and not content_type.startswith('multipart/form-data'):
-                    body = (await request.body()).decode("utf-8")
-                    logger.info(f"{RequestIdCtx.request_id} {request.method} {request.url.path} body={body}")
+                    body = loggable_body(await request.body())
+                    if body is not None:
+                        logger.info("{} {} {} body={}", RequestIdCtx.request_id, request.method, request.url.path, body)
             except Exception as e:
                 logger.warning(f"{RequestIdCtx.request_id} {request.method} {request.url.path} failed. error={e}")
 
@@ -49,11 +70,49 @@ class RequestHandlerRoute(APIRoute):
         return custom_route_handler
 
 
-class HTTPProcessTimeMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        RequestIdCtx.request_id = str(uuid.uuid4())
-        async with AsyncTimer(key=f"{request.method} {request.url.path}") as t:
-            response = await call_next(request)
-            process_time = int((time.time() - t.start_time) * 1000)
-            response.headers["X-Process-Time"] = str(process_time)
-        return response
+class HTTPProcessTimeMiddleware(object):
+    """请求计时（纯 ASGI 实现）
+
+    优先复用调用方传入的 request id 头，便于跨服务串联日志；响应头 X-Process-Time 为首字节耗时，
+    日志中同时记录首字节与末字节耗时，流式响应也能得到正确的总耗时。
+    """
+
+    def __init__(self, app: ASGIApp, header_name: str = None):
+        self.app = app
+        self.header_name = header_name or os.getenv("REQUEST_ID_HEADER", "X-Request-Id")
+        self._header_key = self.header_name.lower().encode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == self._header_key:
+                request_id = value.decode("latin-1")
+                break
+        request_id = request_id or str(uuid.uuid4())
+        RequestIdCtx.request_id = request_id
+        start_time = time.perf_counter()
+        first_byte = None
+
+        async def _send(message: Message) -> None:
+            nonlocal first_byte
+            if message["type"] == "http.response.start":
+                first_byte = int((time.perf_counter() - start_time) * 1000)
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Process-Time", str(first_byte))
+                headers.append(self.header_name, request_id)
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                logger.info("{} {} {} cost=[first_byte={} ms, last_byte={} ms]", request_id, scope["method"], scope["path"],
+                            first_byte, int((time.perf_counter() - start_time) * 1000))
+
+        try:
+            await self.app(scope, receive, _send)
+        except Exception:
+            logger.error("{} {} {} failed cost=[first_byte={} ms, elapsed={} ms] error={}", request_id, scope["method"],
+                         scope["path"], first_byte, int((time.perf_counter() - start_time) * 1000),
+                         traceback.format_exc())
+            raise
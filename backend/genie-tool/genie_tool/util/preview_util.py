@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/9
+# =====================
+import csv
+import mmap
+import os
+import struct
+import uuid
+from array import array
+from typing import List, Optional, Tuple
+
+from genie_tool.db.file_table import FileInfo
+from genie_tool.db.file_table_op import FileDB, LINE_INDEX_SUFFIX
+from genie_tool.util.log_util import timer
+
+
+# 稀疏行索引：每 _STRIDE 行记录一次起始字节偏移，500 MB / 500 万行的文件索引约 160 KB
+_STRIDE = 256
+_MAGIC = b"GTLINES1"
+# magic, 文件大小, stride, 总行数
+_HEADER = struct.Struct("<8sQQQ")
+
+TABULAR_DELIMITERS = {"csv": ",", "tsv": "\t"}
+
+
+def line_index_path(file_info: FileInfo) -> str:
+    """索引与内容绑定：有 sha256 时放在 blob 旁，内容相同的文件共用一份；否则放在文件旁"""
+    if file_info.content_hash:
+        return FileDB.blob_path(file_info.content_hash) + LINE_INDEX_SUFFIX
+    return file_info.file_path + LINE_INDEX_SUFFIX
+
+
+def build_line_index(file_path: str, index_path: str, stride: int = _STRIDE) -> Tuple[int, array]:
+    """扫描一遍文件生成行索引并原子写入 index_path，返回 (总行数, 偏移数组)"""
+    size = os.path.getsize(file_path)
+    offsets = array("Q", [0])
+    total = 0
+    if size:
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos < size:
+                total += 1
+                newline = mm.find(b"\n", pos)
+                if newline < 0:
+                    break
+                pos = newline + 1
+                if total % stride == 0 and pos < size:
+                    offsets.append(pos)
+    # 同一进程内多个线程可能同时为同一文件建索引，临时文件名需唯一
+    tmp_path = f"{index_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, size, stride, total))
+            offsets.tofile(f)
+        os.replace(tmp_path, index_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return total, offsets
+
+
+def load_line_index(file_path: str, index_path: str) -> Optional[Tuple[int, int, array]]:
+    """读取行索引，返回 (stride, 总行数, 偏移数组)；不存在或与文件大小不符时返回 None"""
+    try:
+        with open(index_path, "rb") as f:
+            magic, size, stride, total = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or size != os.path.getsize(file_path):
+                return None
+            offsets = array("Q")
+            offsets.frombytes(f.read())
+            return stride, total, offsets
+    except (FileNotFoundError, struct.error):
+        return None
+
+
+def read_lines(file_path: str, index_path: str, start: int, limit: int) -> Tuple[List[str], int]:
+    """按行号区间读取 [start, start + limit)，通过 mmap 定位，不读入整个文件；返回 (行列表, 总行数)"""
+    if not (index := load_line_index(file_path, index_path)):
+        total, offsets = build_line_index(file_path, index_path)
+        index = (_STRIDE, total, offsets)
+    stride, total, offsets = index
+    if start >= total or limit <= 0:
+        return [], total
+    size = os.path.getsize(file_path)
+    lines = []
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = offsets[start // stride]
+        for _ in range(start % stride):
+            pos = mm.find(b"\n", pos) + 1
+        while len(lines) < limit and pos < size:
+            end = mm.find(b"\n", pos)
+            if end < 0:
+                end = size
+            lines.append(mm[pos:end].decode("utf-8", errors="replace").rstrip("\r"))
+            pos = end + 1
+    return lines, total
+
+
+def parse_rows(lines: List[str], delimiter: str) -> List[List[str]]:
+    """按行解析表格；字段内含换行的 CSV 在逐行分页时会被拆开，此类行按原样返回单列"""
+    rows = []
+    for line in lines:
+        try:
+            rows.append(next(csv.reader([line], delimiter=delimiter)))
+        except (csv.Error, StopIteration):
+            rows.append([line])
+    return rows
+
+
+@timer()
+def preview_lines(file_info: FileInfo, start: int, limit: int) -> dict:
+    """文本文件分页预览；csv / tsv 额外返回表头与解析后的行"""
+    index_path = line_index_path(file_info)
+    lines, total = read_lines(file_info.file_path, index_path, start, limit)
+    result = {"start": start, "count": len(lines), "totalLines": total, "lines": lines}
+    if delimiter := TABULAR_DELIMITERS.get(file_info.filename.rsplit(".", 1)[-1].lower()):
+        header = lines[:1] if start == 0 else read_lines(file_info.file_path, index_path, 0, 1)[0]
+        result["header"] = parse_rows(header, delimiter)[0] if header else []
+        result["rows"] = parse_rows(lines, delimiter)
+    return result
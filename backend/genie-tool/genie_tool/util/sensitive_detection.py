@@ -1,51 +1,181 @@
 # -*- coding: utf-8 -*-
 # =====================
-# 
-# 
+#
+#
 # Author: liumin.423
 # Date:   2025/6/4
 # =====================
 import re
+from functools import lru_cache
+from typing import Any, List
 
 
 class SensitiveWordsReplace:
+    # 各规则的左边界：email 不能接在 [\w-] 之后，数字类不能接在字母数字之后
+    _WORD_BOUNDARY = r"(?<![A-Za-z_\d])"
+    _EMAIL_BOUNDARY = r"(?<![a-zA-Z0-9_-])"
+
     """https://github.com/cdoco/common-regex"""
-    EMAIL_PATTERN = r"[a-zA-Z0-9_-]+@[a-zA-Z0-9_-]+(\.[a-zA-Z0-9_-]+)+"
+    _EMAIL_BODY = r"[a-zA-Z0-9_-]+@[a-zA-Z0-9_-]+(?:\.[a-zA-Z0-9_-]+)+"
+    EMAIL_PATTERN = _EMAIL_BOUNDARY + _EMAIL_BODY
 
     """https://github.com/VincentSit/ChinaMobilePhoneNumberRegex"""
-    PHONE_PATTERN = r"(?<![A-Za-z_\d])(1[3-9]\d{9})(?![A-Za-z_\d])"
+    _PHONE_BODY = r"1[3-9]\d{9}(?![A-Za-z_\d])"
+    PHONE_PATTERN = _WORD_BOUNDARY + _PHONE_BODY
+
+    _ID_BODY = r"(?:[1-6][1-7]|50|71|81|82)\d{4}(?:19|20)\d{2}(?:0[1-9]|10|11|12)(?:[0-2][1-9]|10|20|30|31)\d{3}[0-9Xx](?![\dA-Za-z_])"
+    ID_PATTERN = _WORD_BOUNDARY + _ID_BODY
+
+    _BANK_ID_BODY = r"62(?:\d{14}|\d{17})(?![\dA-Za-z_])"
+    BANK_ID_PATTERN = _WORD_BOUNDARY + _BANK_ID_BODY
+
+    # 单次扫描时各类敏感信息的匹配顺序（与原先多次 re.sub 的先后顺序一致）及默认替换词
+    _KINDS = (
+        ("email", r"(?<!-)" + _EMAIL_BODY, "***"),
+        ("phone", _PHONE_BODY, "*" * 11),
+        ("id", _ID_BODY, "*" * 18),
+        ("bank", _BANK_ID_BODY, "*" * 19),
+    )
+
+    # 图片等 base64 data url 不做扫描；只有头部合法且其余部分全为 base64 字符时才跳过
+    _DATA_URL_HEADER = re.compile(r"data:[\w.+-]+/[\w.+-]+(?:;[^,]*)?;base64,")
+    _BASE64_BODY = re.compile(r"[A-Za-z0-9+/=\r\n]*")
+
+    @classmethod
+    def _is_data_url(cls, content: str) -> bool:
+        header = cls._DATA_URL_HEADER.match(content)
+        return header is not None and cls._BASE64_BODY.fullmatch(content, header.end()) is not None
+
+    @classmethod
+    @lru_cache(maxsize=16)
+    def _scanner(cls, kinds: tuple) -> re.Pattern | None:
+        """把启用的规则编译为一个带命名分组的正则，共用左边界断言，一次扫描即可命中所有类型"""
+        patterns = [f"(?P<{name}>{pattern})" for name, pattern, _ in cls._KINDS if name in kinds]
+        if not patterns:
+            return None
+        return re.compile(f"{cls._WORD_BOUNDARY}(?=[a-zA-Z0-9_-])(?:{'|'.join(patterns)})")
+
+    @classmethod
+    def _replacer(cls, kinds: tuple, replace_word: str):
+        words = {name: word for name, _, word in cls._KINDS}
+        if replace_word is not None:
+            words["email"] = replace_word
+        scanner = cls._scanner(kinds)
 
-    ID_PATTERN = r"(?:[^\dA-Za-z_]|^)((?:[1-6][1-7]|50|71|81|82)\d{4}(?:19|20)\d{2}(?:0[1-9]|10|11|12)(?:[0-2][1-9]|10|20|30|31)\d{3}[0-9Xx])(?:[^\dA-Za-z_]|$)"
+        def _sub(content: str) -> str:
+            if scanner is None or not content or (content.startswith("data:") and cls._is_data_url(content)):
+                return content
+            return scanner.sub(lambda m: words[m.lastgroup], content)
+        return _sub
 
-    BANK_ID_PATTERN = r"(?:[^\dA-Za-z_]|^)(62(?:\d{14}|\d{17}))(?:[^\dA-Za-z_]|$"
+    @staticmethod
+    def _enabled_kinds(remove_email=True, remove_phone_number=True, remove_id_number=True, remove_bank_id=True) -> tuple:
+        return tuple(name for name, enabled in (
+            ("email", remove_email), ("phone", remove_phone_number),
+            ("id", remove_id_number), ("bank", remove_bank_id)) if enabled)
 
     @classmethod
     def replace(cls, content, remove_email=True, remove_phone_number=True,
                 remove_id_number=True, remove_bank_id=True,
                 replace_word: str = "***", **kwargs):
-        if remove_email:
-            content = cls.replace_email(content, replace_word=replace_word)
-        if remove_phone_number:
-            content = cls.replace_phone_number(content)
-        if remove_id_number:
-            content = cls.replace_id_number(content)
-        if remove_bank_id:
-            content = cls.replace_bank_id_number(content)
+        kinds = cls._enabled_kinds(remove_email, remove_phone_number, remove_id_number, remove_bank_id)
+        return cls._walk(content, cls._replacer(kinds, replace_word))
+
+    @classmethod
+    def replace_messages(cls, messages: List[dict], **kwargs) -> List[dict]:
+        """对整个 messages 列表脱敏，结构化 content（多模态 list/dict）直接遍历，不再经过 json 序列化"""
+        kinds = cls._enabled_kinds(**{k: v for k, v in kwargs.items() if k.startswith("remove_")})
+        sub = cls._replacer(kinds, kwargs.get("replace_word", "***"))
+        redacted = []
+        for message in messages:
+            if isinstance(message, dict) and "content" in message:
+                message = {**message, "content": cls._walk(message["content"], sub)}
+            redacted.append(message)
+        return redacted
+
+    @classmethod
+    def _walk(cls, content: Any, sub) -> Any:
+        if isinstance(content, str):
+            return sub(content)
+        if isinstance(content, list):
+            return [cls._walk(c, sub) for c in content]
+        if isinstance(content, dict):
+            # 与原先整体 json 序列化后替换一致，key 同样脱敏
+            return {(sub(k) if isinstance(k, str) else k): cls._walk(v, sub) for k, v in content.items()}
         return content
 
     @classmethod
     def replace_email(cls, content: str, replace_word: str = "***"):
-        return re.sub(cls.EMAIL_PATTERN, replace_word, content)
+        return cls._scanner(("email",)).sub(replace_word, content)
 
     @classmethod
     def replace_phone_number(cls, content: str, replace_word: str = "*" * 11):
-        return re.sub(cls.PHONE_PATTERN, replace_word, content)
+        return cls._scanner(("phone",)).sub(replace_word, content)
 
     @classmethod
     def replace_id_number(cls, content: str, replace_word: str = "*" * 18):
-        return re.sub(cls.ID_PATTERN, replace_word, content)
+        return cls._scanner(("id",)).sub(replace_word, content)
 
     @classmethod
     def replace_bank_id_number(cls, content: str, replace_word: str = "*" * 19):
-        return re.sub(cls.ID_PATTERN, replace_word, content)
+        return cls._scanner(("bank",)).sub(replace_word, content)
+
+
+class StreamSensitiveWordsReplace(object):
+    """流式输出脱敏：跨 chunk 匹配敏感信息，只扣留末尾可能构成匹配的最短片段
+
+    末尾由 [A-Za-z0-9_.@-] 组成的连续片段可能与下一个 chunk 拼成敏感信息，需要暂存；
+    暂存长度上限为 max_hold 个字符，超过后强制输出，保证额外延迟有界。
+    """
+    _TAIL_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-.@")
+
+    def __init__(self, max_hold: int = 64, **kwargs):
+        self._max_hold = max_hold
+        kinds = SensitiveWordsReplace._enabled_kinds(**{k: v for k, v in kwargs.items() if k.startswith("remove_")})
+        self._scanner = SensitiveWordsReplace._scanner(kinds)
+        self._words = {name: word for name, _, word in SensitiveWordsReplace._KINDS}
+        self._words["email"] = kwargs.get("replace_word", "***")
+        # 上一次已输出内容的最后一个字符，作为左边界断言的上下文
+        self._context = ""
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        if not chunk:
+            return ""
+        self._pending += chunk
+        cut = len(self._pending)
+        while cut > 0 and self._pending[cut - 1] in self._TAIL_CHARS:
+            cut -= 1
+        cut = max(cut, len(self._pending) - self._max_hold)
+        return self._emit(cut)
+
+    def flush(self) -> str:
+        return self._emit(len(self._pending), final=True)
 
+    def _emit(self, cut: int, final: bool = False) -> str:
+        if cut <= 0:
+            return ""
+        text = self._context + self._pending
+        offset = len(self._context)
+        if self._scanner is None:
+            out = self._pending[:cut]
+        else:
+            parts = []
+            pos = offset
+            for m in self._scanner.finditer(text, offset):
+                if m.start() >= offset + cut:
+                    break
+                # 强制输出时匹配可能跨过切分点，整体输出以免泄露半截
+                if m.end() >= len(text) and not final:
+                    cut = m.start() - offset
+                    break
+                parts.append(text[pos:m.start()])
+                parts.append(self._words[m.lastgroup])
+                pos = m.end()
+                cut = max(cut, pos - offset)
+            parts.append(text[pos:offset + cut])
+            out = "".join(parts)
+        if cut > 0:
+            self._context = self._pending[cut - 1]
+            self._pending = self._pending[cut:]
+        return out
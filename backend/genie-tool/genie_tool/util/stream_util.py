@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/8
+# =====================
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import Any, AsyncGenerator, AsyncIterable, Callable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from genie_tool.model.protocal import StreamMode
+
+
+class _Heartbeat(object):
+    def __repr__(self):
+        return "HEARTBEAT"
+
+
+# 流长时间无输出时产出的心跳标记，由接口层转换为 SSE 心跳事件
+HEARTBEAT = _Heartbeat()
+
+_DONE = object()
+
+
+class _SourceError(object):
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def approx_tokens(text: str) -> int:
+    """近似 token 数：非 ASCII 字符（中文等）按 1 个 token，ASCII 字符按 4 个字符 1 个 token"""
+    n_chars = len(text)
+    # utf-8 下常见中文为 3 字节，据此估算非 ASCII 字符数
+    n_wide = (len(text.encode("utf-8")) - n_chars) // 2
+    return n_wide + (n_chars - n_wide + 3) // 4
+
+
+async def coalesce_stream(
+        source: AsyncIterable[Any],
+        stream_mode: Optional[StreamMode] = None,
+        max_latency: Optional[float] = None,
+        heartbeat: Optional[float] = 15,
+        max_pending: int = 256,
+) -> AsyncGenerator[Any, None]:
+    """SSE 输出合并：把 LLM 的增量文本按 token 数或时间批量输出
+
+    - general: 每个增量单独输出
+    - token: 累计近似 token 数达到 stream_mode.token 时输出
+    - time: 距上次输出超过 stream_mode.time 秒时输出
+    任何缓存的文本最多等待 max_latency 秒（time 模式为 stream_mode.time）。
+    非 str 的元素（代码、最终结果等）先冲刷缓存再原样输出，保持顺序。
+    上游在独立 task 中读取并写入有界队列：客户端慢时队列积压，合并模式下一次取空队列合并为一批，
+    队列满则上游等待（背压）。超过 heartbeat 秒无任何输出时产出 HEARTBEAT。
+    """
+    stream_mode = stream_mode or StreamMode()
+    mode = stream_mode.mode
+    if max_latency is None:
+        max_latency = float(stream_mode.time) if mode == "time" else 1.0
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+
+    async def _produce():
+        try:
+            async for item in source:
+                await queue.put(item)
+            await queue.put(_DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(_SourceError(e))
+
+    producer = asyncio.create_task(_produce())
+    buffer = []
+    buffer_tokens = 0
+    first_at = None
+    last_flush = last_emit = loop.time()
+
+    def _flush() -> str:
+        nonlocal buffer, buffer_tokens, first_at, last_flush, last_emit
+        content = "".join(buffer)
+        buffer, buffer_tokens, first_at = [], 0, None
+        last_flush = last_emit = loop.time()
+        return content
+
+    def _timeout() -> Optional[float]:
+        now = loop.time()
+        if buffer:
+            deadline = first_at + max_latency
+            if mode == "time":
+                deadline = min(deadline, last_flush + stream_mode.time)
+            return max(deadline - now, 0)
+        if heartbeat:
+            return max(last_emit + heartbeat - now, 0)
+        return None
+
+    try:
+        while True:
+            if not queue.empty():
+                item = queue.get_nowait()
+            else:
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=_timeout())
+                except asyncio.TimeoutError:
+                    if buffer:
+                        yield _flush()
+                    else:
+                        last_emit = loop.time()
+                        yield HEARTBEAT
+                    continue
+
+            if item is _DONE:
+                break
+            if isinstance(item, _SourceError):
+                if buffer:
+                    yield _flush()
+                raise item.error
+            if not isinstance(item, str):
+                if buffer:
+                    yield _flush()
+                last_emit = loop.time()
+                yield item
+                continue
+            if not item:
+                continue
+            if mode == "general":
+                last_emit = loop.time()
+                yield item
+                continue
+
+            if not buffer:
+                first_at = loop.time()
+            buffer.append(item)
+            if mode == "token":
+                buffer_tokens += approx_tokens(item)
+            # 队列中还有积压时继续合并，客户端越慢单批越大
+            if not queue.empty():
+                continue
+            now = loop.time()
+            if (mode == "token" and buffer_tokens >= stream_mode.token) \
+                    or (mode == "time" and now - last_flush >= stream_mode.time) \
+                    or now - first_at >= max_latency:
+                yield _flush()
+        if buffer:
+            yield _flush()
+    finally:
+        if not producer.done():
+            producer.cancel()
+
+
+async def ordered_merge(streams: List[AsyncIterable[Any]], concurrency: int = 4) -> AsyncGenerator[Any, None]:
+    """并发消费多个流并按顺序输出：第 i 个流实时透传，后面的流先缓存，前一个流结束后立即冲刷
+
+    最多 concurrency 个流同时运行，按顺序获得执行权；任意一个流出错时取消其余流并抛出异常。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    queues = [asyncio.Queue() for _ in streams]
+
+    async def _consume(stream: AsyncIterable[Any], queue: asyncio.Queue):
+        try:
+            async with semaphore:
+                async for item in stream:
+                    queue.put_nowait(item)
+            queue.put_nowait(_DONE)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            queue.put_nowait(_SourceError(e))
+
+    tasks = [asyncio.create_task(_consume(s, q)) for s, q in zip(streams, queues)]
+    try:
+        for queue in queues:
+            while (item := await queue.get()) is not _DONE:
+                if isinstance(item, _SourceError):
+                    raise item.error
+                yield item
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def merge_streams(streams: List[AsyncIterable[Any]]) -> AsyncGenerator[Tuple[int, Any], None]:
+    """并发消费多个流，按到达顺序输出 (流序号, 元素)；任意一个流出错时取消其余流并抛出异常"""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def _consume(idx: int, stream: AsyncIterable[Any]):
+        try:
+            async for item in stream:
+                queue.put_nowait((idx, item))
+            queue.put_nowait((idx, _DONE))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            queue.put_nowait((idx, _SourceError(e)))
+
+    tasks = [asyncio.create_task(_consume(i, s)) for i, s in enumerate(streams)]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            idx, item = await queue.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, _SourceError):
+                raise item.error
+            else:
+                yield idx, item
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def iterate_in_thread(
+        factory: Callable[[], Iterator[Any]],
+        executor: Optional[Executor] = None,
+        on_cancel: Optional[Callable[[], None]] = None,
+        on_abandoned: Optional[Callable[[], None]] = None,
+) -> AsyncGenerator[Any, None]:
+    """在工作线程中迭代同步生成器，产出经队列交给事件循环，同步代码不阻塞事件循环
+
+    消费方提前退出（客户端断开、任务取消）时通知线程在下一个产出处停止并关闭生成器，在事件循环上调用 on_cancel 后
+    立即返回，不等待线程结束；此时生成器使用的资源由 on_abandoned 清理，它在线程结束之后于线程中调用。
+    正常结束或生成器出错时不调用 on_abandoned，调用方在消费完最后一个产出后自行清理。
+    消费方应通过 contextlib.aclosing 使用，保证提前退出时立即执行上述处理。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    lock = threading.Lock()
+    running = True
+
+    def _put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # 事件循环已关闭
+            cancelled.set()
+
+    def _abandoned():
+        try:
+            on_abandoned()
+        except Exception as e:
+            logger.warning(f"iterate_in_thread on_abandoned error: {e}")
+
+    def _worker():
+        nonlocal running
+        try:
+            iterator = factory()
+            try:
+                for item in iterator:
+                    if cancelled.is_set():
+                        break
+                    _put(item)
+            finally:
+                if hasattr(iterator, "close"):
+                    iterator.close()
+        except BaseException as e:
+            result = _SourceError(e)
+        else:
+            result = _DONE
+        with lock:
+            running = False
+            abandoned = cancelled.is_set()
+        if not abandoned:
+            _put(result)
+        elif on_abandoned:
+            _abandoned()
+
+    loop.run_in_executor(executor, _worker)
+    finished = False
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                finished = True
+                break
+            if isinstance(item, _SourceError):
+                finished = True
+                raise item.error
+            yield item
+    finally:
+        if not finished:
+            with lock:
+                cancelled.set()
+                worker_done = not running
+            if on_cancel:
+                on_cancel()
+            # 线程已结束但结果尚未被消费时，线程不会再调用 on_abandoned
+            if worker_done and on_abandoned:
+                loop.run_in_executor(None, _abandoned)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# =====================
+#
+#
+# Author: liumin.423
+# Date:   2025/7/10
+# =====================
+import os
+import uuid
+from typing import Optional
+
+import pandas as pd
+from loguru import logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = feather = None
+
+
+# 表格文件的列式副本：Arrow IPC（Feather v2）文件、不压缩，可直接内存映射读取
+TABULAR_EXTENSIONS = ("csv", "xlsx", "xls")
+COLUMNAR_SUFFIX = ".arrow"
+
+
+def file_extension(file_name: str) -> str:
+    return file_name.rsplit(".", 1)[-1].lower() if "." in file_name else ""
+
+
+def columnar_enabled() -> bool:
+    return feather is not None and os.getenv("FILE_COLUMNAR", "true") == "true"
+
+
+def read_table(file_path: str, ext: str, nrows: Optional[int] = None) -> pd.DataFrame:
+    """按扩展名读取表格文件，excel 只读第一个工作表；nrows 限制读取的行数"""
+    if ext == "csv":
+        return pd.read_csv(file_path, nrows=nrows)
+    return pd.read_excel(file_path, nrows=nrows)
+
+
+def _to_arrow(df: pd.DataFrame):
+    df.columns = [str(c) for c in df.columns]
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # 混合类型的 object 列（如数字与文本混排）转为字符串列
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].astype("string")
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def build_columnar(src_path: str, dst_path: str, ext: str) -> bool:
+    """整表解析一次并原子写入列式副本；未安装 pyarrow 或文件超过 FILE_COLUMNAR_MAX_SIZE 时跳过"""
+    if not columnar_enabled() or ext not in TABULAR_EXTENSIONS or os.path.exists(dst_path):
+        return False
+    if os.path.getsize(src_path) > int(os.getenv("FILE_COLUMNAR_MAX_SIZE", 100 * 1024 * 1024)):
+        return False
+    table = _to_arrow(read_table(src_path, ext))
+    tmp_path = f"{dst_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        # 副本会被链接到代码执行的工作目录，设为只读
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, dst_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+
+def read_head(file_path: str, ext: str, nrows: int) -> pd.DataFrame:
+    """读取表格前 nrows 行：有列式副本时内存映射读取，否则只解析前 nrows 行"""
+    columnar_path = file_path + COLUMNAR_SUFFIX
+    if feather is not None and os.path.exists(columnar_path):
+        try:
+            return feather.read_table(columnar_path, memory_map=True).slice(0, nrows).to_pandas()
+        except Exception as e:
+            logger.warning(f"read columnar {columnar_path} failed: {e}")
+    return read_table(file_path, ext, nrows=nrows)
+
+
+def table_abstract(file_path: str, ext: str, nrows: int = 10) -> str:
+    with pd.option_context("display.max_columns", None):
+        return f"{read_head(file_path, ext, nrows)}"
@@ -12,9 +12,9 @@ from pathlib import Path
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI
-from loguru import logger
 from starlette.middleware.cors import CORSMiddleware
 
+from genie_tool.util.log_util import setup_logging
 from genie_tool.util.middleware_util import UnknownException, HTTPProcessTimeMiddleware
 
 # 按优先级加载环境变量：.env.local > .env
@@ -29,14 +29,37 @@ def print_logo():
 
 
 def log_setting():
-    log_path = os.getenv("LOG_PATH", Path(__file__).resolve().parent / "logs" / "server.log")
-    log_format = "{time:YYYY-MM-DD HH:mm:ss.SSS} {level} {module}.{function} {message}"
-    logger.add(log_path, format=log_format, rotation="200 MB")
+    setup_logging(os.getenv("LOG_PATH", Path(__file__).resolve().parent / "logs" / "server.log"))
+
+
+async def start_file_gc():
+    from genie_tool.db.file_retention_op import FileRetention
+    FileRetention.start()
+
+
+async def stop_file_gc():
+    from genie_tool.db.file_retention_op import FileRetention
+    await FileRetention.stop()
+
+
+def start_executor_pool():
+    from genie_tool.tool.code_interpreter import CI_AUTHORIZED_IMPORTS
+    from genie_tool.tool.executor_pool import get_executor_pool
+    if pool := get_executor_pool(CI_AUTHORIZED_IMPORTS):
+        pool.start()
+
+
+def stop_executor_pool():
+    from genie_tool.tool.code_interpreter import CI_AUTHORIZED_IMPORTS
+    from genie_tool.tool.executor_pool import get_executor_pool
+    if pool := get_executor_pool(CI_AUTHORIZED_IMPORTS):
+        pool.shutdown()
 
 
 def create_app() -> FastAPI:
     _app = FastAPI(
-        on_startup=[log_setting, print_logo]
+        on_startup=[log_setting, print_logo, start_file_gc, start_executor_pool],
+        on_shutdown=[stop_file_gc, stop_executor_pool],
     )
 
     register_middleware(_app)
@@ -59,6 +59,7 @@ from com.jd.genie.controller.StartupAgentsController import router as startup_ag
 from com.jd.genie.controller.ChatSessionController import router as chat_session_router
 from com.jd.genie.config.GenieConfig import GenieConfig
 from com.jd.genie.util.SseUtil import setup_sse
+from com.jd.genie.util.LogUtil import LogUtil
 
 
 @asynccontextmanager
@@ -80,6 +81,8 @@ async def lifespan(app: FastAPI):
 
 def create_app() -> FastAPI:
     """创建FastAPI应用"""
+    LogUtil.setup_logging()
+
     app = FastAPI(
         title="JoyAgent-Core",
         description="创业星球多智能体系统核心服务 - Python版本",
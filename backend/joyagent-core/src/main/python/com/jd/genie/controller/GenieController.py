@@ -27,6 +27,7 @@ from com.jd.genie.agent.agent.AgentContext import AgentContext
 from com.jd.genie.agent.printer.SSEPrinter import SSEPrinter
 from com.jd.genie.agent.util.DateUtil import DateUtil
 from com.jd.genie.util.SseEmitterUTF8 import SseEmitterUTF8
+from com.jd.genie.util.LogUtil import LogUtil
 
 
 router = APIRouter()
@@ -164,7 +165,8 @@ controller = GenieController()
 @router.post("/AutoAgent")
 async def auto_agent(request: AgentRequest):
     """执行智能体调度"""
-    logger.info(f"{request.request_id} auto agent request: {request.dict()}")
+    if (body := LogUtil.loggable(request.dict())) is not None:
+        logger.info(f"{request.request_id} auto agent request: {body}")
     
     # 处理输出样式
     request.query = controller.handle_output_style(request)
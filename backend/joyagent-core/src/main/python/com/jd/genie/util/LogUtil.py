@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志工具类
+与 genie-tool / genie-client 使用相同的环境变量：
+LOG_LEVEL、LOG_LEVELS（按模块设置级别）、LOG_PATH、LOG_JSON、LOG_BODY_MAX_SIZE、LOG_BODY_SAMPLE_RATE
+"""
+
+import os
+import random
+import sys
+from typing import Any, Optional
+
+from loguru import logger
+
+LOG_FORMAT = "{time:YYYY-MM-DD HH:mm:ss.SSS} {level} {module}.{function} {message}"
+
+
+class LogUtil:
+    """日志工具类"""
+
+    @staticmethod
+    def setup_logging():
+        """初始化日志：所有 sink 以 enqueue 方式在后台线程写入，不阻塞事件循环"""
+        level = os.getenv("LOG_LEVEL", "INFO").upper()
+        module_levels = {"": level}
+        for item in os.getenv("LOG_LEVELS", "").split(","):
+            if "=" in item:
+                module, module_level = item.split("=", 1)
+                module_levels[module.strip()] = module_level.strip().upper()
+        # sink 级别取最低配置，低于该级别的日志在调用处直接丢弃
+        min_level = min(module_levels.values(), key=lambda name: logger.level(name).no)
+
+        logger.remove()
+        # 与 genie-tool 不共享代码，直接使用 loguru 内置的 enqueue 后台写入与按文件大小（字节）轮转
+        logger.add(sys.stderr, format=LOG_FORMAT, level=min_level, filter=module_levels, enqueue=True)
+        log_path = os.getenv("LOG_PATH")
+        if log_path:
+            logger.add(log_path, format=LOG_FORMAT, level=min_level, filter=module_levels, enqueue=True,
+                       rotation=os.getenv("LOG_ROTATION", "200 MB"),
+                       serialize=os.getenv("LOG_JSON", "false") == "true")
+
+    @staticmethod
+    def loggable(value: Any) -> Optional[str]:
+        """按采样率与最大长度处理要记录的请求体，未被采样时返回 None"""
+        sample_rate = float(os.getenv("LOG_BODY_SAMPLE_RATE", "1"))
+        if sample_rate < 1 and random.random() >= sample_rate:
+            return None
+        max_size = int(os.getenv("LOG_BODY_MAX_SIZE", "2048"))
+        text = value if isinstance(value, str) else str(value)
+        if len(text) > max_size:
+            return f"{text[:max_size]}...(total {len(text)} chars)"
+        return text